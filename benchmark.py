@@ -0,0 +1,216 @@
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db_pool import get_pool
+from model_client import MODEL_MODE, configure_genai, get_model
+from example_bank import FEW_SHOT_MODE
+from nl2sql import build_sql_prompt, database, model_name
+from query import queries
+
+# Float values are compared after rounding so 1.0/3 and 0.333333 match
+FLOAT_DIGITS = 6
+
+
+## Function to build a SQL generator backed by the model (live, recorded or replayed)
+def model_generator(model, mode=FEW_SHOT_MODE, model_mode=MODEL_MODE):
+    configure_genai(model_mode)
+    gemini = get_model(model, mode=model_mode)
+
+    def generate(question):
+        sql_prompt, _ = build_sql_prompt(question, mode)
+        return gemini.generate_content([sql_prompt, question]).text
+
+    return generate
+
+
+## Function to normalize a result set so equivalent results compare equal
+def normalize_rows(rows, ordered):
+    normalized = [
+        tuple(
+            round(value, FLOAT_DIGITS) if isinstance(value, float) else value
+            for value in row
+        )
+        for row in rows
+    ]
+    if ordered:
+        return normalized
+    return sorted(normalized, key=repr)
+
+
+## Function to check if the gold query fixes the order of its rows
+def is_ordered(sql):
+    return "order by" in " ".join(sql.lower().split())
+
+
+## Function to execute a query and time it, returning rows or the error message
+def timed_query(db, sql):
+    start = time.perf_counter()
+    try:
+        with get_pool(db).connection() as conn:
+            # Uncapped, unlike the apps: results that only differ past
+            # MAX_RESULT_ROWS must not compare equal
+            rows = conn.execute(sql).fetchall()
+        return rows, None, time.perf_counter() - start
+    except sqlite3.Error as e:
+        return None, str(e), time.perf_counter() - start
+
+
+## Function to run one benchmark case through generation, execution and comparison
+def run_case(case, generate, db):
+    outcome = {"question": case["description"], "gold_sql": case["query"].strip()}
+    start = time.perf_counter()
+    try:
+        generated_sql = generate(case["description"])
+    except Exception as e:
+        outcome.update(
+            generation_seconds=time.perf_counter() - start,
+            generated_sql=None,
+            error=f"Generation failed: {e}",
+            correct=False,
+        )
+        return outcome
+    outcome["generation_seconds"] = time.perf_counter() - start
+    outcome["generated_sql"] = generated_sql
+
+    gold_rows, gold_error, outcome["gold_seconds"] = timed_query(db, case["query"])
+    rows, error, outcome["execution_seconds"] = timed_query(db, generated_sql)
+    if gold_error:
+        outcome["error"] = f"Gold query failed: {gold_error}"
+        outcome["correct"] = False
+    elif error:
+        outcome["error"] = f"Generated query failed: {error}"
+        outcome["correct"] = False
+    else:
+        ordered = is_ordered(case["query"])
+        outcome["correct"] = normalize_rows(rows, ordered) == normalize_rows(
+            gold_rows, ordered
+        )
+    outcome["total_seconds"] = time.perf_counter() - start
+    return outcome
+
+
+## Function to compute a percentile of a list of durations
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+## Function to summarise accuracy and per-stage latency percentiles
+def summarize(outcomes, wall_seconds):
+    summary = {
+        "cases": len(outcomes),
+        "correct": sum(1 for outcome in outcomes if outcome["correct"]),
+        "wall_seconds": wall_seconds,
+        "stages": {},
+    }
+    summary["accuracy"] = summary["correct"] / len(outcomes) if outcomes else 0.0
+    for stage in ("generation", "gold", "execution", "total"):
+        values = [
+            outcome[f"{stage}_seconds"]
+            for outcome in outcomes
+            if f"{stage}_seconds" in outcome
+        ]
+        summary["stages"][stage] = {
+            "p50": percentile(values, 0.50),
+            "p90": percentile(values, 0.90),
+            "p95": percentile(values, 0.95),
+            "max": max(values) if values else None,
+        }
+    return summary
+
+
+## Function to run every case of the question bank, optionally several times over
+def run_benchmark(generate, db=database, workers=4, repeat=1):
+    cases = queries * repeat
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(lambda case: run_case(case, generate, db), cases))
+    return outcomes, summarize(outcomes, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark NL-to-SQL accuracy and latency on the query.py question bank"
+    )
+    parser.add_argument("--db", default=database)
+    parser.add_argument("--model", default=model_name)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument(
+        "--model-mode",
+        choices=["live", "record", "replay"],
+        default=MODEL_MODE,
+        help="call the model, record its responses or replay them (see MODEL_MODE)",
+    )
+    parser.add_argument(
+        "--prompt",
+        choices=["static", "retrieval"],
+        default=FEW_SHOT_MODE,
+        help="send the static examples or the ones retrieved from the example bank",
+    )
+    parser.add_argument("--output", metavar="PATH", help="write results as JSON")
+    parser.add_argument(
+        "--min-accuracy",
+        type=float,
+        default=0.0,
+        help="exit with an error when execution accuracy is lower",
+    )
+    parser.add_argument(
+        "--max-p95",
+        type=float,
+        help="exit with an error when the p95 total latency in seconds is higher",
+    )
+    args = parser.parse_args()
+
+    generate = model_generator(args.model, args.prompt, args.model_mode)
+
+    outcomes, summary = run_benchmark(
+        generate, db=args.db, workers=args.workers, repeat=args.repeat
+    )
+
+    for outcome in outcomes:
+        status = "PASS" if outcome["correct"] else "FAIL"
+        print(f"[{status}] {outcome['question']}")
+        if "error" in outcome:
+            print(f"       {outcome['error']}")
+    print(
+        f"\nExecution accuracy: {summary['correct']}/{summary['cases']} "
+        f"({summary['accuracy']:.0%}) in {summary['wall_seconds']:.2f}s "
+        f"with {args.workers} workers"
+    )
+    prompt_reports = [
+        build_sql_prompt(case["description"], args.prompt)[1] for case in queries
+    ]
+    print(
+        f"{args.prompt.capitalize()} prompt: "
+        f"{sum(r['tokens'] for r in prompt_reports) / len(prompt_reports):.0f} tokens "
+        f"on average, max {max(r['tokens'] for r in prompt_reports)}"
+    )
+    for stage, stats in summary["stages"].items():
+        if stats["p50"] is not None:
+            print(
+                f"{stage:>10}: p50 {stats['p50'] * 1000:.1f} ms, "
+                f"p90 {stats['p90'] * 1000:.1f} ms, p95 {stats['p95'] * 1000:.1f} ms, "
+                f"max {stats['max'] * 1000:.1f} ms"
+            )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"summary": summary, "outcomes": outcomes}, file, indent=2)
+
+    failed = summary["accuracy"] < args.min_accuracy
+    p95 = summary["stages"]["total"]["p95"]
+    if args.max_p95 is not None and p95 is not None and p95 > args.max_p95:
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
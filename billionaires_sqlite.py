@@ -1,16 +1,24 @@
+import argparse
+import hashlib
 import sqlite3
+import time
+
 import pandas as pd
 
+from rollups import drop_rollup_triggers, ensure_rollups, rebuild_rollups
+
 # Load data from CSV files
 billionaires_csv_file = "cleaned_billionaires_data.csv"
 
-# Load data into DataFrames
-df_billionaires = pd.read_csv(billionaires_csv_file)
-
-
 # Set the database name
 database = "data.db"
 
+# Number of CSV rows read and inserted per batch in bulk mode
+chunk_size = 50000
+
+# Number of rows inserted per transaction in bulk mode
+commit_rows = 500000
+
 # Select only the columns that match your SQLite table for billionaires
 columns_to_insert_billionaires = [
     "rank",
@@ -29,14 +37,6 @@ columns_to_insert_billionaires = [
     "birth_year",
 ]
 
-filtered_df_billionaires = df_billionaires[columns_to_insert_billionaires]
-
-# Connect to SQLite
-connection = sqlite3.connect(database)
-
-# Create a cursor object to interact with the database
-cursor = connection.cursor()
-
 # Create the BILLIONAIRES_DATA table if it doesn't exist already
 table_info_billionaires = """
 CREATE TABLE IF NOT EXISTS BILLIONAIRES_DATA (
@@ -56,38 +56,305 @@ CREATE TABLE IF NOT EXISTS BILLIONAIRES_DATA (
     birth_year INTEGER
 );
 """
-cursor.execute(table_info_billionaires)
-
 
-# Insert data into BILLIONAIRES_DATA table
-for _, row in filtered_df_billionaires.iterrows():
-    cursor.execute(
-        """
+insert_billionaires = """
     INSERT INTO BILLIONAIRES_DATA (
         rank, category, person_name, country, city, source, industries,
         country_of_citizenship, organization, self_made, status, gender,
      title, birth_year
     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-    """,
-        tuple(row),
+    """
+
+# Side table used by sync mode to track each loaded row's identity and content
+table_info_sync = """
+CREATE TABLE IF NOT EXISTS BILLIONAIRES_SYNC (
+    row_key TEXT PRIMARY KEY,
+    row_hash TEXT NOT NULL,
+    data_rowid INTEGER NOT NULL
+);
+"""
+
+insert_billionaires_with_rowid = """
+    INSERT INTO BILLIONAIRES_DATA (
+        rowid, rank, category, person_name, country, city, source, industries,
+        country_of_citizenship, organization, self_made, status, gender,
+     title, birth_year
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+    """
+
+update_billionaires = """
+    UPDATE BILLIONAIRES_DATA SET
+        rank = ?, category = ?, person_name = ?, country = ?, city = ?,
+        source = ?, industries = ?, country_of_citizenship = ?,
+        organization = ?, self_made = ?, status = ?, gender = ?, title = ?,
+        birth_year = ?
+    WHERE rowid = ?;
+    """
+
+# Indexes for the columns the generated queries filter, group and sort on.
+# Bulk mode drops them before loading and builds them once afterwards.
+billionaires_indexes = {
+    "IX_BILLIONAIRES_RANK": "rank",
+    "IX_BILLIONAIRES_COUNTRY": "country",
+    "IX_BILLIONAIRES_INDUSTRIES": "industries",
+}
+
+
+## Function to insert the CSV one row at a time (original loader)
+def load_rows(cursor, csv_file):
+    # Load data into DataFrames
+    df_billionaires = pd.read_csv(csv_file)
+    filtered_df_billionaires = df_billionaires[columns_to_insert_billionaires]
+
+    # Insert data into BILLIONAIRES_DATA table
+    for _, row in filtered_df_billionaires.iterrows():
+        cursor.execute(insert_billionaires, tuple(row))
+    return len(filtered_df_billionaires)
+
+
+## Function to turn a DataFrame chunk into plain Python tuples with NULLs for NaN
+def chunk_to_tuples(chunk):
+    chunk = chunk[columns_to_insert_billionaires].astype(object)
+    chunk = chunk.where(chunk.notna(), None)
+    return list(chunk.itertuples(index=False, name=None))
+
+
+## Function to stream the CSV in chunks and insert them with executemany
+def load_bulk(connection, csv_file, chunksize=chunk_size, commit_every=commit_rows):
+    cursor = connection.cursor()
+    # Fast-load settings: the load is rerunnable, so durability is not needed
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA journal_mode=MEMORY")
+    drop_indexes(cursor)
+    # Maintaining the rollup row by row would slow the load; rebuild it after
+    drop_rollup_triggers(cursor)
+
+    total_rows = 0
+    uncommitted_rows = 0
+    for chunk in pd.read_csv(
+        csv_file, usecols=columns_to_insert_billionaires, chunksize=chunksize
+    ):
+        rows = chunk_to_tuples(chunk)
+        cursor.executemany(insert_billionaires, rows)
+        total_rows += len(rows)
+        uncommitted_rows += len(rows)
+        if uncommitted_rows >= commit_every:
+            connection.commit()
+            uncommitted_rows = 0
+    connection.commit()
+
+    create_indexes(cursor)
+    rebuild_rollups(cursor)
+    connection.commit()
+
+    # Restore the settings used while the apps are reading the database
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    return total_rows
+
+
+## Function to build the identity of a row; repeats of the same person get a suffix
+def row_key(row, seen_counts):
+    person_name = row[columns_to_insert_billionaires.index("person_name")]
+    birth_year = row[columns_to_insert_billionaires.index("birth_year")]
+    if isinstance(birth_year, float) and birth_year.is_integer():
+        birth_year = int(birth_year)
+    key = f"{person_name}|{birth_year}"
+    occurrence = seen_counts.get(key, 0)
+    seen_counts[key] = occurrence + 1
+    return key if occurrence == 0 else f"{key}|{occurrence}"
+
+
+## Function to hash the content of a row so unchanged rows can be skipped
+def row_hash(row):
+    # 1950.0 and 1950 are stored identically, so they must hash identically
+    # even when a NaN elsewhere in the chunk turns the column into floats
+    values = tuple(
+        int(value) if isinstance(value, float) and value.is_integer() else value
+        for value in row
+    )
+    return hashlib.sha1(repr(values).encode("utf-8")).hexdigest()
+
+
+## Function to get the data generation number that caches can key on
+def data_generation(cursor):
+    return cursor.execute("PRAGMA user_version").fetchone()[0]
+
+
+## Function to check each tracked row still sits at the rowid the side table recorded
+# VACUUM may renumber the rowids of a table without an INTEGER PRIMARY KEY; the
+# rows keep their order, so a renumbered table fails this check almost surely
+def tracked_rows_in_place(cursor):
+    for key, person_name, birth_year in cursor.execute(
+        "SELECT s.row_key, d.person_name, d.birth_year FROM BILLIONAIRES_SYNC AS s "
+        "LEFT JOIN BILLIONAIRES_DATA AS d ON d.rowid = s.data_rowid"
+    ):
+        identity = f"{person_name}|{birth_year}"
+        if key != identity and not key.startswith(identity + "|"):
+            return False
+    return True
+
+
+## Function to apply the CSV as inserts, updates and deletes in one transaction
+def sync_billionaires(connection, csv_file, chunksize=chunk_size):
+    cursor = connection.cursor()
+    cursor.execute(table_info_sync)
+    connection.commit()
+
+    existing = {
+        key: (content_hash, rowid)
+        for key, content_hash, rowid in cursor.execute(
+            "SELECT row_key, row_hash, data_rowid FROM BILLIONAIRES_SYNC"
+        )
+    }
+    summary = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+
+    # Everything below runs in a single transaction committed at the end
+    base_rows = cursor.execute("SELECT COUNT(*) FROM BILLIONAIRES_DATA").fetchone()[0]
+    if base_rows != len(existing) or not tracked_rows_in_place(cursor):
+        # Rows loaded by append-only runs are not tracked, and a VACUUM may
+        # have renumbered the tracked rowids, so start from a clean table once
+        # and track everything from here on
+        cursor.execute("DELETE FROM BILLIONAIRES_DATA")
+        cursor.execute("DELETE FROM BILLIONAIRES_SYNC")
+        summary["deleted"] += base_rows
+        existing = {}
+    next_rowid = (
+        cursor.execute("SELECT IFNULL(MAX(rowid), 0) FROM BILLIONAIRES_DATA").fetchone()[0]
+        + 1
+    )
+
+    seen_counts = {}
+    seen_keys = set()
+    for chunk in pd.read_csv(
+        csv_file, usecols=columns_to_insert_billionaires, chunksize=chunksize
+    ):
+        inserts = []
+        updates = []
+        sync_rows = []
+        for row in chunk_to_tuples(chunk):
+            key = row_key(row, seen_counts)
+            seen_keys.add(key)
+            content_hash = row_hash(row)
+            current = existing.get(key)
+            if current is None:
+                inserts.append((next_rowid,) + row)
+                sync_rows.append((key, content_hash, next_rowid))
+                next_rowid += 1
+            elif current[0] != content_hash:
+                updates.append(row + (current[1],))
+                sync_rows.append((key, content_hash, current[1]))
+            else:
+                summary["unchanged"] += 1
+        cursor.executemany(insert_billionaires_with_rowid, inserts)
+        cursor.executemany(update_billionaires, updates)
+        cursor.executemany(
+            "INSERT OR REPLACE INTO BILLIONAIRES_SYNC (row_key, row_hash, data_rowid) "
+            "VALUES (?, ?, ?)",
+            sync_rows,
+        )
+        summary["inserted"] += len(inserts)
+        summary["updated"] += len(updates)
+
+    vanished = [key for key in existing if key not in seen_keys]
+    cursor.executemany(
+        "DELETE FROM BILLIONAIRES_DATA WHERE rowid = ?",
+        [(existing[key][1],) for key in vanished],
     )
+    cursor.executemany(
+        "DELETE FROM BILLIONAIRES_SYNC WHERE row_key = ?", [(key,) for key in vanished]
+    )
+    summary["deleted"] += len(vanished)
+
+    if summary["inserted"] or summary["updated"] or summary["deleted"]:
+        cursor.execute(f"PRAGMA user_version = {data_generation(cursor) + 1}")
+    connection.commit()
+
+    create_indexes(cursor)
+    connection.commit()
+    summary["generation"] = data_generation(cursor)
+    return summary
+
 
+## Function to drop the secondary indexes before a bulk load
+def drop_indexes(cursor):
+    for index_name in billionaires_indexes:
+        cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
 
-# Display the first 5 records inserted from BILLIONAIRES_DATA
-data_billionaires = cursor.execute("""SELECT * FROM BILLIONAIRES_DATA LIMIT 5""")
-print("\nThe first 5 inserted records from BILLIONAIRES_DATA are:")
-for row in data_billionaires:
-    print(row)
 
+## Function to build the secondary indexes after the data is loaded
+def create_indexes(cursor):
+    for index_name, column in billionaires_indexes.items():
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name} ON BILLIONAIRES_DATA ({column})"
+        )
+    cursor.execute("ANALYZE BILLIONAIRES_DATA")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load the billionaires CSV into SQLite"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["sync", "bulk", "rows"],
+        default="sync",
+        help="sync applies only the changes in the CSV; bulk streams the CSV in "
+        "chunks and appends it; rows appends one row at a time",
+    )
+    parser.add_argument("--csv", default=billionaires_csv_file)
+    parser.add_argument("--db", default=database)
+    parser.add_argument("--chunksize", type=int, default=chunk_size)
+    args = parser.parse_args()
+
+    # Connect to SQLite
+    connection = sqlite3.connect(args.db)
+
+    # Create a cursor object to interact with the database
+    cursor = connection.cursor()
+    cursor.execute(table_info_billionaires)
+    # Summary tables answering the common aggregate questions; triggers keep
+    # them current through every insert, update and delete that follows
+    ensure_rollups(cursor)
+    connection.commit()
+
+    start = time.perf_counter()
+    if args.mode == "sync":
+        summary = sync_billionaires(connection, args.csv, chunksize=args.chunksize)
+        loaded_rows = summary["inserted"] + summary["updated"] + summary["unchanged"]
+        print(
+            f"Sync summary: {summary['inserted']} inserted, {summary['updated']} updated, "
+            f"{summary['deleted']} deleted, {summary['unchanged']} unchanged "
+            f"(data generation {summary['generation']})"
+        )
+    elif args.mode == "bulk":
+        loaded_rows = load_bulk(connection, args.csv, chunksize=args.chunksize)
+    else:
+        loaded_rows = load_rows(cursor, args.csv)
+        connection.commit()
+    elapsed = time.perf_counter() - start
+    rate = loaded_rows / elapsed if elapsed else float("inf")
+    print(
+        f"Loaded {loaded_rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec, mode={args.mode})"
+    )
+
+    # Display the first 5 records inserted from BILLIONAIRES_DATA
+    data_billionaires = cursor.execute("""SELECT * FROM BILLIONAIRES_DATA LIMIT 5""")
+    print("\nThe first 5 inserted records from BILLIONAIRES_DATA are:")
+    for row in data_billionaires:
+        print(row)
+
+    # Count the total number of records inserted into BILLIONAIRES_DATA
+    cursor.execute("""SELECT COUNT(*) FROM BILLIONAIRES_DATA""")
+    total_records_billionaires = cursor.fetchone()[0]
+    print(
+        f"Total number of records inserted into BILLIONAIRES_DATA table: {total_records_billionaires}"
+    )
 
-# Count the total number of records inserted into BILLIONAIRES_DATA
-cursor.execute("""SELECT COUNT(*) FROM BILLIONAIRES_DATA""")
-total_records_billionaires = cursor.fetchone()[0]
-print(
-    f"Total number of records inserted into BILLIONAIRES_DATA table: {total_records_billionaires}"
-)
+    # Commit your changes to the database and close the connection
+    connection.commit()
+    connection.close()
 
 
-# Commit your changes to the database and close the connection
-connection.commit()
-connection.close()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import os
+import shutil
+import threading
+import time
+
+from result_cache import estimate_size
+
+# Directory holding one sub-directory of spilled function-call details per session
+HISTORY_DIR = os.getenv("CHAT_HISTORY_DIR", "chat_history")
+
+# Memory a session's history may hold before older details move to disk
+HISTORY_MEMORY_BUDGET = int(os.getenv("CHAT_HISTORY_MEMORY_BUDGET", 256 * 1024))
+
+# Details larger than this go to disk straight away
+MAX_INLINE_DETAILS = int(os.getenv("CHAT_HISTORY_MAX_INLINE_DETAILS", 16 * 1024))
+
+# Session directories untouched for this many seconds are removed
+HISTORY_TTL = int(os.getenv("CHAT_HISTORY_TTL", 24 * 60 * 60))
+
+_cleanup_lock = threading.Lock()
+
+
+## Function to remove the spilled details of sessions that have gone idle
+def remove_stale_sessions(root=HISTORY_DIR, ttl=HISTORY_TTL):
+    if not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - ttl
+    removed = 0
+    with _cleanup_lock:
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+    return removed
+
+
+class ChatHistory:
+    def __init__(
+        self,
+        session_id,
+        root=HISTORY_DIR,
+        memory_budget=HISTORY_MEMORY_BUDGET,
+        max_inline=MAX_INLINE_DETAILS,
+    ):
+        self.session_id = session_id
+        self.directory = os.path.join(root, session_id)
+        self.memory_budget = memory_budget
+        self.max_inline = max_inline
+        self.messages = []
+        self._details = {}
+        self._spilled_bytes = 0
+        self._render_seconds = []
+        # IDs keep counting after a clear so old widget keys are never reused
+        self._next_id = 0
+
+    ## Add a message; its function-call details are kept by ID, not in the message
+    def append(self, role, content, details=None):
+        message = {"id": self._next_id, "role": role, "content": content}
+        self._next_id += 1
+        if details:
+            message["has_details"] = True
+            self._details[message["id"]] = details
+            if len(details) > self.max_inline:
+                self._spill(message["id"])
+        self.messages.append(message)
+        self._enforce_budget()
+        return message
+
+    ## Return the details of a message, reading them back from disk if spilled
+    def details(self, message):
+        if not message.get("has_details"):
+            return None
+        details = self._details.get(message["id"])
+        if details is not None:
+            return details
+        try:
+            with open(self._path(message["id"]), encoding="utf-8") as file:
+                return file.read()
+        except FileNotFoundError:
+            return "_These details have expired._"
+
+    def record_render(self, seconds):
+        self._render_seconds.append(seconds)
+        del self._render_seconds[:-20]
+
+    def stats(self):
+        memory = estimate_size(self.messages) + sum(
+            estimate_size(details) for details in self._details.values()
+        )
+        recent = self._render_seconds
+        with_details = sum(1 for m in self.messages if m.get("has_details"))
+        return {
+            "messages": len(self.messages),
+            "memory_bytes": memory,
+            "inline_details": len(self._details),
+            "spilled_details": with_details - len(self._details),
+            "disk_bytes": self._spilled_bytes,
+            "last_render": recent[-1] if recent else None,
+            "mean_render": sum(recent) / len(recent) if recent else None,
+        }
+
+    ## Remove this session's spilled details
+    def clear(self):
+        self.messages = []
+        self._details = {}
+        self._spilled_bytes = 0
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _path(self, message_id):
+        return os.path.join(self.directory, f"{message_id}.md")
+
+    def _spill(self, message_id):
+        details = self._details.pop(message_id)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(message_id), "w", encoding="utf-8") as file:
+            file.write(details)
+        self._spilled_bytes += len(details.encode("utf-8"))
+
+    # Oldest details go to disk first, since they are the least likely to be opened
+    def _enforce_budget(self):
+        used = sum(estimate_size(details) for details in self._details.values())
+        for message_id in sorted(self._details):
+            if used <= self.memory_budget:
+                break
+            used -= estimate_size(self._details[message_id])
+            self._spill(message_id)
@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import statistics
+import time
+
+from jsonl_log import append_jsonl
+
+# JSONL file receiving one entry per chat question; empty disables logging
+CHAT_LOG = os.getenv("CHAT_LOG", "chat_log.jsonl")
+
+
+## Function to append the round trips and latency of one chat question to the log
+def log_chat_turn(
+    mode, question, round_trips, function_calls, seconds, tables=None, path=None
+):
+    path = CHAT_LOG if path is None else path
+    if not path:
+        return
+    entry = {
+        "time": time.time(),
+        "mode": mode,
+        "question": question,
+        "round_trips": round_trips,
+        "function_calls": function_calls,
+        "seconds": seconds,
+        "planned_tables": tables or [],
+    }
+    append_jsonl(path, entry)
+
+
+## Function to read the logged chat questions
+def read_chat_log(path=None):
+    path = CHAT_LOG if path is None else path
+    if not path or not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+## Function to summarise round trips and latency for each chat mode
+def summarize_modes(entries):
+    by_mode = {}
+    for entry in entries:
+        by_mode.setdefault(entry["mode"], []).append(entry)
+    summary = {}
+    for mode, mode_entries in sorted(by_mode.items()):
+        seconds = sorted(entry["seconds"] for entry in mode_entries)
+        round_trips = [entry["round_trips"] for entry in mode_entries]
+        summary[mode] = {
+            "questions": len(mode_entries),
+            "round_trips": statistics.mean(round_trips),
+            "max_round_trips": max(round_trips),
+            "p50": statistics.median(seconds),
+            "p95": seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))],
+            "schema_calls": sum(
+                1
+                for entry in mode_entries
+                for name in entry["function_calls"]
+                if name in ("list_tables", "get_table")
+            )
+            / len(mode_entries),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare round trips and latency of the Chinook chat modes"
+    )
+    parser.add_argument("--log", default=CHAT_LOG)
+    args = parser.parse_args()
+
+    summary = summarize_modes(read_chat_log(args.log))
+    if not summary:
+        print(f"No chat questions logged in {args.log}")
+        return
+    for mode, stats in summary.items():
+        print(
+            f"{mode:>10}: {stats['questions']} questions, "
+            f"{stats['round_trips']:.1f} round trips on average "
+            f"(max {stats['max_round_trips']}), "
+            f"{stats['schema_calls']:.1f} schema calls, "
+            f"p50 {stats['p50']:.2f} s, p95 {stats['p95']:.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
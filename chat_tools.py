@@ -0,0 +1,93 @@
+# Model settings and function declarations for the Chinook chat
+# (function_calling.py), built once per process through resources.py
+
+import os
+
+# SQLite Database file path
+DB_FILE = "music_store.db"
+
+LOCATION = "us-central1"
+
+CHAT_MODEL = "gemini-1.5-pro"
+
+
+## Function to initialise Vertex AI from the environment
+def init_vertexai():
+    import vertexai
+
+    vertexai.init(project=os.getenv("GOOGLE_PROJECT_ID"), location=LOCATION)
+
+
+## Function to build the Tool holding the functions the chat model may call
+def build_sql_query_tool():
+    from vertexai.generative_models import FunctionDeclaration, Tool
+
+    # Define Function Declarations
+    list_tables_func = FunctionDeclaration(
+        name="list_tables",
+        description="List tables in the SQL database that will help answer the user's question",
+        parameters={
+            "type": "object",
+            "properties": {},
+        },
+    )
+    get_table_func = FunctionDeclaration(
+        name="get_table",
+        description="Get information about a table, including the schema, primary and foreign keys, related tables, sample column values, and number of rows that will help answer the user's question.",
+        parameters={
+            "type": "object",
+            "properties": {
+                "table_name": {
+                    "type": "string",
+                    "description": "Name of the table to get information about",
+                }
+            },
+            "required": [
+                "table_name",
+            ],
+        },
+    )
+
+    sql_query_func = FunctionDeclaration(
+        name="sql_query",
+        description="Execute SQL queries on the database to retrieve information that answers the user's question. Returns the first page of rows, the total row count and, when more rows remain, a next_cursor for fetch_more. Prefer aggregating or limiting in SQL over paging through rows.",
+        parameters={
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "SQL query that will be executed on the database.",
+                }
+            },
+            "required": [
+                "query",
+            ],
+        },
+    )
+
+    fetch_more_func = FunctionDeclaration(
+        name="fetch_more",
+        description="Get the next page of rows of an earlier sql_query result. Only call it when the rows already returned are not enough to answer the user's question.",
+        parameters={
+            "type": "object",
+            "properties": {
+                "cursor": {
+                    "type": "string",
+                    "description": "The next_cursor value returned with the previous page.",
+                }
+            },
+            "required": [
+                "cursor",
+            ],
+        },
+    )
+
+    # Create a Tool for the model
+    return Tool(
+        function_declarations=[
+            list_tables_func,
+            get_table_func,
+            sql_query_func,
+            fetch_more_func,
+        ],
+    )
@@ -1,34 +1,142 @@
+import argparse
+import hashlib
+import json
+import os
+import re
 import sqlite3
+import time
 
 # Path to the SQL file
-sql_file_path = "Chinook_Sqlite.sql"
+sql_file_path = "chinook_sqlite.sql"
 
 # Path to the SQLite database file you want to create (or connect to if it already exists)
 db_file = "music_store.db"
 
-# Connect to SQLite database (it will create the file if it doesn't exist)
-conn = sqlite3.connect(db_file)
-cursor = conn.cursor()
+# Matches a statement that creates an index, ignoring any leading comments
+_create_index = re.compile(
+    r"^\s*(?:(?:/\*.*?\*/|--[^\n]*)\s*)*CREATE\s+(?:UNIQUE\s+)?INDEX\b",
+    re.IGNORECASE | re.DOTALL,
+)
 
 
-# Function to read the SQL file and execute the queries
-def execute_sql_from_file(file_path):
-    with open(file_path, "r") as file:
-        sql_script = file.read()
+## Function to get the path of the file recording which script built the database
+def build_info_path(db_path):
+    return db_path + ".build.json"
 
+
+## Function to compute the checksum of the SQL script without loading it at once
+def file_checksum(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+## Function to check if the database was already built from this exact script
+def is_current(db_path, checksum):
+    if not os.path.exists(db_path):
+        return False
     try:
-        # Execute the SQL script
-        cursor.executescript(sql_script)
-        print(f"Successfully executed SQL script from {file_path}")
-    except sqlite3.Error as e:
-        print(f"An error occurred: {e}")
+        with open(build_info_path(db_path)) as file:
+            build_info = json.load(file)
+    except (OSError, ValueError):
+        return False
+    return build_info.get("sha256") == checksum
+
+
+## Function to read the SQL file one complete statement at a time
+def iter_statements(file_path):
+    statement = ""
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line in file:
+            statement += line
+            if sqlite3.complete_statement(statement):
+                yield statement.strip()
+                statement = ""
+    if statement.strip() and sqlite3.complete_statement(statement + ";"):
+        yield statement.strip()
+
+
+## Function to execute the SQL script into a database, creating indexes last
+def execute_sql_from_file(conn, file_path):
+    cursor = conn.cursor()
+    deferred_indexes = []
+    statements = 0
+
+    # Fast-load settings: the target is a scratch file that is copied into
+    # place only once the whole script has succeeded
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA journal_mode=OFF")
+    cursor.execute("BEGIN")
+    for statement in iter_statements(file_path):
+        if _create_index.match(statement):
+            deferred_indexes.append(statement)
+            continue
+        cursor.execute(statement)
+        statements += 1
+    for statement in deferred_indexes:
+        cursor.execute(statement)
+        statements += 1
+    cursor.execute("COMMIT")
+    cursor.execute("ANALYZE")
+    return statements
+
 
+## Function to build the database, skipping the work when it is already current
+def build_database(file_path, db_path, force=False):
+    checksum = file_checksum(file_path)
+    if not force and is_current(db_path, checksum):
+        print(f"Database {db_path} is already current with {file_path}; skipping build.")
+        return False
 
-# Execute the SQL queries from the file
-execute_sql_from_file(sql_file_path)
+    start = time.perf_counter()
+    scratch_path = db_path + ".building"
+    if os.path.exists(scratch_path):
+        os.remove(scratch_path)
+    scratch = sqlite3.connect(scratch_path, isolation_level=None)
+    try:
+        statements = execute_sql_from_file(scratch, file_path)
+
+        # Copy into place with the backup API so apps that already have the
+        # database open see a consistent switch instead of a replaced file
+        target = sqlite3.connect(db_path)
+        try:
+            scratch.backup(target)
+            target.execute("PRAGMA journal_mode=WAL")
+        finally:
+            target.close()
+    finally:
+        scratch.close()
+        os.remove(scratch_path)
+
+    with open(build_info_path(db_path), "w") as file:
+        json.dump({"source": file_path, "sha256": checksum}, file)
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Successfully executed {statements} statements from {file_path} in {elapsed:.2f}s"
+    )
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create and populate the Chinook SQLite database"
+    )
+    parser.add_argument("--sql", default=sql_file_path)
+    parser.add_argument("--db", default=db_file)
+    parser.add_argument(
+        "--force", action="store_true", help="rebuild even if the database is current"
+    )
+    args = parser.parse_args()
+
+    try:
+        if build_database(args.sql, args.db, force=args.force):
+            print(f"Database {args.db} created and populated.")
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
 
-# Commit the changes and close the connection
-conn.commit()
-conn.close()
 
-print(f"Database {db_file} created and populated.")
+if __name__ == "__main__":
+    main()
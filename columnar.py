@@ -0,0 +1,1047 @@
+import os
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from query_runner import MAX_RESULT_ROWS, QueryResult, infer_column_types
+from result_cache import database_version
+from schema_catalog import quote_identifier
+
+# Tables with more rows than this are never loaded into memory
+COLUMNAR_MAX_ROWS = int(os.getenv("COLUMNAR_MAX_ROWS", 5_000_000))
+
+# Below this size SQLite answers faster than the engine's fixed per-query cost, so
+# the shipped table (about 2.6k rows) stays on SQLite unless this is lowered
+COLUMNAR_MIN_ROWS = int(os.getenv("COLUMNAR_MIN_ROWS", 100_000))
+
+# String columns with at most this share of distinct values are dictionary encoded
+CATEGORY_RATIO = 0.5
+
+
+class Unsupported(Exception):
+    """Raised for SQL the columnar engine does not handle; callers fall back to SQLite."""
+
+
+_token = re.compile(
+    r"\s*(?:"
+    r"(?P<string>'(?:[^']|'')*')"
+    r'|(?P<quoted>"(?:[^"]|"")*"|\[[^\]]*\]|`[^`]*`)'
+    r"|(?P<number>\d+\.\d*(?:[eE][+-]?\d+)?|\.\d+|\d+(?:[eE][+-]?\d+)?)"
+    r"|(?P<word>[A-Za-z_]\w*)"
+    r"|(?P<operator><=|>=|==|!=|<>|\|\||[-+*/%<>=(),.;])"
+    r")"
+)
+_aggregates = {"count", "sum", "total", "avg", "min", "max"}
+_comparisons = {"=", "==", "!=", "<>", "<", "<=", ">", ">="}
+_clause_words = {
+    "from", "where", "group", "having", "order", "limit", "offset", "as",
+    "asc", "desc", "and", "or", "not", "is", "in", "between", "like", "then",
+    "else", "end", "when", "union", "except", "intersect", "join", "on",
+}
+
+
+## Function to split SQL into (kind, text, start, end) tokens
+def tokenize(sql):
+    tokens = []
+    position = 0
+    sql = sql.rstrip().rstrip(";")
+    while position < len(sql):
+        match = _token.match(sql, position)
+        if not match or match.end() == position:
+            raise Unsupported(f"cannot tokenize near {sql[position:position + 20]!r}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        tokens.append((kind, text, match.start(kind), match.end()))
+        position = match.end()
+    return tokens
+
+
+class Parser:
+    def __init__(self, sql):
+        self.sql = sql
+        self.tokens = tokenize(sql)
+        self.position = 0
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        if index < len(self.tokens):
+            kind, text, _, _ = self.tokens[index]
+            return kind, text.lower() if kind == "word" else text
+        return None, None
+
+    def accept(self, *words):
+        kind, text = self.peek()
+        if kind in ("word", "operator") and text in words:
+            self.position += 1
+            return text
+        return None
+
+    def expect(self, *words):
+        text = self.accept(*words)
+        if text is None:
+            raise Unsupported(f"expected {' or '.join(words)} near {self.peek()[1]!r}")
+        return text
+
+    ## SELECT [DISTINCT] items FROM table [WHERE] [GROUP BY] [HAVING] [ORDER BY] [LIMIT]
+    def parse_select(self):
+        self.expect("select")
+        query = {"distinct": bool(self.accept("distinct")), "items": []}
+        self.accept("all")
+        while True:
+            start = self.tokens[self.position][2] if self.position < len(self.tokens) else 0
+            if self.accept("*"):
+                query["items"].append({"node": ("star",), "alias": None, "text": "*"})
+            else:
+                node = self.parse_expression()
+                end = self.tokens[self.position - 1][3]
+                alias = None
+                if self.accept("as"):
+                    alias = self.parse_name()
+                elif self.peek()[0] in ("word", "quoted") and self.peek()[1] not in _clause_words:
+                    alias = self.parse_name()
+                query["items"].append(
+                    {"node": node, "alias": alias, "text": self.sql[start:end].strip()}
+                )
+            if not self.accept(","):
+                break
+
+        self.expect("from")
+        query["table"] = self.parse_name()
+        if self.accept("as") or (
+            self.peek()[0] == "word" and self.peek()[1] not in _clause_words
+        ):
+            query["table_alias"] = self.parse_name()
+        if self.peek()[1] in (",", "join", "inner", "left", "cross", "natural"):
+            raise Unsupported("joins are not supported")
+
+        query["where"] = self.parse_expression() if self.accept("where") else None
+        query["group_by"] = []
+        if self.accept("group"):
+            self.expect("by")
+            query["group_by"] = self.parse_list()
+        query["having"] = self.parse_expression() if self.accept("having") else None
+        query["order_by"] = []
+        if self.accept("order"):
+            self.expect("by")
+            while True:
+                node = self.parse_expression()
+                descending = self.accept("asc", "desc") == "desc"
+                query["order_by"].append((node, descending))
+                if not self.accept(","):
+                    break
+        query["limit"] = None
+        query["offset"] = 0
+        if self.accept("limit"):
+            first = self.parse_integer()
+            if self.accept(","):
+                query["offset"], query["limit"] = first, self.parse_integer()
+            else:
+                query["limit"] = first
+                if self.accept("offset"):
+                    query["offset"] = self.parse_integer()
+        if self.position != len(self.tokens):
+            raise Unsupported(f"unexpected {self.peek()[1]!r}")
+        return query
+
+    def parse_name(self):
+        kind, text = None, None
+        if self.position < len(self.tokens):
+            kind, text, _, _ = self.tokens[self.position]
+        if kind == "word":
+            self.position += 1
+            return text
+        if kind == "quoted":
+            self.position += 1
+            return text[1:-1].replace('""', '"')
+        raise Unsupported(f"expected a name near {text!r}")
+
+    def parse_integer(self):
+        kind, text = self.peek()
+        if kind != "number" or not text.isdigit():
+            raise Unsupported("LIMIT and OFFSET must be integers")
+        self.position += 1
+        return int(text)
+
+    def parse_list(self):
+        nodes = [self.parse_expression()]
+        while self.accept(","):
+            nodes.append(self.parse_expression())
+        return nodes
+
+    def parse_expression(self):
+        node = self.parse_and()
+        while self.accept("or"):
+            node = ("or", node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.accept("and"):
+            node = ("and", node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.accept("not"):
+            return ("not", self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        node = self.parse_additive()
+        while True:
+            kind, text = self.peek()
+            if kind == "operator" and text in _comparisons:
+                self.position += 1
+                operator = {"<>": "!=", "==": "="}.get(text, text)
+                node = ("compare", operator, node, self.parse_additive())
+                continue
+            if self.accept("is"):
+                negated = bool(self.accept("not"))
+                self.expect("null")
+                node = ("isnull", node, negated)
+                continue
+            negated = False
+            if self.peek()[1] == "not" and self.peek(1)[1] in ("in", "between", "like"):
+                self.position += 1
+                negated = True
+            if self.accept("in"):
+                self.expect("(")
+                if self.peek()[1] == "select":
+                    raise Unsupported("subqueries are not supported")
+                values = self.parse_list()
+                self.expect(")")
+                node = ("in", node, values, negated)
+            elif self.accept("between"):
+                low = self.parse_additive()
+                self.expect("and")
+                node = ("between", node, low, self.parse_additive(), negated)
+            elif self.accept("like"):
+                node = ("like", node, self.parse_additive(), negated)
+            else:
+                return node
+
+    def parse_additive(self):
+        node = self.parse_multiplicative()
+        while True:
+            operator = self.accept("+", "-", "||")
+            if operator is None:
+                return node
+            node = ("arith", operator, node, self.parse_multiplicative())
+
+    def parse_multiplicative(self):
+        node = self.parse_unary()
+        while True:
+            operator = self.accept("*", "/", "%")
+            if operator is None:
+                return node
+            node = ("arith", operator, node, self.parse_unary())
+
+    def parse_unary(self):
+        if self.accept("-"):
+            return ("arith", "-", ("literal", 0), self.parse_unary())
+        self.accept("+")
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, text = self.peek()
+        if kind == "number":
+            self.position += 1
+            return ("literal", float(text) if re.search(r"[.eE]", text) else int(text))
+        if kind == "string":
+            self.position += 1
+            return ("literal", text[1:-1].replace("''", "'"))
+        if self.accept("("):
+            if self.peek()[1] == "select":
+                raise Unsupported("subqueries are not supported")
+            node = self.parse_expression()
+            self.expect(")")
+            return node
+        if self.accept("null"):
+            return ("literal", None)
+        if self.accept("case"):
+            return self.parse_case()
+        if kind in ("word", "quoted"):
+            name = self.parse_name()
+            if kind == "word" and self.accept("("):
+                return self.parse_call(name.lower())
+            if self.accept("."):
+                # Qualified column; the single table makes the qualifier redundant
+                name = self.parse_name()
+            elif text.startswith('"'):
+                # A column if the table has one by that name, else a string;
+                # resolved by resolve_quoted once the table is known
+                return ("quoted", name)
+            return ("column", name)
+        raise Unsupported(f"unexpected {text!r}")
+
+    def parse_case(self):
+        operand = None
+        if self.peek()[1] != "when":
+            operand = self.parse_expression()
+        branches = []
+        while self.accept("when"):
+            condition = self.parse_expression()
+            if operand is not None:
+                condition = ("compare", "=", operand, condition)
+            self.expect("then")
+            branches.append((condition, self.parse_expression()))
+        default = self.parse_expression() if self.accept("else") else ("literal", None)
+        self.expect("end")
+        return ("case", branches, default)
+
+    def parse_call(self, name):
+        if name in _aggregates:
+            distinct = bool(self.accept("distinct"))
+            if name == "count" and self.accept("*"):
+                argument = None
+            else:
+                argument = self.parse_expression()
+            if self.peek()[1] == ",":
+                raise Unsupported(f"{name.upper()} with several arguments")
+            self.expect(")")
+            return ("aggregate", name, argument, distinct)
+        arguments = [] if self.peek()[1] == ")" else self.parse_list()
+        self.expect(")")
+        if name not in _functions:
+            raise Unsupported(f"function {name} is not supported")
+        return ("function", name, arguments)
+
+
+## Function to parse a SELECT statement into the engine's query description
+def parse_query(sql):
+    return Parser(sql).parse_select()
+
+
+## Function to check if an expression contains an aggregate
+def has_aggregate(node):
+    if isinstance(node, tuple):
+        return node[:1] == ("aggregate",) or any(has_aggregate(part) for part in node)
+    if isinstance(node, list):
+        return any(has_aggregate(part) for part in node)
+    return False
+
+
+## Function to resolve double-quoted names: SQLite reads one that names no column as a string
+def resolve_quoted(node, names):
+    if isinstance(node, dict):
+        return {key: resolve_quoted(value, names) for key, value in node.items()}
+    if isinstance(node, list):
+        return [resolve_quoted(part, names) for part in node]
+    if not isinstance(node, tuple):
+        return node
+    if node[:1] == ("quoted",):
+        return ("column" if node[1].lower() in names else "literal", node[1])
+    return tuple(resolve_quoted(part, names) for part in node)
+
+
+## Function to turn a (possibly NULL) condition into a plain NumPy filter
+def to_filter(mask, length):
+    if isinstance(mask, pd.Series):
+        return mask.fillna(False).to_numpy(dtype=bool)
+    return np.full(length, mask is True)
+
+
+def _is_null(value):
+    return value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value))
+
+
+def _null_mask(value):
+    if isinstance(value, pd.Series):
+        return value.isna()
+    return _is_null(value)
+
+
+def _is_integer(value):
+    if isinstance(value, pd.Series):
+        return pd.api.types.is_integer_dtype(value.dtype)
+    return isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+
+
+def _plain(value):
+    # Dictionary-encoded strings are ordered and combined as plain strings
+    if isinstance(value, pd.Series) and isinstance(value.dtype, pd.CategoricalDtype):
+        return value.astype(object)
+    return value
+
+
+def _widen(value):
+    # Small integer columns are widened before arithmetic so results cannot overflow
+    if isinstance(value, pd.Series) and pd.api.types.is_integer_dtype(value.dtype):
+        return value.astype("Int64")
+    return value
+
+
+## Function to classify an operand as "numeric", "text", "mixed" or None (NULL)
+def _value_kind(value):
+    if isinstance(value, pd.Series):
+        dtype = value.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            value = value.cat.categories.to_series()
+            dtype = value.dtype
+        if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype):
+            return "numeric"
+        kind = pd.api.types.infer_dtype(value, skipna=True)
+        return "text" if kind in ("string", "empty") else "mixed"
+    if _is_null(value):
+        return None
+    if isinstance(value, str):
+        return "text"
+    if isinstance(value, (bool, int, float, np.number)):
+        return "numeric"
+    return "mixed"
+
+
+## Function to refuse comparisons whose result depends on SQLite's type affinity
+# (rank = '1' converts the text for a numeric column; numbers sort before text)
+def check_comparable(*values):
+    kinds = {_value_kind(value) for value in values} - {None}
+    if "mixed" in kinds or kinds == {"numeric", "text"}:
+        raise Unsupported("comparisons between text and numbers follow SQLite affinity")
+
+
+## Function to compare two operands with SQL NULL semantics
+def compare(operator, left, right):
+    check_comparable(left, right)
+    if not isinstance(left, pd.Series) and not isinstance(right, pd.Series):
+        if _is_null(left) or _is_null(right):
+            return pd.NA
+        return bool(_compare(operator, left, right))
+    if operator not in ("=", "!=") or isinstance(right, pd.Series):
+        # Categoricals only support equality against a scalar
+        left, right = _plain(left), _plain(right)
+    result = _compare(operator, left, right).astype("boolean")
+    nulls = _null_mask(left) | _null_mask(right)
+    if isinstance(nulls, pd.Series):
+        result[nulls.to_numpy(dtype=bool)] = pd.NA
+    elif nulls:
+        result[:] = pd.NA
+    return result
+
+
+def _compare(operator, left, right):
+    if operator == "=":
+        return left == right
+    if operator == "!=":
+        return left != right
+    if operator == "<":
+        return left < right
+    if operator == "<=":
+        return left <= right
+    if operator == ">":
+        return left > right
+    return left >= right
+
+
+## Function to apply an arithmetic operator with SQLite's integer semantics
+def arithmetic(operator, left, right):
+    if operator == "||":
+        if isinstance(left, pd.Series) or isinstance(right, pd.Series):
+            raise Unsupported("|| over columns is not supported")
+        return None if _is_null(left) or _is_null(right) else f"{left}{right}"
+    if _is_null(left) or _is_null(right):
+        return None
+    left, right = _widen(_plain(left)), _widen(_plain(right))
+    integer = _is_integer(left) and _is_integer(right)
+    if operator in ("/", "%"):
+        # Division by zero is NULL in SQLite
+        if isinstance(right, pd.Series):
+            right = right.mask((right == 0).fillna(False).to_numpy(dtype=bool))
+        elif right == 0:
+            return None
+        if not integer:
+            return left / right if operator == "/" else np.fmod(left, right)
+        # SQLite truncates integer division towards zero
+        result = np.trunc(left / right) if operator == "/" else np.fmod(left, right)
+        return result.astype("Int64") if isinstance(result, pd.Series) else int(result)
+    if operator == "+":
+        return left + right
+    if operator == "-":
+        return left - right
+    return left * right
+
+
+## Function to match SQL LIKE (case-insensitive for ASCII) against a value or column
+def like(value, pattern):
+    if not isinstance(pattern, str):
+        raise Unsupported("LIKE patterns must be literals")
+    regex = re.compile(
+        "^"
+        + "".join(
+            ".*" if char == "%" else "." if char == "_" else re.escape(char)
+            for char in pattern
+        )
+        + "$",
+        re.IGNORECASE | re.DOTALL,
+    )
+    if not isinstance(value, pd.Series):
+        return pd.NA if _is_null(value) else bool(regex.match(str(value)))
+    if isinstance(value.dtype, pd.CategoricalDtype):
+        # Match each distinct value once instead of every row
+        matches = np.array(
+            [bool(regex.match(str(category))) for category in value.cat.categories]
+            + [False]
+        )
+        codes = value.cat.codes.to_numpy()
+        result = pd.Series(matches[codes], index=value.index, dtype="boolean")
+    else:
+        result = value.astype(object).map(
+            lambda item: False if _is_null(item) else bool(regex.match(str(item)))
+        ).astype("boolean")
+    result[value.isna().to_numpy()] = pd.NA
+    return result
+
+
+def _coalesce(*values):
+    result = values[-1]
+    for value in reversed(values[:-1]):
+        if isinstance(value, pd.Series):
+            result = _plain(value).where(value.notna(), result)
+        elif not _is_null(value):
+            result = value
+    return result
+
+
+def _nullif(left, right):
+    equal = compare("=", left, right)
+    if not isinstance(equal, pd.Series):
+        return None if equal is True else left
+    if not isinstance(left, pd.Series):
+        raise Unsupported("NULLIF with a constant first argument")
+    return _plain(left).mask(equal.fillna(False).to_numpy(dtype=bool))
+
+
+def _round(value, digits=0):
+    if isinstance(value, pd.Series):
+        return _plain(value).astype("Float64").round(int(digits))
+    return None if _is_null(value) else round(float(value), int(digits))
+
+
+def _abs(value):
+    if isinstance(value, pd.Series):
+        return _widen(value).abs()
+    return None if _is_null(value) else abs(value)
+
+
+def _string_function(method):
+    def apply(value):
+        if isinstance(value, pd.Series):
+            strings = value.astype(object).where(value.notna())
+            return getattr(strings.str, method)()
+        return None if _is_null(value) else getattr(str(value), method)()
+
+    return apply
+
+
+_functions = {
+    "coalesce": _coalesce,
+    "ifnull": _coalesce,
+    "nullif": _nullif,
+    "round": _round,
+    "abs": _abs,
+    "lower": _string_function("lower"),
+    "upper": _string_function("upper"),
+    "length": _string_function("len"),
+    "trim": _string_function("strip"),
+}
+
+
+## Function to give an object column of numbers a proper (nullable) numeric dtype
+def infer_numeric(series):
+    if series.dtype != object:
+        return series
+    kind = pd.api.types.infer_dtype(series, skipna=True)
+    if kind == "integer":
+        return series.astype("Int64")
+    if kind in ("floating", "mixed-integer-float"):
+        return series.astype("Float64")
+    return series
+
+
+class Grouping:
+    """Rows of an aggregate query assigned to dense group ids, factorized once."""
+
+    def __init__(self, key_nodes, keys, length):
+        self.key_nodes = key_nodes
+        self.keys = keys
+        ids = np.zeros(length, dtype=np.intp)
+        for key in keys:
+            codes, uniques = pd.factorize(key, use_na_sentinel=False)
+            ids, _ = pd.factorize(ids * len(uniques) + codes)
+        self.ids = ids
+        self.count = int(ids.max()) + 1 if length else 0
+        # Position of the first row of each group, in group id order; writing
+        # the rows in reverse lets the earliest row of each group win
+        self.first = np.zeros(self.count, dtype=np.intp)
+        self.first[ids[::-1]] = np.arange(length - 1, -1, -1)
+        self.index = pd.RangeIndex(self.count)
+
+    def key(self, node):
+        values = self.keys[self.key_nodes.index(node)]
+        return values.iloc[self.first].set_axis(self.index)
+
+    def size(self):
+        return pd.Series(np.bincount(self.ids, minlength=self.count), index=self.index)
+
+    def counts(self, values):
+        present = values.notna().to_numpy()
+        return np.bincount(self.ids[present], minlength=self.count)
+
+    def sums(self, values):
+        weights = values.astype("Float64").to_numpy(dtype=float, na_value=0.0)
+        return np.bincount(self.ids, weights=weights, minlength=self.count)
+
+    def apply(self, values, method):
+        # Reductions without a bincount form go through pandas on the group ids
+        result = getattr(values.groupby(self.ids), method)()
+        return result.reindex(range(self.count)).set_axis(self.index)
+
+
+class Evaluator:
+    def __init__(self, frame, columns, aliases=None, grouping=None):
+        self.frame = frame
+        self.columns = columns
+        self.aliases = aliases or {}
+        # Grouping of the rows for aggregate queries
+        self.grouping = grouping
+
+    def index(self):
+        if self.grouping is None:
+            return self.frame.index
+        return self.grouping.index
+
+    def evaluate(self, node):
+        kind = node[0]
+        if self.grouping is not None:
+            if node in self.grouping.key_nodes:
+                return self.grouping.key(node)
+            if kind == "column":
+                alias = self.aliases.get(node[1].lower())
+                if alias is not None and alias != node:
+                    return self.evaluate(alias)
+                raise Unsupported("columns outside GROUP BY in an aggregate query")
+            if kind == "aggregate":
+                return self.aggregate(node)
+        elif kind == "aggregate":
+            raise Unsupported("aggregate outside an aggregate query")
+
+        if kind == "literal":
+            return node[1]
+        if kind == "column":
+            column = self.columns.get(node[1].lower())
+            if column is None:
+                raise Unsupported(f"unknown column {node[1]}")
+            return self.frame[column]
+        if kind == "compare":
+            return compare(node[1], self.evaluate(node[2]), self.evaluate(node[3]))
+        if kind == "arith":
+            return arithmetic(node[1], self.evaluate(node[2]), self.evaluate(node[3]))
+        if kind == "and":
+            return self.condition(node[1]) & self.condition(node[2])
+        if kind == "or":
+            return self.condition(node[1]) | self.condition(node[2])
+        if kind == "not":
+            return ~self.condition(node[1])
+        if kind == "isnull":
+            nulls = _null_mask(self.evaluate(node[1]))
+            if isinstance(nulls, pd.Series):
+                nulls = nulls.astype("boolean")
+            return ~nulls if node[2] else nulls
+        if kind == "in":
+            return self.membership(node)
+        if kind == "between":
+            value = self.evaluate(node[1])
+            result = self.truth(compare(">=", value, self.evaluate(node[2]))) & self.truth(
+                compare("<=", value, self.evaluate(node[3]))
+            )
+            return ~result if node[4] else result
+        if kind == "like":
+            result = like(self.evaluate(node[1]), self.evaluate(node[2]))
+            return ~result if node[3] else result
+        if kind == "case":
+            return self.case(node)
+        if kind == "function":
+            return _functions[node[1]](*[self.evaluate(argument) for argument in node[2]])
+        raise Unsupported(f"unsupported expression {kind}")
+
+    ## Interpret a value as a SQL truth value (NULL stays unknown)
+    def truth(self, value):
+        if isinstance(value, pd.Series):
+            if pd.api.types.is_bool_dtype(value.dtype):
+                return value.astype("boolean")
+            if not pd.api.types.is_numeric_dtype(value.dtype):
+                raise Unsupported("non-numeric value used as a condition")
+            return (value != 0).astype("boolean").mask(value.isna())
+        if _is_null(value):
+            return pd.NA
+        return bool(value)
+
+    def condition(self, node):
+        return self.truth(self.evaluate(node))
+
+    def membership(self, node):
+        value = self.evaluate(node[1])
+        options = [self.evaluate(option) for option in node[2]]
+        if any(isinstance(option, pd.Series) for option in options):
+            raise Unsupported("IN lists must be literals")
+        options = [option for option in options if not _is_null(option)]
+        check_comparable(value, *options)
+        if not isinstance(value, pd.Series):
+            return pd.NA if _is_null(value) else (value in options) != node[3]
+        result = value.isin(options).astype("boolean")
+        result[value.isna().to_numpy()] = pd.NA
+        return ~result if node[3] else result
+
+    def case(self, node):
+        branches, default = node[1], node[2]
+        index = self.index()
+        conditions = [
+            to_filter(self.condition(condition), len(index)) for condition, _ in branches
+        ]
+        values = [self.evaluate(value) for _, value in branches] + [self.evaluate(default)]
+        if not any(isinstance(value, pd.Series) for value in values):
+            # Constant branches (e.g. THEN 1 ELSE 0) pick a value per row in one pass
+            if all(_is_integer(value) for value in values):
+                return pd.Series(np.select(conditions, values[:-1], values[-1]), index=index)
+            choices = np.empty(len(values), dtype=object)
+            choices[:] = values
+            selected = np.select(conditions, range(len(values) - 1), len(values) - 1)
+            return infer_numeric(pd.Series(choices[selected], index=index).infer_objects())
+        result = _plain(ColumnarTable.broadcast(values[-1], index)).astype(object)
+        # Later branches are applied first so the first matching branch wins
+        for mask, value in reversed(list(zip(conditions, values[:-1]))):
+            if isinstance(value, pd.Series):
+                value = _plain(value).astype(object)
+            result = result.mask(mask, value)
+        return infer_numeric(result.infer_objects())
+
+    def aggregate(self, node):
+        _, name, argument, distinct = node
+        grouping = self.grouping
+        if argument is None:
+            return grouping.size()
+        values = Evaluator(self.frame, self.columns).evaluate(argument)
+        values = _widen(_plain(ColumnarTable.broadcast(values, self.frame.index)))
+        if pd.api.types.is_bool_dtype(values.dtype):
+            values = values.astype("Int64")
+        if distinct:
+            if name != "count":
+                raise Unsupported("DISTINCT is only supported in COUNT")
+            return grouping.apply(values, "nunique").fillna(0).astype("Int64")
+        if name == "count":
+            return pd.Series(grouping.counts(values), index=grouping.index)
+        if name in ("min", "max"):
+            return grouping.apply(values, name)
+        if not pd.api.types.is_numeric_dtype(values.dtype):
+            raise Unsupported(f"{name.upper()} over non-numeric values")
+        counts = grouping.counts(values)
+        sums = grouping.sums(values)
+        empty = counts == 0
+        if name == "total":
+            return pd.Series(sums, index=grouping.index, dtype="Float64")
+        if name == "avg":
+            result = pd.Series(sums / np.maximum(counts, 1), index=grouping.index, dtype="Float64")
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            result = pd.Series(np.rint(sums), index=grouping.index).astype("Int64")
+        else:
+            result = pd.Series(sums, index=grouping.index, dtype="Float64")
+        # SQLite's SUM and AVG of no values are NULL (TOTAL is 0.0)
+        result[empty] = pd.NA
+        return result
+
+
+## Function to pick the smallest nullable integer dtype that holds a column's values
+def compact_integers(series):
+    series = series.astype("Int64")
+    present = series.dropna()
+    low, high = (present.min(), present.max()) if len(present) else (0, 0)
+    for dtype in ("Int8", "Int16", "Int32"):
+        info = np.iinfo(dtype.lower())
+        if info.min <= low and high <= info.max:
+            return series.astype(dtype)
+    return series
+
+
+class ColumnarTable:
+    def __init__(self, name, frame, load_seconds):
+        self.name = name
+        self.frame = frame
+        self.columns = {column.lower(): column for column in frame.columns}
+        self.load_seconds = load_seconds
+
+    ## Load a whole table into compact columns
+    @classmethod
+    def load(cls, conn, table):
+        start = time.perf_counter()
+        cursor = conn.execute(f"SELECT * FROM {quote_identifier(table)}")
+        names = [desc[0] for desc in cursor.description]
+        values = list(zip(*cursor.fetchall())) or [() for _ in names]
+        columns = {}
+        for name, column in zip(names, values):
+            series = pd.Series(column, dtype=object)
+            kind = pd.api.types.infer_dtype(series, skipna=True)
+            if kind in ("integer", "boolean", "empty"):
+                series = compact_integers(series)
+            elif kind in ("floating", "mixed-integer-float"):
+                series = series.astype("Float64")
+            elif kind == "string" and series.nunique() <= CATEGORY_RATIO * max(len(series), 1):
+                # Dictionary encoding: one small integer code per row
+                series = series.astype("category")
+            columns[name] = series
+        frame = pd.DataFrame(columns, columns=names)
+        return cls(table, frame, time.perf_counter() - start)
+
+    def memory_bytes(self):
+        return int(self.frame.memory_usage(deep=True).sum())
+
+    ## Execute a parsed query against the table's columns
+    def execute(self, query, max_rows=MAX_RESULT_ROWS):
+        if query["table"].lower() != self.name.lower():
+            raise Unsupported(f"table {query['table']} is not loaded")
+        known = set(self.columns) | {"rowid", "oid", "_rowid_"} | {
+            item["alias"].lower() for item in query["items"] if item["alias"]
+        }
+        query = resolve_quoted(query, known)
+        frame = self.frame
+        if query["where"] is not None:
+            mask = Evaluator(frame, self.columns).condition(query["where"])
+            frame = frame[to_filter(mask, len(frame))]
+
+        items = []
+        for item in query["items"]:
+            if item["node"] == ("star",):
+                items.extend(
+                    {"node": ("column", column), "alias": None, "text": column}
+                    for column in self.frame.columns
+                )
+            else:
+                items.append(item)
+        aliases = {item["alias"].lower(): item["node"] for item in items if item["alias"]}
+        names = [item["alias"] or self.column_name(item) for item in items]
+        order_nodes = [
+            self.resolve_reference(node, items, aliases) for node, _ in query["order_by"]
+        ]
+        descending = [desc for _, desc in query["order_by"]]
+
+        if (
+            query["group_by"]
+            or query["having"] is not None
+            or any(has_aggregate(item["node"]) for item in items)
+        ):
+            evaluator, index = self.aggregate_evaluator(query, frame, items, aliases)
+            if evaluator is None:
+                output, order_keys = self.empty_aggregate(items), []
+            else:
+                output, order_keys = self.project(evaluator, index, items, order_nodes)
+                if query["having"] is not None:
+                    keep = to_filter(evaluator.condition(query["having"]), len(index))
+                    output = output[keep]
+                    order_keys = [key[keep] for key in order_keys]
+        else:
+            evaluator = Evaluator(frame, self.columns)
+            if order_nodes and query["limit"] is not None and not query["distinct"]:
+                # Top-N: order and cut first so only the surviving rows are projected
+                order_keys = [
+                    self.broadcast(evaluator.evaluate(node), frame.index)
+                    for node in order_nodes
+                ]
+                positions = sort_positions(
+                    order_keys, descending, limit=query["offset"] + query["limit"]
+                )
+                frame = frame.iloc[positions[query["offset"] : query["offset"] + query["limit"]]]
+                query = dict(query, offset=0)
+                order_nodes = []
+                evaluator = Evaluator(frame, self.columns)
+            output, order_keys = self.project(evaluator, frame.index, items, order_nodes)
+
+        if query["distinct"]:
+            keep = ~output.duplicated().to_numpy()
+            output = output[keep]
+            order_keys = [key[keep] for key in order_keys]
+        if order_nodes:
+            output = output.iloc[sort_positions(order_keys, descending)]
+        start = query["offset"]
+        stop = None if query["limit"] is None else start + query["limit"]
+        output = output.iloc[start:stop]
+
+        truncated = len(output) > max_rows
+        output = output.iloc[:max_rows]
+        columns = [to_python(output[column]) for column in output.columns]
+        return names, list(zip(*columns)) if columns else [], truncated
+
+    def column_name(self, item):
+        # SQLite names a column after the table column or the expression text
+        node = item["node"]
+        if node[0] == "column":
+            return self.columns.get(node[1].lower(), node[1])
+        return item["text"]
+
+    def resolve_reference(self, node, items, aliases):
+        if node[0] == "literal" and isinstance(node[1], int):
+            if not 1 <= node[1] <= len(items):
+                raise Unsupported("column position out of range")
+            return items[node[1] - 1]["node"]
+        if node[0] == "column" and node[1].lower() not in self.columns:
+            return aliases.get(node[1].lower(), node)
+        return node
+
+    def aggregate_evaluator(self, query, frame, items, aliases):
+        key_nodes = [
+            self.resolve_reference(node, items, aliases) for node in query["group_by"]
+        ]
+        if not key_nodes and len(frame) == 0:
+            # An aggregate without GROUP BY still returns one row
+            return None, None
+        evaluator = Evaluator(frame, self.columns)
+        keys = [
+            self.broadcast(evaluator.evaluate(node), frame.index) for node in key_nodes
+        ]
+        grouping = Grouping(key_nodes, keys, len(frame))
+        return Evaluator(frame, self.columns, aliases, grouping), grouping.index
+
+    def project(self, evaluator, index, items, order_nodes):
+        output = pd.DataFrame(
+            {
+                position: self.broadcast(evaluator.evaluate(item["node"]), index)
+                for position, item in enumerate(items)
+            },
+            index=index,
+        )
+        order_keys = [
+            self.broadcast(evaluator.evaluate(node), index) for node in order_nodes
+        ]
+        return output, order_keys
+
+    def empty_aggregate(self, items):
+        row = {}
+        for position, item in enumerate(items):
+            node = item["node"]
+            if node[0] == "aggregate":
+                row[position] = [{"count": 0, "total": 0.0}.get(node[1])]
+            elif node[0] == "literal":
+                row[position] = [node[1]]
+            else:
+                raise Unsupported("expression over an empty aggregate")
+        return pd.DataFrame(row)
+
+    @staticmethod
+    def broadcast(value, index):
+        if isinstance(value, pd.Series):
+            return value if value.index.equals(index) else value.reindex(index)
+        return infer_numeric(pd.Series([value] * len(index), index=index, dtype=object))
+
+
+## Function to order rows by several keys, NULLs first ascending and last descending
+def sort_positions(keys, descending, limit=None):
+    if limit is not None and len(keys) == 1 and limit < len(keys[0]):
+        positions = top_positions(keys[0], descending[0], limit)
+        if positions is not None:
+            return positions
+    sort_keys = []
+    # np.lexsort treats its last key as the primary one
+    for key, desc in reversed(list(zip(keys, descending))):
+        present = key.notna().to_numpy()
+        if isinstance(key.dtype, pd.CategoricalDtype) and key.cat.categories.is_monotonic_increasing:
+            ranks = key.cat.codes.to_numpy()
+        elif pd.api.types.is_numeric_dtype(key.dtype) or pd.api.types.is_bool_dtype(key.dtype):
+            ranks = key.astype("Float64").to_numpy(dtype=float, na_value=np.nan)
+        else:
+            try:
+                ranks = (
+                    pd.Series(_plain(key).to_numpy(dtype=object))
+                    .rank(method="dense")
+                    .fillna(0)
+                    .to_numpy()
+                )
+            except TypeError:
+                raise Unsupported("ORDER BY over mixed types")
+        if desc:
+            sort_keys.extend([-ranks, ~present])
+        else:
+            sort_keys.extend([ranks, present])
+    return np.lexsort(sort_keys)
+
+
+## Function to find the first rows of a single-key order without sorting every row
+def top_positions(key, descending, limit):
+    if isinstance(key.dtype, pd.CategoricalDtype):
+        if not key.cat.categories.is_monotonic_increasing:
+            return None
+        values = key.cat.codes.to_numpy().astype(float)
+        values[values < 0] = np.nan
+    elif pd.api.types.is_numeric_dtype(key.dtype):
+        values = key.astype("Float64").to_numpy(dtype=float, na_value=np.nan)
+    else:
+        return None
+    if descending:
+        values = -values
+    # NULLs sort first ascending and last descending
+    values = np.nan_to_num(values, nan=np.inf if descending else -np.inf)
+    # Ties keep table order, like the stable full sort: rows tied with the last
+    # one kept are taken in table order rather than as argpartition leaves them
+    boundary = np.partition(values, limit - 1)[limit - 1]
+    before = np.flatnonzero(values < boundary)
+    tied = np.flatnonzero(values == boundary)[: limit - len(before)]
+    candidates = np.concatenate([before, tied])
+    return candidates[np.lexsort((candidates, values[candidates]))]
+
+
+## Function to convert a result column to Python values with None for NULL
+def to_python(series):
+    if pd.api.types.is_bool_dtype(series.dtype):
+        series = series.astype("Int64")
+    return [None if _is_null(value) else value for value in series.astype(object).tolist()]
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+## Function to get the in-memory copy of a table, reloaded when the database changes
+def get_columnar_table(db_path, table, conn):
+    version = database_version(db_path)
+    key = (db_path, table.lower())
+    with _tables_lock:
+        cached = _tables.get(key)
+        if cached is None or cached[0] != version:
+            rows = conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(table)}").fetchone()[0]
+            if not COLUMNAR_MIN_ROWS <= rows <= COLUMNAR_MAX_ROWS:
+                # Remember the verdict so the table is not counted on every query
+                loaded = f"{table} has {rows:,} rows, outside COLUMNAR_MIN_ROWS..COLUMNAR_MAX_ROWS"
+            else:
+                loaded = ColumnarTable.load(conn, table)
+            cached = (version, loaded)
+            _tables[key] = cached
+    if isinstance(cached[1], str):
+        raise Unsupported(cached[1])
+    return cached[1]
+
+
+## Function to answer a query from memory, raising Unsupported when SQLite must run it
+def columnar_query(conn, db_path, sql, max_rows=MAX_RESULT_ROWS):
+    start = time.perf_counter()
+    query = parse_query(sql)
+    table_names = {
+        name.lower(): name
+        for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )
+    }
+    table = table_names.get(query["table"].lower())
+    if table is None:
+        raise Unsupported(f"no such table {query['table']}")
+    columnar = get_columnar_table(db_path, table, conn)
+    try:
+        columns, rows, truncated = columnar.execute(query, max_rows=max_rows)
+    except (TypeError, ValueError) as e:
+        # Mixed-type operations SQLite would coerce; let SQLite answer them
+        raise Unsupported(str(e))
+    return QueryResult(
+        columns=columns,
+        column_types=infer_column_types(columns, rows),
+        rows=rows,
+        elapsed=time.perf_counter() - start,
+        truncated=truncated,
+        max_rows=max_rows,
+    )
@@ -0,0 +1,40 @@
+import random
+import sqlite3
+
+import pytest
+
+from billionaires_sqlite import insert_billionaires, table_info_billionaires
+from rollups import ensure_rollups
+
+
+## Function to build a small billionaires table, with its rollup, in memory
+@pytest.fixture
+def billionaires():
+    conn = sqlite3.connect(":memory:")
+    cursor = conn.cursor()
+    cursor.execute(table_info_billionaires)
+    rng = random.Random(0)
+    for rank in range(1, 41):
+        cursor.execute(
+            insert_billionaires,
+            (
+                rank,
+                rng.choice(["Technology", "Finance", "Food"]),
+                f"Person {rank}",
+                rng.choice(["United States", "India", "France", None]),
+                "City",
+                "Source",
+                rng.choice(["Technology", "Finance", "Food"]),
+                "United States",
+                "Organization",
+                rng.choice([True, False]),
+                rng.choice(["D", "U"]),
+                rng.choice(["M", "F"]),
+                "CEO",
+                rng.choice([1950, 1962, 1975, 1988, None]),
+            ),
+        )
+    ensure_rollups(cursor)
+    conn.commit()
+    yield conn
+    conn.close()
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+# Caps on one page of rows handed back to the model in a function response
+MAX_RESPONSE_ROWS = int(os.getenv("MAX_RESPONSE_ROWS", 50))
+MAX_RESPONSE_BYTES = int(os.getenv("MAX_RESPONSE_BYTES", 8 * 1024))
+
+# Seconds a cursor stays usable after it was last read, and how many are kept
+CURSOR_TTL = int(os.getenv("CURSOR_TTL", 10 * 60))
+MAX_CURSORS = int(os.getenv("MAX_CURSORS", 256))
+
+
+## Function to take one page of rows as dicts, capped by row count and JSON size
+def page_rows(
+    columns, rows, start, max_rows=MAX_RESPONSE_ROWS, max_bytes=MAX_RESPONSE_BYTES
+):
+    page = []
+    size = 2
+    for row in islice(rows, start, start + max_rows):
+        record = dict(zip(columns, row))
+        row_bytes = len(json.dumps(record, default=str)) + 1
+        # A page always holds at least one row, however wide
+        if page and size + row_bytes > max_bytes:
+            break
+        page.append(record)
+        size += row_bytes
+    return page
+
+
+class CursorCache:
+    def __init__(self, ttl=CURSOR_TTL, max_cursors=MAX_CURSORS):
+        self.ttl = ttl
+        self.max_cursors = max_cursors
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"opened": 0, "pages": 0, "expired": 0}
+
+    ## Answer a query with its first page, opening a cursor if more rows remain
+    # Cursor IDs are a hash of the SQL, so a recorded chat that pages through
+    # results replays with the same IDs. Calls of one turn run concurrently, so
+    # a counter would number them in completion order; the same SQL run again
+    # in a scope (e.g. one chat) simply reopens its cursor on the new result
+    def first_page(self, result, sql="", scope=None):
+        page = page_rows(result.columns, result.rows, 0)
+        result_id = None
+        if len(page) < result.row_count:
+            result_id = hashlib.sha1(sql.encode("utf-8")).hexdigest()[:16]
+            with self._lock:
+                self._entries.pop((scope, result_id), None)
+                self._entries[(scope, result_id)] = (result, time.time() + self.ttl)
+                self._counters["opened"] += 1
+                self._evict(time.time())
+        return self._response(result, result_id, 0, page)
+
+    ## Answer a fetch_more call with the page a cursor points at
+    def fetch_more(self, cursor, scope=None):
+        result_id, _, offset = str(cursor).partition(":")
+        key = (scope, result_id)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < now:
+                del self._entries[key]
+                self._counters["expired"] += 1
+                entry = None
+            if entry is None or not offset.isdigit():
+                return {
+                    "error": f"Cursor {cursor} is unknown or expired; "
+                    "run the query again with sql_query"
+                }
+            result = entry[0]
+            # Reading a cursor keeps it alive for another ttl
+            self._entries[key] = (result, now + self.ttl)
+            self._entries.move_to_end(key)
+            self._counters["pages"] += 1
+        start = int(offset)
+        page = page_rows(result.columns, result.rows, start)
+        return self._response(result, result_id, start, page)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["cursors"] = len(self._entries)
+        return stats
+
+    def _response(self, result, result_id, start, page):
+        end = start + len(page)
+        response = {
+            "rows": page,
+            "first_row": start + 1 if page else 0,
+            "last_row": end,
+            "total_rows": result.row_count,
+        }
+        if result.truncated:
+            # The query itself stopped at the result cap
+            response["total_rows_is_capped"] = True
+        if end < result.row_count:
+            response["next_cursor"] = f"{result_id}:{end}"
+        return response
+
+    # Callers must hold self._lock
+    def _evict(self, now):
+        for key in [
+            key for key, (_, expires_at) in self._entries.items() if expires_at < now
+        ]:
+            del self._entries[key]
+            self._counters["expired"] += 1
+        while len(self._entries) > self.max_cursors:
+            self._entries.popitem(last=False)
+
+
+_default_cursors = None
+_default_cursors_lock = threading.Lock()
+
+
+## Function to get the process-wide cursor cache shared by all chat sessions
+def get_default_cursors():
+    global _default_cursors
+    with _default_cursors_lock:
+        if _default_cursors is None:
+            _default_cursors = CursorCache()
+        return _default_cursors
@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from urllib.parse import quote
+
+# Maximum number of open connections per database file
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))
+
+# Seconds to wait for a free connection before giving up
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+
+# Per-connection tuning applied once when the connection is opened
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 64 * 1024
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    pass
+
+
+## Function to switch a database to WAL so readers never block on the loaders
+def ensure_wal(db_path):
+    if not os.path.exists(db_path):
+        return
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        # Read-only media or a locked file: the pool still works without WAL
+        warnings.warn(f"Could not enable WAL on {db_path}: {e}", RuntimeWarning)
+
+
+## Function to open a read-only, tuned connection
+def open_readonly(db_path):
+    uri = "file:" + quote(os.path.abspath(db_path)) + "?mode=ro"
+    # Connections are handed to one thread at a time by the pool, but
+    # Streamlit runs each rerun on a different thread than the one that
+    # opened the connection
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+## Function to get the identity of a database file, which changes if it is replaced
+def file_identity(db_path):
+    try:
+        stat = os.stat(db_path)
+        return (stat.st_dev, stat.st_ino)
+    except FileNotFoundError:
+        return None
+
+
+class ConnectionPool:
+    def __init__(self, db_path, max_size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = []
+        self._open = 0
+        # File identity each connection was opened against, recorded before
+        # opening so a replace racing the open is caught rather than missed
+        self._identities = {}
+        self._condition = threading.Condition()
+        self._metrics = {
+            "checkouts": 0,
+            "created": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "timeouts": 0,
+            "busy_seconds": 0.0,
+        }
+        ensure_wal(db_path)
+
+    def acquire(self):
+        start = time.perf_counter()
+        waited = False
+        with self._condition:
+            self._check_identity()
+            while not self._idle and self._open >= self.max_size:
+                waited = True
+                remaining = self.timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    self._metrics["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No free connection to {self.db_path} after {self.timeout}s"
+                    )
+                self._condition.wait(remaining)
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                # Reserve the slot before opening so concurrent callers respect max_size
+                self._open += 1
+                conn = None
+            wait_seconds = time.perf_counter() - start
+            self._metrics["checkouts"] += 1
+            if waited:
+                self._metrics["waits"] += 1
+                self._metrics["wait_seconds"] += wait_seconds
+                self._metrics["max_wait_seconds"] = max(
+                    self._metrics["max_wait_seconds"], wait_seconds
+                )
+        if conn is None:
+            identity = file_identity(self.db_path)
+            try:
+                conn = open_readonly(self.db_path)
+            except sqlite3.Error:
+                with self._condition:
+                    self._open -= 1
+                    self._condition.notify()
+                raise
+            with self._condition:
+                self._identities[conn] = identity
+                self._metrics["created"] += 1
+        return conn
+
+    def release(self, conn, busy_seconds=0.0):
+        # Never hand out a connection that is still inside a transaction
+        if conn.in_transaction:
+            conn.rollback()
+        with self._condition:
+            self._metrics["busy_seconds"] += busy_seconds
+            if file_identity(self.db_path) != self._identities.get(conn):
+                # The database file was rebuilt since this connection was opened
+                self._discard(conn)
+            else:
+                self._idle.append(conn)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        start = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            self.release(conn, time.perf_counter() - start)
+
+    def metrics(self):
+        with self._condition:
+            metrics = dict(self._metrics)
+            metrics["open"] = self._open
+            metrics["idle"] = len(self._idle)
+            metrics["in_use"] = self._open - len(self._idle)
+        return metrics
+
+    def close(self):
+        with self._condition:
+            for conn in self._idle:
+                self._discard(conn)
+            self._idle = []
+
+    # Callers must hold self._condition
+    def _check_identity(self):
+        identity = file_identity(self.db_path)
+        # A rebuilt file (e.g. an atomic replace) needs fresh connections; each
+        # idle connection is judged against the file it was opened on
+        stale = [conn for conn in self._idle if self._identities.get(conn) != identity]
+        for conn in stale:
+            self._idle.remove(conn)
+            self._discard(conn)
+
+    # Callers must hold self._condition
+    def _discard(self, conn):
+        conn.close()
+        self._identities.pop(conn, None)
+        self._open -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+## Function to get the shared pool for a database file
+def get_pool(db_path):
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_path)
+            _pools[key] = pool
+        return pool
@@ -0,0 +1,168 @@
+# The billionaires NL-to-SQL pipeline (generate -> execute -> interpret) without
+# any UI, shared by the Streamlit app (main.py) and the service (service.py)
+
+import os
+import sqlite3
+import time
+
+import resources
+import tracing
+from db_pool import get_pool
+from example_bank import FEW_SHOT_MODE
+from nl2sql import (
+    build_interpretation_prompt,
+    build_sql_prompt,
+    database,
+    model_name,
+    sql_prompt_identity,
+)
+from query_guard import execution_budget
+from query_runner import count_rows, validate_sql
+from rate_limit import get_rate_limiter
+from response_cache import get_default_cache
+from result_profile import estimate_tokens
+from streaming import STREAM_RESPONSES, EmptyResponse, record_timing, stream_text
+from tool_executor import cached_query
+
+# Rows included in a headless answer; the full result size is reported alongside
+MAX_ANSWER_ROWS = int(os.getenv("MAX_ANSWER_ROWS", 100))
+
+
+## Function to call the model, streaming when something consumes the partial text
+def call_model(contents, stage, render=None, on_text=None):
+    model = resources.genai_model(model_name)
+    waited = get_rate_limiter(model_name).acquire()
+    if STREAM_RESPONSES and (render is not None or on_text is not None):
+        text, timing = stream_text(
+            lambda: model.generate_content(contents, stream=True),
+            render=render,
+            on_text=on_text,
+            stage=stage,
+        )
+    else:
+        start = time.perf_counter()
+        response = model.generate_content(contents)
+        text = response.text
+        elapsed = time.perf_counter() - start
+        timing = record_timing(stage, elapsed, elapsed, streamed=False)
+    # A blocked or empty response carries no text; never pass it off as an answer
+    if not text.strip():
+        raise EmptyResponse(f"The model returned an empty response ({stage})")
+    return text, dict(timing, rate_limit_wait=waited)
+
+
+## Function to generate the SQL for a question, from the response cache when possible
+# Responses are cached under cache_prompt, the prompt template, since the
+# examples retrieved into the prompt itself vary with the question
+def generate_sql(
+    question, sql_prompt, cache_prompt=None, render=None, on_text=None, trace=None
+):
+    cache_prompt = cache_prompt or sql_prompt
+    cache = get_default_cache()
+    with tracing.span(trace, "sql_generation") as stage:
+        cached_response = cache.get(question, cache_prompt, model_name)
+        stage["cache_hit"] = cached_response is not None
+        if cached_response is not None:
+            return cached_response
+        stage["prompt_tokens"] = estimate_tokens(sql_prompt + question)
+        text, timing = call_model(
+            [sql_prompt, question], "sql_generation", render=render, on_text=on_text
+        )
+        stage["rate_limit_wait"] = timing["rate_limit_wait"]
+        stage["response_tokens"] = estimate_tokens(text)
+        cache.set(question, cache_prompt, model_name, text)
+        return text
+
+
+## Function to check the generated SQL compiles, without running it
+def check_sql(sql, db):
+    try:
+        with get_pool(db).connection() as conn:
+            return validate_sql(conn, sql)
+    except sqlite3.Error as e:
+        return str(e)
+
+
+## Function to run a query through the result cache and the query guard
+def execute_sql(sql, db, trace=None):
+    with tracing.span(trace, "sql_execution") as stage:
+        return cached_query(db, sql, stage)
+
+
+## Function to have the model interpret a result, returning (text, report)
+def interpret_result(result, question, render=None, trace=None):
+    with tracing.span(trace, "interpretation") as stage:
+        report = {}
+        try:
+            # Profiling the result can fail too, and must be reported the same way
+            interpretation_prompt, report = build_interpretation_prompt(result)
+            stage["prompt_tokens"] = estimate_tokens(question + interpretation_prompt)
+            text, timing = call_model(
+                [question, interpretation_prompt], "interpretation", render=render
+            )
+            report["model_seconds"] = timing["total"]
+            report["first_token_seconds"] = timing["ttft"]
+            stage["rate_limit_wait"] = timing["rate_limit_wait"]
+            stage["response_tokens"] = estimate_tokens(text)
+            return text, report
+        except Exception as e:
+            # This may run on a pipeline worker, so the caller shows the error
+            # and the trace keeps it
+            stage["error"] = str(e)
+            report["error"] = str(e)
+            return None, report
+
+
+## Function to count the full result size of a query whose rows were truncated
+def count_result_rows(sql, db, trace=None):
+    with tracing.span(trace, "row_count") as stage:
+        with get_pool(db).connection() as conn, execution_budget(conn):
+            stage["rows"] = count_rows(conn, sql)
+        return stage["rows"]
+
+
+## Function to answer one question end to end, returning a JSON-ready dict
+# Failures are reported in the answer's "error" rather than raised, so one bad
+# question never stops a batch
+def answer_question(
+    question,
+    db=database,
+    interpret=True,
+    prompt_mode=FEW_SHOT_MODE,
+    max_rows=MAX_ANSWER_ROWS,
+    app="engine",
+):
+    trace = tracing.Trace(app, question)
+    answer = {"question": question, "trace_id": trace.trace_id}
+    try:
+        with trace.span("prompt") as stage:
+            sql_prompt, prompt_report = build_sql_prompt(question, prompt_mode)
+            stage["examples"] = prompt_report["examples"]
+        sql = generate_sql(
+            question,
+            sql_prompt,
+            cache_prompt=sql_prompt_identity(prompt_mode),
+            trace=trace,
+        )
+        answer["sql"] = sql
+        error = check_sql(sql, db)
+        if error:
+            raise sqlite3.OperationalError(error)
+        result = execute_sql(sql, db, trace=trace)
+        answer["columns"] = result.columns
+        answer["rows"] = [list(row) for row in result.rows[:max_rows]]
+        answer["row_count"] = result.row_count
+        answer["truncated"] = result.truncated or result.row_count > max_rows
+        if interpret and result.rows:
+            interpretation, report = interpret_result(result, question, trace=trace)
+            if interpretation is None:
+                raise RuntimeError(
+                    f"Error interpreting the data: {report.get('error', 'no response')}"
+                )
+            answer["interpretation"] = interpretation
+    except Exception as e:
+        answer["error"] = str(e)
+        answer["error_type"] = type(e).__name__
+    entry = trace.finish(error=answer.get("error"))
+    answer["seconds"] = entry["seconds"]
+    return answer
@@ -0,0 +1,148 @@
+import argparse
+import os
+import sqlite3
+import statistics
+import time
+
+from benchmark import normalize_rows
+from columnar import ColumnarTable, Unsupported, parse_query
+from db_pool import open_readonly
+from nl2sql import database
+from query import queries
+from query_runner import run_query
+from rollups import drop_rollup_triggers
+
+TABLE = "BILLIONAIRES_DATA"
+
+
+## Function to build a copy of the database with the table repeated scale times
+def scaled_copy(db_path, scale):
+    path = f"{os.path.splitext(db_path)[0]}.x{scale}.db"
+    if os.path.exists(path):
+        os.remove(path)
+    source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+    cursor = target.cursor()
+    # The copy is only read by the benchmark, so skip rollup maintenance
+    drop_rollup_triggers(cursor)
+    base_rows = cursor.execute(f"SELECT MAX(rowid) FROM {TABLE}").fetchone()[0] or 0
+    for _ in range(scale - 1):
+        cursor.execute(
+            f"INSERT INTO {TABLE} SELECT * FROM {TABLE} WHERE rowid <= ?", (base_rows,)
+        )
+    cursor.execute("ANALYZE")
+    target.commit()
+    target.close()
+    return path
+
+
+## Function to time a callable, keeping the median of several runs
+def median_seconds(run, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), result
+
+
+## Function to run the query.py workload on both engines at one scale
+def compare_engines(db_path, repeat):
+    conn = open_readonly(db_path)
+    try:
+        rows = conn.execute(f"SELECT COUNT(*) FROM {TABLE}").fetchone()[0]
+        table = ColumnarTable.load(conn, TABLE)
+        outcomes = []
+        for case in queries:
+            sqlite_seconds, sqlite_result = median_seconds(
+                lambda: run_query(conn, case["query"]), repeat
+            )
+            outcome = {
+                "question": case["description"],
+                "sqlite_seconds": sqlite_seconds,
+            }
+            try:
+                query = parse_query(case["query"])
+                columnar_seconds, (_, columnar_rows, _) = median_seconds(
+                    lambda: table.execute(query), repeat
+                )
+            except Unsupported as e:
+                outcome["fallback"] = str(e)
+            else:
+                outcome["columnar_seconds"] = columnar_seconds
+                # Ties under ORDER BY may come back in another order, so
+                # compare the rows as multisets
+                outcome["matches"] = normalize_rows(
+                    columnar_rows, ordered=False
+                ) == normalize_rows(sqlite_result.rows, ordered=False)
+            outcomes.append(outcome)
+    finally:
+        conn.close()
+    return {
+        "rows": rows,
+        "load_seconds": table.load_seconds,
+        "memory_bytes": table.memory_bytes(),
+        "file_bytes": os.path.getsize(db_path),
+        "outcomes": outcomes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare SQLite and the columnar engine on the query.py workload"
+    )
+    parser.add_argument("--db", default=database)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the scaled database copies"
+    )
+    args = parser.parse_args()
+
+    mismatches = 0
+    for scale in args.scales:
+        path = args.db if scale == 1 else scaled_copy(args.db, scale)
+        try:
+            report = compare_engines(path, args.repeat)
+        finally:
+            if path != args.db and not args.keep:
+                os.remove(path)
+        print(
+            f"\nScale {scale}x: {report['rows']:,} rows, loaded in "
+            f"{report['load_seconds']:.2f}s into "
+            f"{report['memory_bytes'] / 2**20:.1f} MiB "
+            f"(database file {report['file_bytes'] / 2**20:.1f} MiB)"
+        )
+        sqlite_total = columnar_total = 0.0
+        for outcome in report["outcomes"]:
+            if "fallback" in outcome:
+                print(
+                    f"  sqlite {outcome['sqlite_seconds'] * 1000:9.2f} ms  "
+                    f"columnar   fallback  {outcome['question']} ({outcome['fallback']})"
+                )
+                continue
+            mismatches += not outcome["matches"]
+            sqlite_total += outcome["sqlite_seconds"]
+            columnar_total += outcome["columnar_seconds"]
+            print(
+                f"  sqlite {outcome['sqlite_seconds'] * 1000:9.2f} ms  "
+                f"columnar {outcome['columnar_seconds'] * 1000:9.2f} ms  "
+                f"{outcome['sqlite_seconds'] / outcome['columnar_seconds']:6.1f}x  "
+                f"{'' if outcome['matches'] else 'MISMATCH '}{outcome['question']}"
+            )
+        if columnar_total:
+            print(
+                f"  total: sqlite {sqlite_total * 1000:.1f} ms, "
+                f"columnar {columnar_total * 1000:.1f} ms "
+                f"({sqlite_total / columnar_total:.1f}x)"
+            )
+    raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import statistics
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+from jsonl_log import append_jsonl
+from response_cache import normalize_question
+from result_profile import estimate_tokens
+
+# Set the file holding the question/SQL example bank (one JSON object per line)
+EXAMPLE_BANK = os.getenv("EXAMPLE_BANK", "examples.jsonl")
+
+# "retrieval" picks the examples closest to the question, "static" always
+# sends the fixed examples written into the prompt
+FEW_SHOT_MODE = os.getenv("FEW_SHOT_MODE", "retrieval")
+
+# Number of examples to include and the token budget they may use
+FEW_SHOT_K = int(os.getenv("FEW_SHOT_K", 4))
+EXAMPLE_TOKEN_BUDGET = int(os.getenv("EXAMPLE_TOKEN_BUDGET", 400))
+
+# Size of the hashed feature space for word unigrams and bigrams
+HASH_FEATURES = 2**18
+
+# Words too common in the questions to say anything about which example fits
+STOP_WORDS = frozenset(
+    "a an and are as at be by do does for from has have how in is it of on "
+    "or the their there to was were what which who with".split()
+)
+
+
+## Function to split a question into the hashed unigram and bigram features
+def question_features(question):
+    words = [
+        word
+        for word in re.findall(r"[a-z0-9]+", normalize_question(question))
+        if word not in STOP_WORDS
+    ]
+    terms = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    counts = defaultdict(int)
+    for term in terms:
+        counts[zlib.crc32(term.encode("utf-8")) % HASH_FEATURES] += 1
+    return counts
+
+
+## Function to format examples the way the static prompt writes them
+def format_examples(examples):
+    return "".join(
+        f"Example {number} - {example['question']} The SQL command will be:\n"
+        f"{example['sql']}\n\n"
+        for number, example in enumerate(examples, start=1)
+    )
+
+
+class ExampleBank:
+    def __init__(self, examples):
+        self.examples = examples
+        start = time.perf_counter()
+        features = [question_features(example["question"]) for example in examples]
+        document_frequency = defaultdict(int)
+        for counts in features:
+            for feature in counts:
+                document_frequency[feature] += 1
+        total = len(examples)
+        self.idf = {
+            feature: math.log((1 + total) / (1 + frequency)) + 1
+            for feature, frequency in document_frequency.items()
+        }
+        # Inverted index of L2-normalised TF-IDF weights, so a search only
+        # touches the examples sharing at least one feature with the question
+        self.postings = defaultdict(list)
+        for position, counts in enumerate(features):
+            weights = self.weigh(counts)
+            for feature, weight in weights.items():
+                self.postings[feature].append((position, weight))
+        self.tokens = [
+            estimate_tokens(format_examples([example])) for example in examples
+        ]
+        self.build_seconds = time.perf_counter() - start
+
+    ## Load the bank from a JSONL file
+    @classmethod
+    def load(cls, path=EXAMPLE_BANK):
+        examples = []
+        with open(path) as file:
+            for line in file:
+                if line.strip():
+                    example = json.loads(line)
+                    examples.append(
+                        {"question": example["question"], "sql": example["sql"]}
+                    )
+        return cls(examples)
+
+    # Sublinear term frequency times IDF, L2-normalised; features never seen
+    # in the bank carry no weight
+    def weigh(self, counts):
+        weights = {
+            feature: (1 + math.log(count)) * self.idf[feature]
+            for feature, count in counts.items()
+            if feature in self.idf
+        }
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        if not norm:
+            return {}
+        return {feature: weight / norm for feature, weight in weights.items()}
+
+    ## Return (score, position) pairs for the examples most similar to the question
+    def search(self, question, limit):
+        scores = defaultdict(float)
+        for feature, weight in self.weigh(question_features(question)).items():
+            for position, example_weight in self.postings[feature]:
+                scores[position] += weight * example_weight
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, position) for position, score in ranked[:limit]]
+
+    ## Pick up to k relevant examples that fit in the token budget
+    def select(self, question, k=FEW_SHOT_K, token_budget=EXAMPLE_TOKEN_BUDGET):
+        start = time.perf_counter()
+        candidates = [position for _, position in self.search(question, k * 4)]
+        # Fall back to the start of the bank (the static examples) when
+        # nothing matches, so the model always sees a few examples
+        candidates += [
+            position
+            for position in range(min(k, len(self.examples)))
+            if position not in candidates
+        ]
+        selected = []
+        seen_sql = set()
+        tokens = 0
+        for position in candidates:
+            example = self.examples[position]
+            sql = " ".join(example["sql"].split()).lower()
+            if sql in seen_sql or tokens + self.tokens[position] > token_budget:
+                continue
+            seen_sql.add(sql)
+            selected.append(example)
+            tokens += self.tokens[position]
+            if len(selected) == k:
+                break
+        report = {
+            "examples": len(selected),
+            "example_tokens": tokens,
+            "select_seconds": time.perf_counter() - start,
+        }
+        return selected, report
+
+
+_banks = {}
+_banks_lock = threading.Lock()
+
+
+## Function to get the bank for a file, rebuilt only when the file changes
+def get_bank(path=EXAMPLE_BANK):
+    stat = os.stat(path)
+    marker = (stat.st_mtime_ns, stat.st_size)
+    with _banks_lock:
+        cached = _banks.get(path)
+        if cached is None or cached[0] != marker:
+            cached = (marker, ExampleBank.load(path))
+            _banks[path] = cached
+        return cached[1]
+
+
+_fingerprints = {}
+
+
+## Function to fingerprint the bank, so cached responses follow its edits
+# Hashed again only when the file changes, like get_bank; this runs on every
+# rerun and every question
+def bank_fingerprint(path=EXAMPLE_BANK):
+    stat = os.stat(path)
+    marker = (stat.st_mtime_ns, stat.st_size)
+    with _banks_lock:
+        cached = _fingerprints.get(path)
+        if cached is not None and cached[0] == marker:
+            return cached[1]
+    with open(path, "rb") as file:
+        fingerprint = hashlib.sha256(file.read()).hexdigest()[:16]
+    with _banks_lock:
+        _fingerprints[path] = (marker, fingerprint)
+    return fingerprint
+
+
+## Function to append a question/SQL pair to the bank
+def add_example(question, sql, path=EXAMPLE_BANK):
+    append_jsonl(path, {"question": question.strip(), "sql": sql.strip()})
+
+
+## Function to grow a bank synthetically by rewording and recombining its examples
+def synthetic_examples(examples, size, seed=0):
+    rng = random.Random(seed)
+    prefixes = ["", "Please tell me: ", "I want to know: ", "Quick question: "]
+    subjects = [
+        "United States",
+        "China",
+        "India",
+        "Germany",
+        "Technology",
+        "Finance & Investments",
+        "Retail",
+        "Healthcare",
+    ]
+    grown = list(examples)
+    while len(grown) < size:
+        example = rng.choice(examples)
+        subject = rng.choice(subjects)
+        grown.append(
+            {
+                "question": f"{rng.choice(prefixes)}{example['question']} "
+                f"(only {subject}, variant {len(grown)})",
+                "sql": example["sql"].rstrip(";")
+                + f" /* {subject} variant {len(grown)} */;",
+            }
+        )
+    return grown
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Manage the few-shot example bank and compare it with the static prompt"
+    )
+    parser.add_argument("--bank", default=EXAMPLE_BANK)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add = subparsers.add_parser("add", help="append a question/SQL pair")
+    add.add_argument("question")
+    add.add_argument("sql")
+    compare = subparsers.add_parser(
+        "compare", help="prompt size and selection latency, static vs retrieval"
+    )
+    compare.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[0, 1000, 10000],
+        help="bank sizes to test (0 is the bank as stored)",
+    )
+    compare.add_argument("--k", type=int, default=FEW_SHOT_K)
+    compare.add_argument("--budget", type=int, default=EXAMPLE_TOKEN_BUDGET)
+    args = parser.parse_args()
+
+    if args.command == "add":
+        add_example(args.question, args.sql, args.bank)
+        print(f"Added to {args.bank}")
+        return
+
+    # Imported here so nl2sql can import this module for its prompts
+    from nl2sql import prompt, prompt_header, prompt_notes
+    from query import queries
+
+    stored = ExampleBank.load(args.bank).examples
+    static_tokens = estimate_tokens(prompt[0])
+    base_tokens = estimate_tokens(prompt_header + prompt_notes)
+    print(f"Static prompt: {static_tokens} tokens, 4 examples")
+    for size in args.sizes:
+        examples = stored if size == 0 else synthetic_examples(stored, size)
+        bank = ExampleBank(examples)
+        # All examples inline is what the static prompt would grow into
+        inline_tokens = base_tokens + sum(bank.tokens)
+        prompt_tokens = []
+        select_ms = []
+        for case in queries:
+            _, report = bank.select(case["description"], args.k, args.budget)
+            prompt_tokens.append(base_tokens + report["example_tokens"])
+            select_ms.append(report["select_seconds"] * 1000)
+        print(
+            f"Bank of {len(examples):,} examples (indexed in "
+            f"{bank.build_seconds:.2f}s): retrieval prompt "
+            f"{statistics.mean(prompt_tokens):.0f} tokens on average "
+            f"(max {max(prompt_tokens)}), selection p50 "
+            f"{statistics.median(select_ms):.2f} ms, max {max(select_ms):.2f} ms; "
+            f"all examples inline would be {inline_tokens:,} tokens"
+        )
+
+
+if __name__ == "__main__":
+    main()
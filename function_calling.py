@@ -1,88 +1,68 @@
-from dotenv import load_dotenv
-import os
-import vertexai
-import sqlite3
-import streamlit as st
-from vertexai.generative_models import FunctionDeclaration, GenerativeModel, Part, Tool
-
-load_dotenv()  ## load all the environment variables
-
-PROJECT_ID = os.getenv("GOOGLE_PROJECT_ID")
-LOCATION = "us-central1"
-
-vertexai.init(project=PROJECT_ID, location=LOCATION)
-
-
-# SQLite Database file path
-DB_FILE = "music_store.db"
-
-
-def connect_to_db():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row  # To return dict-like rows
-    return conn
-
-
-# Define Function Declarations
-list_tables_func = FunctionDeclaration(
-    name="list_tables",
-    description="List tables in the SQL database that will help answer the user's question",
-    parameters={
-        "type": "object",
-        "properties": {},
-    },
-)
-get_table_func = FunctionDeclaration(
-    name="get_table",
-    description="Get information about a table, including the description, schema, and number of rows that will help answer the user's question.",
-    parameters={
-        "type": "object",
-        "properties": {
-            "table_name": {
-                "type": "string",
-                "description": "Name of the table to get information about",
-            }
-        },
-        "required": [
-            "table_name",
-        ],
-    },
-)
+import resources
 
+resources.load_environment()  ## load all the environment variables, once per process
 
-sql_query_func = FunctionDeclaration(
-    name="sql_query",
-    description="Execute SQL queries on the database to retrieve information that answers the user's question.",
-    parameters={
-        "type": "object",
-        "properties": {
-            "query": {
-                "type": "string",
-                "description": "SQL query that will be executed on the database.",
-            }
-        },
-        "required": [
-            "query",
-        ],
-    },
-)
-
+import json
+import secrets
+import time
+import streamlit as st
 
-# Create a Tool for the model
-sql_query_tool = Tool(
-    function_declarations=[
-        list_tables_func,
-        get_table_func,
-        sql_query_func,
-    ],
-)
+from streaming import STREAM_RESPONSES, record_timing, stream_text
+from tool_executor import execute_function_calls
+from schema_catalog import get_catalog
+from schema_planner import CHAT_MODE, build_planned_message
+from chat_log import log_chat_turn
+from chat_history import ChatHistory, remove_stale_sessions
+from chat_tools import DB_FILE
+from model_client import serialize_content
+from result_profile import estimate_tokens
+import tracing
+
+
+# Collect every function call the model asked for in this turn
+def get_function_calls(response):
+    function_calls = []
+    if not response.candidates:
+        return function_calls
+    for part in response.candidates[0].content.parts:
+        if "function_call" not in part.to_dict():
+            continue
+        params = {}
+        for key, value in part.function_call.args.items():
+            params[key] = value
+        function_calls.append((part.function_call.name, params))
+    return function_calls
+
+
+# Send a message and return the requested function calls plus any answer text,
+# streaming the text into render as it arrives
+def send_message(chat, message, render=None, trace=None):
+    with tracing.span(trace, "model_round_trip") as stage:
+        stage["prompt_tokens"] = estimate_tokens(
+            json.dumps(serialize_content(message), default=str)
+        )
+        if not STREAM_RESPONSES:
+            start = time.perf_counter()
+            response = chat.send_message(message)
+            elapsed = time.perf_counter() - start
+            record_timing("chat_turn", elapsed, elapsed, streamed=False)
+            function_calls = get_function_calls(response)
+            text = "" if function_calls else response.text
+        else:
+            function_calls = []
+
+            def text_chunks():
+                for chunk in chat.send_message(message, stream=True):
+                    function_calls.extend(get_function_calls(chunk))
+                    yield chunk
+
+            text, _ = stream_text(text_chunks, render=render, stage="chat_turn")
+        stage["function_calls"] = len(function_calls)
+        stage["response_tokens"] = estimate_tokens(
+            text + json.dumps(function_calls, default=str)
+        )
+        return function_calls, text
 
-# Initialize the Gemini model
-model = GenerativeModel(
-    "gemini-1.5-pro",
-    generation_config={"temperature": 0},
-    tools=[sql_query_tool],
-)
 
 # Streamlit UI setup
 st.set_page_config(
@@ -96,6 +76,10 @@ with col1:
 
 st.subheader("Powered by Function Calling in Gemini")
 
+# Vertex AI, the function declarations and the model are created once per
+# process, in the background while the first page renders
+resources.start_warm_up("chat")
+
 
 with st.expander("Sample prompts", expanded=True):
     st.write(
@@ -106,29 +90,85 @@ with st.expander("Sample prompts", expanded=True):
     """
     )
 
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# The tool loop discovers the schema over several model round trips; the
+# planned mode inlines the relevant tables so the model can query directly
+chat_modes = {
+    "tool_loop": "Discover tables with function calls",
+    "planned": "Send relevant tables with the question",
+}
+with st.sidebar:
+    chat_mode = st.radio(
+        "Schema discovery",
+        list(chat_modes),
+        index=list(chat_modes).index(CHAT_MODE) if CHAT_MODE in chat_modes else 0,
+        format_func=chat_modes.get,
+    )
+
+# Spilled details of sessions that went idle are removed once per process
+@st.cache_resource
+def clean_chat_history():
+    return remove_stale_sessions()
+
+
+clean_chat_history()
+
+# Function-call details are kept by ID with older ones spilled to disk, so
+# the session holds and re-renders only the answers on every rerun
+if "history" not in st.session_state:
+    st.session_state.history = ChatHistory(secrets.token_hex(8))
+history = st.session_state.history
 
-for message in st.session_state.messages:
+render_start = time.perf_counter()
+for message in history.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"].replace("$", r"\$"))
-        try:
-            with st.expander("Function calls, parameters, and responses"):
-                st.markdown(message["backend_details"])
-        except KeyError:
-            pass
+        # The details are only read (and rendered) when the toggle is on
+        if message.get("has_details") and st.toggle(
+            "Function calls, parameters, and responses",
+            key=f"details-{history.session_id}-{message['id']}",
+        ):
+            st.markdown(history.details(message))
+history.record_render(time.perf_counter() - render_start)
+
+with st.sidebar:
+    history_stats = history.stats()
+    st.subheader("Chat history")
+    st.caption(
+        f"{history_stats['messages']} messages, "
+        f"{history_stats['memory_bytes'] / 1024:.0f} KiB in memory, "
+        f"{history_stats['spilled_details']} details on disk "
+        f"({history_stats['disk_bytes'] / 1024:.0f} KiB), "
+        f"history rendered in {history_stats['last_render'] * 1000:.1f} ms"
+    )
+    if st.button("Clear chat history"):
+        history.clear()
+        st.rerun()
+
+    st.subheader("Stage latency")
+    for stage, stats in tracing.stage_summary("chat").items():
+        st.caption(tracing.format_stage(stage, stats))
 
 if prompt := st.chat_input("Ask me about information in the database..."):
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    history.append("user", prompt)
     with st.chat_message("user"):
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
+        from vertexai.generative_models import Part
+
         message_placeholder = st.empty()
         full_response = ""
-        chat = model.start_chat()
-
-        conn = connect_to_db()
+        chat = resources.chat_model().start_chat()
+        question = prompt
+        question_start = time.perf_counter()
+        trace = tracing.Trace("chat", question)
+        planned_tables = []
+        if chat_mode == "planned":
+            with trace.span("planning") as stage:
+                prompt, planned_tables = build_planned_message(
+                    get_catalog(DB_FILE), prompt
+                )
+                stage["tables"] = len(planned_tables)
 
         prompt += """
             Please give a concise, high-level summary followed by detail in
@@ -137,103 +177,136 @@ if prompt := st.chat_input("Ask me about information in the database..."):
             from SQLite, do not make up information. The table name or field name can be any case sent as input. You have to analyse based on table information
             """
 
+        def render_answer(text):
+            message_placeholder.markdown(text.replace("$", r"\$"))
+
         try:
-            response = chat.send_message(prompt)
-            response = response.candidates[0].content.parts[0]
+            function_calls, full_response = send_message(
+                chat, prompt, render=render_answer, trace=trace
+            )
+            round_trips = 1
+            called_functions = [name for name, _ in function_calls]
 
             api_requests_and_responses = []
             backend_details = ""
 
-            function_calling_in_process = True
-            while function_calling_in_process:
-                try:
-                    params = {}
-                    for key, value in response.function_call.args.items():
-                        params[key] = value
+            while function_calls:
+                # Run every function call of this turn together and answer
+                # them all in a single message
+                with trace.span("tool_calls", calls=len(function_calls)) as stage:
+                    # Each question is its own chat, so its cursors are too
+                    results = execute_function_calls(
+                        DB_FILE, function_calls, scope=trace.trace_id
+                    )
+                    stage["rows"] = sum(
+                        len(api_response.get("rows", []))
+                        for _, _, api_response in results
+                        if isinstance(api_response, dict)
+                    )
+
+                function_responses = []
+                with trace.span("render_results"):
+                    for function_name, params, api_response in results:
+                        # A call can fail (e.g. a missing parameter); its
+                        # error is shown and still sent back to the model
+                        if function_name == "list_tables":
+                            st.write("List of Tables:")
+                            if isinstance(api_response, dict):
+                                st.write(api_response["error"])
+                            else:
+                                st.dataframe(api_response)  # Display table names
+
+                        elif function_name == "get_table":
+                            st.write(
+                                f"Schema information for table {params.get('table_name')}:"
+                            )
+                            if "columns" in api_response:
+                                st.dataframe(api_response["columns"])  # Display schema
+                            else:
+                                st.write(api_response["error"])
+
+                        elif function_name in ("sql_query", "fetch_more"):
+                            if function_name == "sql_query":
+                                st.write(f"Query Results for: {params.get('query')}")
+                            else:
+                                st.write(
+                                    f"More results for cursor {params.get('cursor')}:"
+                                )
+                            if "rows" in api_response:
+                                st.dataframe(api_response["rows"])  # Display the page
+                                st.caption(
+                                    f"Rows {api_response['first_row']}-"
+                                    f"{api_response['last_row']} of "
+                                    f"{api_response['total_rows']}"
+                                )
+                            else:
+                                st.write(api_response["error"])
 
-                    if response.function_call.name == "list_tables":
-                        cursor = conn.execute(
-                            "SELECT name FROM sqlite_master WHERE type='table';"
-                        )
-                        api_response = [row["name"] for row in cursor.fetchall()]
-                        st.write("List of Tables:")
-                        st.dataframe(api_response)  # Display table names
                         api_requests_and_responses.append(
-                            [response.function_call.name, params, api_response]
+                            [function_name, params, api_response]
                         )
 
-                    elif response.function_call.name == "get_table":
-                        cursor = conn.execute(
-                            f"PRAGMA table_info({params['table_name']});"
+                        backend_details += "- Function call:\n"
+                        backend_details += (
+                            "   - Function name: ```"
+                            + str(api_requests_and_responses[-1][0])
+                            + "```"
                         )
-                        api_response = [dict(row) for row in cursor.fetchall()]
-                        st.write(
-                            f"Schema information for table {params['table_name']}:"
+                        backend_details += "\n\n"
+                        backend_details += (
+                            "   - Function parameters: ```"
+                            + str(api_requests_and_responses[-1][1])
+                            + "```"
                         )
-                        st.dataframe(api_response)  # Display schema
-                        api_requests_and_responses.append(
-                            [response.function_call.name, params, api_response]
+                        backend_details += "\n\n"
+                        backend_details += (
+                            "   - API response: ```"
+                            + str(api_requests_and_responses[-1][2])
+                            + "```"
                         )
-
-                    elif response.function_call.name == "sql_query":
-                        cursor = conn.execute(params["query"])
-                        api_response = [dict(row) for row in cursor.fetchall()]
-                        st.write(f"Query Results for: {params['query']}")
-                        st.dataframe(api_response)  # Display query results
-                        api_requests_and_responses.append(
-                            [response.function_call.name, params, api_response]
+                        backend_details += "\n\n"
+
+                        function_responses.append(
+                            Part.from_function_response(
+                                name=function_name,
+                                response={
+                                    "content": api_response,
+                                },
+                            )
                         )
 
-                    backend_details += "- Function call:\n"
-                    backend_details += (
-                        "   - Function name: ```"
-                        + str(api_requests_and_responses[-1][0])
-                        + "```"
-                    )
-                    backend_details += "\n\n"
-                    backend_details += (
-                        "   - Function parameters: ```"
-                        + str(api_requests_and_responses[-1][1])
-                        + "```"
-                    )
-                    backend_details += "\n\n"
-                    backend_details += (
-                        "   - API response: ```"
-                        + str(api_requests_and_responses[-1][2])
-                        + "```"
-                    )
-                    backend_details += "\n\n"
-                    with message_placeholder.container():
-                        st.markdown(backend_details)
-
-                    response = chat.send_message(
-                        Part.from_function_response(
-                            name=response.function_call.name,
-                            response={
-                                "content": api_response,
-                            },
-                        ),
-                    )
-                    response = response.candidates[0].content.parts[0]
+                with message_placeholder.container():
+                    st.markdown(backend_details)
 
-                except AttributeError:
-                    function_calling_in_process = False
+                function_calls, full_response = send_message(
+                    chat, function_responses, render=render_answer, trace=trace
+                )
+                round_trips += 1
+                called_functions.extend(name for name, _ in function_calls)
 
-            full_response = response.text
             with message_placeholder.container():
                 st.markdown(full_response.replace("$", r"\$"))  # noqa: W605
                 with st.expander("Function calls, parameters, and responses:"):
                     st.markdown(backend_details)
 
-            st.session_state.messages.append(
-                {
-                    "role": "assistant",
-                    "content": full_response,
-                    "backend_details": backend_details,
-                }
+            question_seconds = time.perf_counter() - question_start
+            st.caption(
+                f"{round_trips} model round trips in {question_seconds:.2f} s "
+                f"({chat_modes[chat_mode].lower()})"
+            )
+            log_chat_turn(
+                chat_mode,
+                question,
+                round_trips,
+                called_functions,
+                question_seconds,
+                tables=planned_tables,
             )
+
+            history.append("assistant", full_response, details=backend_details)
+            trace.finish(mode=chat_mode, round_trips=round_trips)
         except Exception as e:
-            print(e)
+            trace.finish(mode=chat_mode, error=str(e))
             error_message = f"""
                 Something went wrong! We encountered an unexpected error while
                 trying to process your request. Please try rephrasing your
@@ -241,9 +314,4 @@ if prompt := st.chat_input("Ask me about information in the database..."):
 
                 {str(e)}"""
             st.error(error_message)
-            st.session_state.messages.append(
-                {
-                    "role": "assistant",
-                    "content": error_message,
-                }
-            )
+            history.append("assistant", error_message)
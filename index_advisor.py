@@ -0,0 +1,458 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import statistics
+import time
+from collections import Counter
+from urllib.parse import quote
+
+from query_guard import add_limit, execution_budget
+from query_runner import MAX_RESULT_ROWS, run_query
+from result_cache import canonicalize_sql
+from schema_catalog import quote_identifier
+from workload_log import QUERY_LOG, read_log
+
+# Name prefix of the indexes the advisor owns and may drop again
+ADVISOR_PREFIX = "IX_ADVISOR_"
+
+# Widest index proposed; covering columns are only added within this limit
+MAX_INDEX_COLUMNS = 6
+
+# Minimum speedup of the queries using an index for it to be created
+MIN_SPEEDUP = 1.2
+
+# Unused indexes are only dropped once the log holds this many queries
+MIN_WORKLOAD_QUERIES = 20
+
+# Times each logged query is replayed; the median is kept
+REPLAY_REPEAT = 3
+
+_token = re.compile(
+    r"'(?:[^']|'')*'"
+    r'|"(?:[^"]|"")*"'
+    r"|\[[^\]]*\]|`[^`]*`"
+    r"|\w+(?:\.\w+)?"
+    r"|<=|>=|==|!=|<>|\S"
+)
+_table_reference = re.compile(
+    r"\b(?:from|join)\s+(\"[^\"]+\"|\[[^\]]+\]|`[^`]+`|\w+)"
+    r"(?:\s+(?:as\s+)?(\w+))?",
+    re.IGNORECASE,
+)
+_not_aliases = {
+    "where", "join", "inner", "left", "right", "full", "cross", "natural",
+    "on", "using", "group", "order", "limit", "having", "union", "except",
+    "intersect", "window",
+}
+_equality_operators = {"=", "==", "in", "is"}
+_range_operators = {"<", ">", "<=", ">=", "between", "like", "glob"}
+_clauses = {"select", "from", "join", "on", "where", "having", "limit", "union"}
+
+
+## Function to strip the quotes around an identifier
+def unquote(name):
+    if name[:1] in "\"[`":
+        return name[1:-1]
+    return name
+
+
+## Function to map the tables and aliases a query reads from to table names
+def referenced_tables(sql, columns_by_table):
+    names = {table.lower(): table for table in columns_by_table}
+    tables = {}
+    for match in _table_reference.finditer(sql):
+        table = names.get(unquote(match.group(1)).lower())
+        if table is None:
+            continue
+        tables[table.lower()] = table
+        alias = match.group(2)
+        if alias and alias.lower() not in _not_aliases:
+            tables[alias.lower()] = table
+    return tables
+
+
+## Function to find the columns a query filters, groups, sorts on and reads, per table
+def column_usage(sql, columns_by_table):
+    sql = canonicalize_sql(sql)
+    tables = referenced_tables(sql, columns_by_table)
+    lookup = {
+        table: {column.lower(): column for column in columns_by_table[table]}
+        for table in set(tables.values())
+    }
+    usage = {
+        table: {
+            "equality": [],
+            "range": [],
+            "group": [],
+            "order": [],
+            "referenced": [],
+            "star": False,
+        }
+        for table in lookup
+    }
+
+    def resolve(token):
+        if "." in token:
+            qualifier, name = token.split(".", 1)
+            table = tables.get(qualifier.lower())
+            column = lookup.get(table, {}).get(name.lower()) if table else None
+            return (table, column) if column else None
+        matches = [
+            (table, columns[token.lower()])
+            for table, columns in lookup.items()
+            if token.lower() in columns
+        ]
+        # Bare names are only attributed when a single table has that column
+        return matches[0] if len(matches) == 1 else None
+
+    tokens = [token for token in _token.findall(sql)]
+    lowered = [token.lower() for token in tokens]
+    clause = None
+    for i, token in enumerate(lowered):
+        if token == "by" and i and lowered[i - 1] in ("group", "order"):
+            clause = lowered[i - 1]
+            continue
+        if token in _clauses:
+            clause = token
+            continue
+        if token == "*" and clause == "select" and lowered[i - 1] in ("select", ","):
+            for table_usage in usage.values():
+                table_usage["star"] = True
+            continue
+        resolved = resolve(unquote(tokens[i]))
+        if resolved is None:
+            continue
+        table, column = resolved
+        table_usage = usage[table]
+        table_usage["referenced"].append(column)
+        if clause in ("where", "on", "having"):
+            following = lowered[i + 1] if i + 1 < len(lowered) else ""
+            preceding = lowered[i - 1] if i else ""
+            if following in _equality_operators or preceding in _equality_operators:
+                table_usage["equality"].append(column)
+            elif following in _range_operators or preceding in _range_operators:
+                table_usage["range"].append(column)
+        elif clause in ("group", "order"):
+            table_usage[clause].append(column)
+    return usage
+
+
+## Function to remove repeated names while keeping their first position
+def unique(names):
+    return list(dict.fromkeys(names))
+
+
+## Function to derive the index that would serve one table of one query
+def index_for(usage, primary_keys):
+    key = [
+        column
+        for column in unique(
+            usage["equality"] + (usage["group"] or usage["order"]) + usage["range"][:1]
+        )
+        if column not in primary_keys
+    ]
+    if not key:
+        return None, False
+    # Carrying the other columns the query reads lets SQLite skip the table
+    extra = [
+        column
+        for column in unique(usage["referenced"])
+        if column not in key and column not in primary_keys
+    ]
+    if not usage["star"] and len(key) + len(extra) <= MAX_INDEX_COLUMNS:
+        return tuple(key + extra), True
+    return tuple(key[:MAX_INDEX_COLUMNS]), False
+
+
+## Function to name an advisor index after its table and columns
+def index_name(table, columns):
+    name = f"{ADVISOR_PREFIX}{table}_{'_'.join(columns)}".upper()
+    if len(name) > 60:
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8].upper()
+        name = f"{name[:51]}_{digest}"
+    return re.sub(r"\W", "_", name)
+
+
+## Function to read the columns, primary keys and existing indexes of every table
+def read_schema(conn):
+    schema = {}
+    for (table,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    ):
+        quoted = quote_identifier(table)
+        info = conn.execute(f"PRAGMA table_info({quoted})").fetchall()
+        indexes = {}
+        for _, name, _, origin, _ in conn.execute(f"PRAGMA index_list({quoted})"):
+            indexes[name] = {
+                "columns": tuple(
+                    row[2]
+                    for row in conn.execute(
+                        f"PRAGMA index_info({quote_identifier(name)})"
+                    )
+                ),
+                # c: CREATE INDEX; u/pk: backing a UNIQUE or PRIMARY KEY constraint
+                "origin": origin,
+            }
+        schema[table] = {
+            "columns": [row[1] for row in info],
+            "primary_key": {row[1] for row in info if row[5]},
+            "indexes": indexes,
+        }
+    return schema
+
+
+## Function to propose indexes for a workload of (sql, calls) pairs
+def propose_indexes(workload, schema):
+    columns_by_table = {table: info["columns"] for table, info in schema.items()}
+    proposals = {}
+    for sql, calls in workload.items():
+        for table, usage in column_usage(sql, columns_by_table).items():
+            columns, covering = index_for(usage, schema[table]["primary_key"])
+            if not columns:
+                continue
+            proposal = proposals.setdefault(
+                (table, columns),
+                {"table": table, "columns": columns, "covering": covering, "queries": {}},
+            )
+            proposal["queries"][sql] = calls
+
+    # An index also serves every query whose key is a prefix of its columns
+    for key in sorted(proposals, key=lambda key: len(key[1])):
+        table, columns = key
+        wider = [
+            other
+            for other in proposals
+            if other != key
+            and other[0] == table
+            and other[1][: len(columns)] == columns
+        ]
+        if wider:
+            target = max(wider, key=lambda other: len(proposals[other]["queries"]))
+            proposals[target]["queries"].update(proposals.pop(key)["queries"])
+
+    candidates = []
+    for (table, columns), proposal in proposals.items():
+        existing = schema[table]["indexes"]
+        if any(index["columns"][: len(columns)] == columns for index in existing.values()):
+            continue
+        proposal["name"] = index_name(table, columns)
+        candidates.append(proposal)
+    return candidates
+
+
+## Function to run every query of the workload and keep its median time and plan
+def replay_workload(conn, workload, repeat=REPLAY_REPEAT):
+    timings = {}
+    for sql in workload:
+        # Mirror what the app runs: the guard's LIMIT and execution budget
+        limited_sql = add_limit(sql, MAX_RESULT_ROWS + 1)
+        try:
+            plan = [
+                row[3]
+                for row in conn.execute("EXPLAIN QUERY PLAN " + limited_sql)
+            ]
+            samples = []
+            for _ in range(repeat):
+                with execution_budget(conn):
+                    samples.append(run_query(conn, limited_sql).elapsed)
+        except sqlite3.Error as e:
+            timings[sql] = {"error": str(e)}
+            continue
+        timings[sql] = {"seconds": statistics.median(samples), "plan": plan}
+    return timings
+
+
+## Function to check if any plan step of a query uses an index
+def uses_index(timing, name):
+    pattern = re.compile(rf"\bINDEX {re.escape(name)}\b")
+    return any(pattern.search(step) for step in timing.get("plan", []))
+
+
+## Function to total the time a set of queries took, weighted by how often they ran
+def weighted_seconds(queries, timings):
+    return sum(
+        timings[sql].get("seconds", 0.0) * calls for sql, calls in queries.items()
+    )
+
+
+## Function to copy the database to a scratch file the advisor can freely change
+def scratch_copy(db_path):
+    scratch_path = db_path + ".advisor"
+    if os.path.exists(scratch_path):
+        os.remove(scratch_path)
+    source = sqlite3.connect(
+        "file:" + quote(os.path.abspath(db_path)) + "?mode=ro", uri=True
+    )
+    target = sqlite3.connect(scratch_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+    return target, scratch_path
+
+
+## Function to evaluate candidate indexes by replaying the workload before and after
+def advise(db_path, log_path=None, min_speedup=MIN_SPEEDUP, repeat=REPLAY_REPEAT):
+    # Queries the columnar engine answered never touched SQLite's indexes
+    entries = [
+        entry
+        for entry in read_log(log_path, db_path)
+        if entry.get("engine", "sqlite") == "sqlite"
+    ]
+    workload = Counter(canonicalize_sql(entry["sql"]) for entry in entries)
+    conn, scratch_path = scratch_copy(db_path)
+    try:
+        schema = read_schema(conn)
+        candidates = propose_indexes(workload, schema)
+        before = replay_workload(conn, workload, repeat)
+
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        for candidate in candidates:
+            pages = conn.execute("PRAGMA page_count").fetchone()[0]
+            start = time.perf_counter()
+            conn.execute(
+                f"CREATE INDEX {quote_identifier(candidate['name'])} ON "
+                f"{quote_identifier(candidate['table'])} "
+                f"({', '.join(quote_identifier(c) for c in candidate['columns'])})"
+            )
+            candidate["build_seconds"] = time.perf_counter() - start
+            candidate["size_bytes"] = (
+                conn.execute("PRAGMA page_count").fetchone()[0] - pages
+            ) * page_size
+        conn.execute("ANALYZE")
+        conn.commit()
+        after = replay_workload(conn, workload, repeat)
+    finally:
+        conn.close()
+        os.remove(scratch_path)
+
+    for candidate in candidates:
+        queries = {
+            sql: calls
+            for sql, calls in candidate["queries"].items()
+            if uses_index(after.get(sql, {}), candidate["name"])
+        }
+        candidate["used_by"] = len(queries)
+        candidate["before_seconds"] = weighted_seconds(queries, before)
+        candidate["after_seconds"] = weighted_seconds(queries, after)
+        candidate["speedup"] = (
+            candidate["before_seconds"] / candidate["after_seconds"]
+            if queries and candidate["after_seconds"]
+            else None
+        )
+        candidate["accepted"] = bool(
+            queries and (candidate["speedup"] is None or candidate["speedup"] >= min_speedup)
+        )
+
+    unused = []
+    if sum(workload.values()) >= MIN_WORKLOAD_QUERIES:
+        for table, info in schema.items():
+            for name, index in info["indexes"].items():
+                if index["origin"] == "c" and not any(
+                    uses_index(timing, name) for timing in before.values()
+                ):
+                    unused.append({"table": table, "name": name, "columns": index["columns"]})
+
+    return {
+        "queries": sum(workload.values()),
+        "distinct_queries": len(workload),
+        "candidates": candidates,
+        "unused": unused,
+        "before_seconds": weighted_seconds(workload, before),
+        "after_seconds": weighted_seconds(workload, after),
+        "errors": {sql: t["error"] for sql, t in before.items() if "error" in t},
+    }
+
+
+## Function to create the accepted indexes and drop the advisor's unused ones
+def apply_report(db_path, report):
+    conn = sqlite3.connect(db_path)
+    try:
+        created = []
+        for candidate in report["candidates"]:
+            if candidate["accepted"]:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS {quote_identifier(candidate['name'])} "
+                    f"ON {quote_identifier(candidate['table'])} "
+                    f"({', '.join(quote_identifier(c) for c in candidate['columns'])})"
+                )
+                created.append(candidate["name"])
+        # Indexes built by the loader are only reported, never dropped
+        dropped = [
+            index["name"]
+            for index in report["unused"]
+            if index["name"].startswith(ADVISOR_PREFIX)
+        ]
+        for name in dropped:
+            conn.execute(f"DROP INDEX IF EXISTS {quote_identifier(name)}")
+        if created or dropped:
+            conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+    return created, dropped
+
+
+## Function to print the cost/benefit report
+def print_report(report):
+    print(
+        f"Workload: {report['queries']} logged queries "
+        f"({report['distinct_queries']} distinct), "
+        f"{report['before_seconds'] * 1000:.1f} ms before and "
+        f"{report['after_seconds'] * 1000:.1f} ms after the candidate indexes"
+    )
+    for candidate in report["candidates"]:
+        status = "CREATE" if candidate["accepted"] else "skip"
+        speedup = (
+            f"{candidate['speedup']:.1f}x" if candidate["speedup"] is not None else "n/a"
+        )
+        print(
+            f"[{status}] {candidate['name']} ON {candidate['table']} "
+            f"({', '.join(candidate['columns'])})"
+            f"{' covering' if candidate['covering'] else ''}"
+        )
+        print(
+            f"         used by {candidate['used_by']} queries, "
+            f"{candidate['before_seconds'] * 1000:.1f} ms -> "
+            f"{candidate['after_seconds'] * 1000:.1f} ms ({speedup}), "
+            f"{candidate['size_bytes'] / 1024:.0f} KiB, "
+            f"built in {candidate['build_seconds'] * 1000:.1f} ms"
+        )
+    for index in report["unused"]:
+        action = "drop" if index["name"].startswith(ADVISOR_PREFIX) else "unused"
+        print(f"[{action}] {index['name']} ON {index['table']} ({', '.join(index['columns'])})")
+    for sql, error in report["errors"].items():
+        print(f"error: {error}: {sql}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Propose indexes from the logged workload of generated queries"
+    )
+    parser.add_argument("--db", default="data.db")
+    parser.add_argument("--log", default=QUERY_LOG)
+    parser.add_argument("--min-speedup", type=float, default=MIN_SPEEDUP)
+    parser.add_argument("--repeat", type=int, default=REPLAY_REPEAT)
+    parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="create the accepted indexes and drop unused advisor indexes",
+    )
+    args = parser.parse_args()
+
+    report = advise(
+        args.db, log_path=args.log, min_speedup=args.min_speedup, repeat=args.repeat
+    )
+    if not report["queries"]:
+        print(f"No queries for {args.db} in {args.log}; run the app to build a workload.")
+        return
+    print_report(report)
+    if args.apply:
+        created, dropped = apply_report(args.db, report)
+        print(f"Created {len(created)} and dropped {len(dropped)} indexes in {args.db}")
+
+
+if __name__ == "__main__":
+    main()
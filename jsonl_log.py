@@ -0,0 +1,14 @@
+import json
+import threading
+
+# Shared by every log file: appends are small, and two threads writing to the
+# same file must never interleave their lines
+_lock = threading.Lock()
+
+
+## Function to append one entry as a line of a JSONL file
+def append_jsonl(path, entry):
+    line = json.dumps(entry, default=str) + "\n"
+    with _lock:
+        with open(path, "a") as file:
+            file.write(line)
@@ -0,0 +1,160 @@
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import model_client
+from benchmark import percentile
+from nl2sql import (
+    build_interpretation_prompt,
+    build_sql_prompt,
+    database,
+    model_name,
+)
+from query import queries
+from tool_executor import cached_query
+
+STAGES = ("generation", "execution", "dataframe", "interpretation", "session_state")
+
+
+## Function to build the model calls used by the simulated sessions
+def model_calls(stand_in):
+    if stand_in:
+        # No recordings needed: answer with the gold SQL and a fixed summary,
+        # paying the same synthetic latency a replayed response would
+        gold = {q["description"]: q["query"] for q in queries}
+
+        def generate_sql(question):
+            model_client.synthetic_delay(
+                model_client.REPLAY_LATENCY_MS, model_client.REPLAY_JITTER_MS
+            )
+            return gold[question]
+
+        def interpret(question, interpretation_prompt):
+            model_client.synthetic_delay(
+                model_client.REPLAY_LATENCY_MS, model_client.REPLAY_JITTER_MS
+            )
+            return "Stand-in interpretation."
+
+        return generate_sql, interpret
+
+    model_client.configure_genai()
+    model = model_client.get_model(model_name)
+
+    def generate_sql(question):
+        sql_prompt, _ = build_sql_prompt(question)
+        return model.generate_content([sql_prompt, question]).text
+
+    def interpret(question, interpretation_prompt):
+        return model.generate_content([question, interpretation_prompt]).text
+
+    return generate_sql, interpret
+
+
+## Function to run one simulated session asking several questions in a row
+def run_session(session_id, questions_per_session, generate_sql, interpret, db, seed):
+    rng = random.Random(seed + session_id)
+    timings = []
+    errors = []
+    # Stands in for st.session_state: the history a real session keeps and re-reads
+    history = []
+    for _ in range(questions_per_session):
+        question = rng.choice(queries)["description"]
+        timing = {}
+        try:
+            start = time.perf_counter()
+            sql = generate_sql(question)
+            timing["generation"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            result = cached_query(db, sql)
+            timing["execution"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            df = pd.DataFrame(result.rows, columns=result.columns)
+            df.to_json()  # roughly the serialisation st.dataframe performs
+            timing["dataframe"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            interpretation_prompt, _ = build_interpretation_prompt(result)
+            interpretation = interpret(question, interpretation_prompt)
+            timing["interpretation"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            history.append({"question": question, "sql": sql, "answer": interpretation})
+            # Every rerun re-renders the whole history of the session
+            "\n\n".join(str(message) for message in history)
+            timing["session_state"] = time.perf_counter() - start
+        except Exception as e:
+            errors.append(f"{question}: {e}")
+            continue
+        timings.append(timing)
+    return timings, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drive many simulated sessions through the NL-to-SQL pipeline"
+    )
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--questions-per-session", type=int, default=5)
+    parser.add_argument("--db", default=database)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--stand-in",
+        action="store_true",
+        help="use gold SQL and canned answers instead of model recordings",
+    )
+    args = parser.parse_args()
+
+    if not args.stand_in and model_client.MODEL_MODE == "live":
+        print(
+            "Note: MODEL_MODE=live sends every simulated request to the real API. "
+            "Use MODEL_MODE=replay or --stand-in for offline load tests."
+        )
+
+    generate_sql, interpret = model_calls(args.stand_in)
+    lock = threading.Lock()
+    all_timings = []
+    all_errors = []
+
+    def session(session_id):
+        timings, errors = run_session(
+            session_id,
+            args.questions_per_session,
+            generate_sql,
+            interpret,
+            args.db,
+            args.seed,
+        )
+        with lock:
+            all_timings.extend(timings)
+            all_errors.extend(errors)
+
+    start = time.perf_counter()
+    # One thread per session, like Streamlit running each session's script
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        list(executor.map(session, range(args.sessions)))
+    wall = time.perf_counter() - start
+
+    print(
+        f"{len(all_timings)} questions from {args.sessions} sessions in {wall:.2f}s "
+        f"({len(all_timings) / wall:.1f} questions/sec), {len(all_errors)} errors"
+    )
+    for stage in STAGES:
+        values = [timing[stage] for timing in all_timings if stage in timing]
+        if values:
+            print(
+                f"{stage:>15}: p50 {percentile(values, 0.5) * 1000:.1f} ms, "
+                f"p95 {percentile(values, 0.95) * 1000:.1f} ms, "
+                f"max {max(values) * 1000:.1f} ms, total {sum(values):.2f} s"
+            )
+    for error in all_errors[:10]:
+        print(f"error: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,42 @@
-from dotenv import load_dotenv
-import pandas as pd
+import resources
 
-load_dotenv()  ## load all the environment variables
+resources.load_environment()  ## load all the environment variables, once per process
 
 import streamlit as st
-import os
+import queue
 import sqlite3
-import google.generativeai as genai
 
-## Configure genai key
-genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
-
-# Set the database name
-database = "data.db"
-
-# Set model name
-model_name = "gemini-2.0-flash"
+import engine
+from response_cache import get_default_cache
+from streaming import timing_summary
+from pipeline import Pipeline, drain_updates
+import tracing
+from result_profile import unique_labels
+from nl2sql import build_sql_prompt, database, model_name, sql_prompt_identity
 
 
 ## Function to load google gemini model (responsible for giving the query as response)
-def get_gemini_response(question, prompt):
+def get_gemini_response(
+    question, prompt, render=None, on_text=None, cache_prompt=None, trace=None
+):
     try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content([prompt[0], question])
-        return response.text
+        return engine.generate_sql(
+            question,
+            prompt[0],
+            cache_prompt=cache_prompt,
+            render=render,
+            on_text=on_text,
+            trace=trace,
+        )
     except Exception as e:
         st.error(f"Error generating SQL query: {e}")
         return None
 
 
 ## Function to retrieve query from the database
-def read_sql_query(sql, db):
+def read_sql_query(sql, db, trace=None):
     try:
-        conn = sqlite3.connect(db)
-        cur = conn.cursor()
-        cur.execute(sql)
-        rows = cur.fetchall()
-        conn.commit()
-        conn.close()
-        return rows
+        return engine.execute_sql(sql, db, trace=trace)
     except sqlite3.Error as e:
         st.error(f"Database error: {e}")
         return None
@@ -47,99 +45,44 @@ def read_sql_query(sql, db):
         return None
 
 
-# Function to interpret data using Gemini
-def interpret_data_with_gemini(data, query):
-    try:
-        data_str = "\n".join([str(row) for row in data])
-        # Construct a new prompt specifically for interpreting the data
-        if len(data) == 1 and len(data[0]) == 1:
-            # Handle single-value results separately
-            interpretation_prompt = f"""
-            You are an expert data analyst. Given the result of the following query:
-
-            Result:
-            {data_str}
-
-            Please explain what this result means in simple terms. Add any useful recommendations based on the query's context. 
-            Provide actionable insights if applicable.
-            Avoid using complex formatting..
-
-            """
-        else:
-            # Handle larger result sets normally
-            interpretation_prompt = f"""
-            You are an expert data analyst. Given the following data, provide a detailed summary of the key insights:
-
-            Data:
-            {data_str}
-
-            Please describe the key observations, trends, and provide any interesting insights that could help the user to better understand the data.
-            Use simple formatting and avoid unnecessary italics or fancy visual representations. 
-            """
-
-            #
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content([query, interpretation_prompt])
-        return response.text
-    except Exception as e:
-        print("e", e)
-        st.error(f"Error interpreting the data: {e}")
-        return None
-
-
-## Define your prompt to generate SQL
-prompt = [
-    """
-You are an expert in converting English questions to SQL queries!
-The database has the following table:
-
- The table `BILLIONAIRES_DATA` contains information about billionaires and has the following columns:
-- rank (INTEGER)- The ranking of the billionaire in terms of wealth. e.g. 1
-- category (VARCHAR) - The category or industry in which the billionaire's business operates. e.g. "Technology"
-- person_name (VARCHAR) - The full name of the billionaire.e.g. "Elon Musk"
-- country (VARCHAR) -  The country in which the billionaire resides. e.g. "United States"
-- city (VARCHAR) - The city in which the billionaire resides. e.g. "Austin"
-- source (VARCHAR) - The source of the billionaire's wealth. e.g. "Tesla, SpaceX"
-- industries (VARCHAR) - The industries associated with the billionaire's business interests. e.g. "Automotive"
-- country_of_citizenship (VARCHAR) - The country of citizenship of the billionaire. e.g. "United States"
-- organization (VARCHAR) - The name of the organization or company associated with the billionaire. e.g. "Tesla"
-- self_made (BOOLEAN)- Indicates whether the billionaire is self-made (True/False). e.g. True
-- status (VARCHAR) -  "D" represents self-made billionaires (Founders/Entrepreneurs) and "U" indicates inherited or unearned wealth. e.g. "U" or "D" 
-- gender (VARCHAR) - The gender of the billionaire. e.g. "M" (Male)
-- title (VARCHAR) - The title or honorific of the billionaire. e.g. "CEO"
-- birth_year (INTEGER) - The birth year of the billionaire. e.g. 1971
-
-Important Notes:
-1. The billionaires data is from the year 2023.
-
-For example:
-
-Example 1 - What is the total number of billionaires from the United States? The SQL command will be:
-SELECT COUNT(*) FROM BILLIONAIRES_DATA WHERE country = "United States";
-
-Example 2 - Find the number of billionaires in each industry. The SQL command will be:
-SELECT industries, COUNT(*) AS num_billionaires FROM BILLIONAIRES_DATA GROUP BY industries;
-
-Example 3 - How many billionaires have inherited their wealth? The SQL command will be:
-SELECT COUNT(*) FROM BILLIONAIRES_DATA WHERE status = "U";
-
-Example 4 - List the top 5 billionaires along with their organization and title. The SQL command will be:
-SELECT * FROM BILLIONAIRES_DATA ORDER BY rank LIMIT 5;
-
-Note: 
-1. The SQL command should be presented without backticks (```), Markdown formatting, or the word 'sql' at the beginning or end.
-2. The query should only include valid SQL syntax.
-3. Always use double quotes for string values if necessary.
-4. Do not provide the SQL command with starting with ```sql
-
-"""
-]
+# Drop cached responses generated by an older prompt (e.g. after a schema change)
+# or another model. Only done once per process, not on every rerun.
+@st.cache_resource
+def invalidate_stale_responses(prompt_text, model):
+    return get_default_cache().retain_only(prompt_text, model)
 
 
 ## Streamlit App
 st.set_page_config(page_title="Gemini to SQL Query Generator", layout="centered")
 st.header("Query SQL database with Google Gemini")
 
+# Build the model client, database handles and heavy imports in the
+# background while the first page renders
+resources.start_warm_up("main")
+
+invalidate_stale_responses(sql_prompt_identity(), model_name)
+
+with st.sidebar:
+    st.subheader("Response cache")
+    cache_stats = get_default_cache().stats()
+    st.caption(
+        f"Hits: {cache_stats['memory_hits']} memory / {cache_stats['disk_hits']} disk, "
+        f"misses: {cache_stats['misses']}, entries: {cache_stats['disk_entries']}"
+    )
+    if st.button("Clear response cache"):
+        get_default_cache().invalidate()
+
+    st.subheader("Model latency")
+    for stage, timing in timing_summary().items():
+        st.caption(
+            f"{stage}: {timing['calls']} calls, first token {timing['ttft']:.2f} s, "
+            f"total {timing['total']:.2f} s"
+        )
+
+    st.subheader("Stage latency")
+    for stage, stats in tracing.stage_summary("main").items():
+        st.caption(tracing.format_stage(stage, stats))
+
 question = st.text_input("Enter your question: ", key="input")
 
 submitButtonClick = st.button("Retrieve Response")
@@ -155,41 +98,155 @@ if submitButtonClick:
             "Please enter a valid question to generate a query."
         )
     else:
+        trace = tracing.Trace("main", question)
+        sql_placeholder = st.empty()
+
+        def render_sql(text):
+            with sql_placeholder.container():
+                st.subheader("Generated SQL Query")
+                st.code(text, language="sql")
+
+        # Validate the statement as soon as the stream completes it, while
+        # any trailing tokens are still arriving
+        validation = {}
+
+        def validate_when_complete(text):
+            if "sql" not in validation and sqlite3.complete_statement(text):
+                validation["sql"] = text
+                validation["error"] = engine.check_sql(text, database)
+
         # Get the SQL query from Gemini response
-        sql_query = get_gemini_response(question, prompt)
+        with trace.span("prompt") as stage:
+            sql_prompt, prompt_report = build_sql_prompt(question)
+            stage["examples"] = prompt_report["examples"]
+        sql_query = get_gemini_response(
+            question,
+            [sql_prompt],
+            render=render_sql,
+            on_text=validate_when_complete,
+            cache_prompt=sql_prompt_identity(),
+            trace=trace,
+        )
 
         if sql_query:
-            st.subheader("Generated SQL Query")
-            st.code(sql_query, language="sql")
+            render_sql(sql_query)
+            st.caption(
+                f"Prompt: {prompt_report['tokens']} tokens with "
+                f"{prompt_report['examples']} {prompt_report['mode']} examples "
+                f"(selected in {prompt_report['select_seconds'] * 1000:.2f} ms)"
+            )
+            if validation.get("sql") != sql_query:
+                validation["error"] = engine.check_sql(sql_query, database)
 
             # Execute the SQL query and retrieve data
-            rows = read_sql_query(sql_query, database)
+            if validation["error"]:
+                st.error(f"Database error: {validation['error']}")
+                result = None
+            else:
+                result = read_sql_query(sql_query, database, trace=trace)
+
+            if result and result.rows:
+                # Dispatch the slow follow-up work the moment rows are available,
+                # so it overlaps with rendering the result
+                pipeline = Pipeline()
+                interpretation_updates = queue.Queue()
+                interpretation_future = pipeline.submit(
+                    "interpretation",
+                    engine.interpret_result,
+                    result,
+                    question,
+                    render=interpretation_updates.put,
+                    trace=trace,
+                )
+                if result.truncated:
+                    pipeline.submit(
+                        "row_count",
+                        engine.count_result_rows,
+                        sql_query,
+                        database,
+                        trace=trace,
+                    )
 
-            if rows:
                 # Display the result as a DataFrame for better presentation
                 st.subheader("Query Result")
-                try:
-                    # Convert rows to a DataFrame for easy visualization
-                    conn = sqlite3.connect(database)
-                    cur = conn.cursor()
-                    cur.execute(sql_query)
-                    columns = [desc[0] for desc in cur.description]
-                    conn.close()
-                    df = pd.DataFrame(rows, columns=columns)
-
-                    st.dataframe(df)  # Display DataFrame in a nice UI
-                except Exception as e:
-                    st.error(f"Error displaying data: {e}")
+                with pipeline.measure("render_dataframe"):
+                    try:
+                        import pandas as pd
+
+                        # Convert rows to a DataFrame for easy visualization
+                        with trace.span("result_conversion", rows=result.row_count):
+                            df = pd.DataFrame(
+                                result.rows, columns=unique_labels(result.columns)
+                            )
+
+                        with trace.span("render_dataframe"):
+                            st.dataframe(df)  # Display DataFrame in a nice UI
+                        st.caption(
+                            f"{result.row_count} rows in {result.elapsed * 1000:.1f} ms"
+                        )
+                        if result.plan and result.plan["engine"] == "columnar":
+                            st.caption("Answered by the in-memory columnar engine")
+                        if result.plan and result.plan["rollup"]:
+                            st.caption(
+                                f"Answered from the {result.plan['rollup']} summary table"
+                            )
+                        if result.plan and result.plan["warnings"]:
+                            st.caption(
+                                "Query plan: " + "; ".join(result.plan["warnings"])
+                            )
+                    except Exception as e:
+                        st.error(f"Error displaying data: {e}")
+
+                if result.truncated:
+                    try:
+                        total_rows = f"{pipeline.result('row_count'):,}"
+                    except sqlite3.Error:
+                        total_rows = "more"
+                    st.warning(
+                        f"Showing the first {result.max_rows} rows only; "
+                        f"the query returned {total_rows} rows."
+                    )
 
                 # Use Gemini to interpret the retrieved data
-                interpretation = interpret_data_with_gemini(rows, question)
+                interpretation_placeholder = st.empty()
+
+                def render_interpretation(text):
+                    with interpretation_placeholder.container():
+                        st.subheader("Gemini's Interpretation of the Data")
+                        st.write(text)
+
+                drain_updates(
+                    interpretation_updates,
+                    interpretation_future,
+                    render_interpretation,
+                )
+                interpretation, report = interpretation_future.result()
                 if interpretation:
-                    st.subheader("Gemini's Interpretation of the Data")
-                    st.write(interpretation)
+                    render_interpretation(interpretation)
+                    st.caption(
+                        f"Sent {report['tokens']} of {report['raw_tokens']} raw tokens "
+                        f"({report['mode']}, profiled in "
+                        f"{report['profile_seconds'] * 1000:.1f} ms); "
+                        f"first token after {report['first_token_seconds']:.2f} s, "
+                        f"model answered in {report['model_seconds']:.2f} s"
+                    )
+                else:
+                    interpretation_placeholder.empty()
+                    st.error(
+                        f"Error interpreting the data: {report.get('error', 'no response')}"
+                    )
+
+                pipeline_report = pipeline.report()
+                st.caption(
+                    f"Result stages took {pipeline_report['wall_seconds']:.2f} s end to end "
+                    f"({pipeline_report['stage_seconds']:.2f} s if run one after another)"
+                )
 
             else:
                 message_placeholder.info("No results found for the given query.")
         else:
+            sql_placeholder.empty()
             message_placeholder.error(
                 "Failed to generate a valid SQL query. Please try again."
             )
+        trace.finish()
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+# live calls the API directly; record calls it and saves every exchange;
+# replay serves saved exchanges without network access or an API key
+MODEL_MODE = os.getenv("MODEL_MODE", "live")
+
+# Directory holding one JSONL file of recorded exchanges per model
+RECORDINGS_DIR = os.getenv("MODEL_RECORDINGS_DIR", "recordings")
+
+# Synthetic latency added in replay mode (milliseconds): the delay before the
+# first chunk, the jitter applied to it, and the delay between streamed chunks
+REPLAY_LATENCY_MS = float(os.getenv("MODEL_REPLAY_LATENCY_MS", 0))
+REPLAY_JITTER_MS = float(os.getenv("MODEL_REPLAY_JITTER_MS", 0))
+REPLAY_CHUNK_MS = float(os.getenv("MODEL_REPLAY_CHUNK_MS", 0))
+
+
+class RecordingNotFound(KeyError):
+    pass
+
+
+## Function to turn request contents (strings, SDK parts, lists) into JSON data
+def serialize_content(content):
+    if isinstance(content, (str, int, float, bool)) or content is None:
+        return content
+    if isinstance(content, dict):
+        return {key: serialize_content(value) for key, value in content.items()}
+    if isinstance(content, (list, tuple)):
+        return [serialize_content(item) for item in content]
+    return part_to_dict(content)
+
+
+## Function to convert an SDK part (Vertex wrapper or proto-plus message) to a dict
+def part_to_dict(part):
+    to_dict = getattr(part, "to_dict", None)
+    if callable(to_dict):
+        return to_dict()
+    try:
+        return type(part).to_dict(part)
+    except (AttributeError, TypeError):
+        return str(part)
+
+
+## Function to capture the text and function calls of one response or chunk
+def serialize_response(response):
+    chunk = {"text": "", "function_calls": []}
+    candidates = getattr(response, "candidates", None) or []
+    if not candidates:
+        return chunk
+    for part in candidates[0].content.parts:
+        data = part_to_dict(part)
+        if not isinstance(data, dict):
+            continue
+        if data.get("function_call"):
+            call = data["function_call"]
+            chunk["function_calls"].append(
+                {"name": call.get("name"), "args": call.get("args") or {}}
+            )
+        elif data.get("text"):
+            chunk["text"] += data["text"]
+    return chunk
+
+
+class ReplayFunctionCall:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+
+class ReplayPart:
+    def __init__(self, text=None, function_call=None):
+        self.text = text
+        self.function_call = function_call
+
+    def to_dict(self):
+        if self.function_call is not None:
+            return {
+                "function_call": {
+                    "name": self.function_call.name,
+                    "args": self.function_call.args,
+                }
+            }
+        return {"text": self.text}
+
+
+class ReplayContent:
+    def __init__(self, parts):
+        self.parts = parts
+
+
+class ReplayCandidate:
+    def __init__(self, content):
+        self.content = content
+
+
+class ReplayResponse:
+    def __init__(self, chunk):
+        parts = [
+            ReplayPart(function_call=ReplayFunctionCall(call["name"], call["args"]))
+            for call in chunk["function_calls"]
+        ]
+        if chunk["text"]:
+            parts.append(ReplayPart(text=chunk["text"]))
+        self.candidates = [ReplayCandidate(ReplayContent(parts))]
+        self._text = chunk["text"]
+
+    @property
+    def text(self):
+        # Mirrors the SDKs, which refuse .text on a pure function-call response
+        if not self._text:
+            raise ValueError("Response has no text parts")
+        return self._text
+
+
+class RecordingStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._exchanges = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    if line.strip():
+                        exchange = json.loads(line)
+                        self._exchanges[exchange["key"]] = exchange["chunks"]
+
+    def get(self, key):
+        with self._lock:
+            chunks = self._exchanges.get(key)
+        if chunks is None:
+            raise RecordingNotFound(f"No recorded model response for request {key}")
+        return chunks
+
+    def put(self, key, request, chunks):
+        with self._lock:
+            self._exchanges[key] = chunks
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as file:
+                file.write(
+                    json.dumps({"key": key, "request": request, "chunks": chunks})
+                    + "\n"
+                )
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+## Function to get the shared recording store of a model
+def get_store(model_name):
+    path = os.path.join(RECORDINGS_DIR, model_name.replace("/", "_") + ".jsonl")
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = RecordingStore(path)
+            _stores[path] = store
+        return store
+
+
+## Function to derive a stable key for a request
+def request_key(model_name, request):
+    payload = json.dumps(
+        {"model": model_name, "request": request}, sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+## Function to sleep for the configured synthetic latency
+def synthetic_delay(milliseconds, jitter_milliseconds=0):
+    delay = milliseconds + random.uniform(-jitter_milliseconds, jitter_milliseconds)
+    if delay > 0:
+        time.sleep(delay / 1000)
+
+
+## Function to replay recorded chunks with synthetic latency
+def replay_chunks(chunks, stream):
+    synthetic_delay(REPLAY_LATENCY_MS, REPLAY_JITTER_MS)
+    if not stream:
+        merged = {
+            "text": "".join(chunk["text"] for chunk in chunks),
+            "function_calls": [
+                call for chunk in chunks for call in chunk["function_calls"]
+            ],
+        }
+        return ReplayResponse(merged)
+
+    def generate():
+        for index, chunk in enumerate(chunks):
+            if index:
+                synthetic_delay(REPLAY_CHUNK_MS)
+            yield ReplayResponse(chunk)
+
+    return generate()
+
+
+## Function to call the live API in record mode, saving what came back
+def record_call(store, key, request, call, stream):
+    if not stream:
+        response = call()
+        store.put(key, request, [serialize_response(response)])
+        return response
+
+    def generate():
+        chunks = []
+        for chunk in call():
+            chunks.append(serialize_response(chunk))
+            yield chunk
+        store.put(key, request, chunks)
+
+    return generate()
+
+
+class ModelClient:
+    def __init__(self, model_name, live_model=None, mode=MODEL_MODE):
+        self.model_name = model_name
+        self.mode = mode
+        self.live_model = live_model
+        self.store = None if mode == "live" else get_store(model_name)
+
+    def generate_content(self, contents, stream=False):
+        if self.mode == "live":
+            return self.live_model.generate_content(contents, stream=stream)
+        request = {"contents": serialize_content(contents)}
+        key = request_key(self.model_name, request)
+        if self.mode == "replay":
+            return replay_chunks(self.store.get(key), stream)
+        return record_call(
+            self.store,
+            key,
+            request,
+            lambda: self.live_model.generate_content(contents, stream=stream),
+            stream,
+        )
+
+    def start_chat(self):
+        if self.mode == "live":
+            return self.live_model.start_chat()
+        live_chat = self.live_model.start_chat() if self.mode == "record" else None
+        return ChatClient(self, live_chat)
+
+
+class ChatClient:
+    def __init__(self, client, live_chat):
+        self.client = client
+        self.live_chat = live_chat
+        # Keys include the whole conversation so far, so each turn replays
+        # the answer that was given at that point of the recorded session
+        self.history = []
+
+    def send_message(self, message, stream=False):
+        self.history.append({"role": "user", "content": serialize_content(message)})
+        request = {"history": list(self.history)}
+        key = request_key(self.client.model_name, request)
+        if self.client.mode == "replay":
+            chunks = self.client.store.get(key)
+            self._remember(chunks)
+            return replay_chunks(chunks, stream)
+
+        if not stream:
+            response = self.live_chat.send_message(message)
+            chunks = [serialize_response(response)]
+            self.client.store.put(key, request, chunks)
+            self._remember(chunks)
+            return response
+
+        def generate():
+            chunks = []
+            for chunk in self.live_chat.send_message(message, stream=True):
+                chunks.append(serialize_response(chunk))
+                yield chunk
+            self.client.store.put(key, request, chunks)
+            self._remember(chunks)
+
+        return generate()
+
+    def _remember(self, chunks):
+        self.history.append({"role": "model", "content": chunks})
+
+
+## Function to configure google.generativeai from the environment for command-line tools
+def configure_genai(mode=MODEL_MODE):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    if mode != "replay":
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
+
+
+## Function to create a model for main.py (google.generativeai) or the chat app (vertexai)
+def get_model(model_name, backend="genai", mode=MODEL_MODE, **kwargs):
+    live_model = None
+    if mode != "replay":
+        if backend == "vertex":
+            from vertexai.generative_models import GenerativeModel
+
+            live_model = GenerativeModel(model_name, **kwargs)
+        else:
+            import google.generativeai as genai
+
+            live_model = genai.GenerativeModel(model_name, **kwargs)
+        if mode == "live":
+            return live_model
+    return ModelClient(model_name, live_model=live_model, mode=mode)
@@ -0,0 +1,125 @@
+# Shared settings and prompts for the billionaires NL-to-SQL pipeline, used by
+# the Streamlit app (main.py) and the offline tools (benchmark.py, load_test.py)
+
+from example_bank import FEW_SHOT_MODE, bank_fingerprint, format_examples, get_bank
+from result_profile import estimate_tokens, profile_result
+
+# Set the database name
+database = "data.db"
+
+# Set model name
+model_name = "gemini-2.0-flash"
+
+
+## Define your prompt to generate SQL
+prompt_header = """
+You are an expert in converting English questions to SQL queries!
+The database has the following table:
+
+ The table `BILLIONAIRES_DATA` contains information about billionaires and has the following columns:
+- rank (INTEGER)- The ranking of the billionaire in terms of wealth. e.g. 1
+- category (VARCHAR) - The category or industry in which the billionaire's business operates. e.g. "Technology"
+- person_name (VARCHAR) - The full name of the billionaire.e.g. "Elon Musk"
+- country (VARCHAR) -  The country in which the billionaire resides. e.g. "United States"
+- city (VARCHAR) - The city in which the billionaire resides. e.g. "Austin"
+- source (VARCHAR) - The source of the billionaire's wealth. e.g. "Tesla, SpaceX"
+- industries (VARCHAR) - The industries associated with the billionaire's business interests. e.g. "Automotive"
+- country_of_citizenship (VARCHAR) - The country of citizenship of the billionaire. e.g. "United States"
+- organization (VARCHAR) - The name of the organization or company associated with the billionaire. e.g. "Tesla"
+- self_made (BOOLEAN)- Indicates whether the billionaire is self-made (True/False). e.g. True
+- status (VARCHAR) -  "D" represents self-made billionaires (Founders/Entrepreneurs) and "U" indicates inherited or unearned wealth. e.g. "U" or "D" 
+- gender (VARCHAR) - The gender of the billionaire. e.g. "M" (Male)
+- title (VARCHAR) - The title or honorific of the billionaire. e.g. "CEO"
+- birth_year (INTEGER) - The birth year of the billionaire. e.g. 1971
+
+Important Notes:
+1. The billionaires data is from the year 2023.
+
+For example:
+
+"""
+
+# Examples used by the static prompt (also the first entries of the example bank)
+static_examples = """Example 1 - What is the total number of billionaires from the United States? The SQL command will be:
+SELECT COUNT(*) FROM BILLIONAIRES_DATA WHERE country = "United States";
+
+Example 2 - Find the number of billionaires in each industry. The SQL command will be:
+SELECT industries, COUNT(*) AS num_billionaires FROM BILLIONAIRES_DATA GROUP BY industries;
+
+Example 3 - How many billionaires have inherited their wealth? The SQL command will be:
+SELECT COUNT(*) FROM BILLIONAIRES_DATA WHERE status = "U";
+
+Example 4 - List the top 5 billionaires along with their organization and title. The SQL command will be:
+SELECT * FROM BILLIONAIRES_DATA ORDER BY rank LIMIT 5;
+
+"""
+
+prompt_notes = """Note: 
+1. The SQL command should be presented without backticks (```), Markdown formatting, or the word 'sql' at the beginning or end.
+2. The query should only include valid SQL syntax.
+3. Always use double quotes for string values if necessary.
+4. Do not provide the SQL command with starting with ```sql
+
+"""
+
+prompt = [prompt_header + static_examples + prompt_notes]
+
+
+## Function to build the SQL prompt for a question, with retrieved or static examples
+def build_sql_prompt(question, mode=FEW_SHOT_MODE):
+    if mode == "static":
+        text = prompt[0]
+        report = {"mode": mode, "examples": 4, "select_seconds": 0.0}
+    else:
+        examples, report = get_bank().select(question)
+        text = prompt_header + format_examples(examples) + prompt_notes
+        report["mode"] = mode
+    report["tokens"] = estimate_tokens(text)
+    return text, report
+
+
+## Function to identify the SQL prompt template, used to key cached responses
+def sql_prompt_identity(mode=FEW_SHOT_MODE):
+    if mode == "static":
+        return prompt[0]
+    # Retrieved examples follow from the question and the bank, so the
+    # template plus the bank contents identify the prompt
+    return prompt_header + prompt_notes + "\nExample bank " + bank_fingerprint()
+
+
+## Function to build the prompt that asks the model to interpret a query result
+def build_interpretation_prompt(result):
+    # Large results are summarised locally so the prompt stays within budget
+    data_str, report = profile_result(result.columns, result.rows, result.truncated)
+    data = result.rows
+    # Construct a new prompt specifically for interpreting the data
+    if len(data) == 1 and len(data[0]) == 1:
+        # Handle single-value results separately
+        interpretation_prompt = f"""
+        You are an expert data analyst. Given the result of the following query:
+
+        Result:
+        {data_str}
+
+        Please explain what this result means in simple terms. Add any useful recommendations based on the query's context. 
+        Provide actionable insights if applicable.
+        Avoid using complex formatting..
+
+        """
+    else:
+        # Handle larger result sets normally
+        data_label = (
+            "Data summary (statistics, top values, group totals and sample rows)"
+            if report["mode"] == "digest"
+            else "Data"
+        )
+        interpretation_prompt = f"""
+        You are an expert data analyst. Given the following data, provide a detailed summary of the key insights:
+
+        {data_label}:
+        {data_str}
+
+        Please describe the key observations, trends, and provide any interesting insights that could help the user to better understand the data.
+        Use simple formatting and avoid unnecessary italics or fancy visual representations. 
+        """
+    return interpretation_prompt, report
@@ -0,0 +1,78 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Maximum number of pipeline stages running in the background at the same time
+MAX_PIPELINE_WORKERS = int(os.getenv("MAX_PIPELINE_WORKERS", 4))
+
+_executor = ThreadPoolExecutor(
+    max_workers=MAX_PIPELINE_WORKERS, thread_name_prefix="pipeline"
+)
+
+
+class Pipeline:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._futures = {}
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    ## Start a stage on a background worker as soon as its inputs are ready
+    def submit(self, name, fn, *args, **kwargs):
+        def run():
+            with self.measure(name):
+                return fn(*args, **kwargs)
+
+        future = _executor.submit(run)
+        self._futures[name] = future
+        return future
+
+    def result(self, name, timeout=None):
+        return self._futures[name].result(timeout)
+
+    def has(self, name):
+        return name in self._futures
+
+    ## Time a stage that runs on the calling thread (e.g. Streamlit rendering)
+    @contextmanager
+    def measure(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self._timings[name] = {
+                    "start": start - self.start,
+                    "end": end - self.start,
+                    "seconds": end - start,
+                }
+
+    def report(self):
+        with self._lock:
+            timings = dict(self._timings)
+        return {
+            "stages": timings,
+            "wall_seconds": time.perf_counter() - self.start,
+            "stage_seconds": sum(timing["seconds"] for timing in timings.values()),
+        }
+
+
+## Function to render updates pushed by a background stage until it finishes
+def drain_updates(updates, future, render, poll_seconds=0.05):
+    latest = None
+    while True:
+        try:
+            latest = updates.get(timeout=poll_seconds)
+        except queue.Empty:
+            if future.done() and updates.empty():
+                break
+            continue
+        # Skip intermediate states that were superseded while we waited
+        while not updates.empty():
+            latest = updates.get_nowait()
+        render(latest)
+    return latest
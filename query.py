@@ -3,12 +3,6 @@ import sqlite3
 # Set the database name
 database = "data.db"
 
-# Connect to SQLite
-connection = sqlite3.connect(database)
-
-# Create a cursor object to interact with the database
-cursor = connection.cursor()
-
 # Define multiple SQL queries for the demo
 queries = [
     {
@@ -94,36 +88,49 @@ queries = [
     },
 ]
 
-# Interactive menu to execute one query at a time
-while True:
-    # Display the available queries to the user
-    print("\nAvailable Queries:")
-    for i, q in enumerate(queries):
-        print(f"{i + 1}. {q['description']}")
 
-    # Ask the user to select a query to execute
-    try:
-        choice = int(
-            input("\nEnter the number of the query you want to execute (0 to exit): ")
-        )
-        if choice == 0:
-            break
-        elif 1 <= choice <= len(queries):
-            selected_query = queries[choice - 1]
-            print(f"\nExecuting: {selected_query['description']}")
+## Function to run the interactive menu
+def main():
+    # Connect to SQLite
+    connection = sqlite3.connect(database)
+
+    # Create a cursor object to interact with the database
+    cursor = connection.cursor()
+
+    # Interactive menu to execute one query at a time
+    while True:
+        # Display the available queries to the user
+        print("\nAvailable Queries:")
+        for i, q in enumerate(queries):
+            print(f"{i + 1}. {q['description']}")
+
+        # Ask the user to select a query to execute
+        try:
+            choice = int(
+                input("\nEnter the number of the query you want to execute (0 to exit): ")
+            )
+            if choice == 0:
+                break
+            elif 1 <= choice <= len(queries):
+                selected_query = queries[choice - 1]
+                print(f"\nExecuting: {selected_query['description']}")
+
+                # Execute the selected query
+                data = cursor.execute(selected_query["query"])
+                rows = data.fetchall()
+
+                # Display the results
+                for row in rows:
+                    print(row)
+                print(f"Total rows: {len(rows)}")
+            else:
+                print("Invalid choice. Please enter a number between 0 and", len(queries))
+        except ValueError:
+            print("Invalid input. Please enter a valid number.")
 
-            # Execute the selected query
-            data = cursor.execute(selected_query["query"])
-            rows = data.fetchall()
+    # Close the database connection
+    connection.close()
 
-            # Display the results
-            for row in rows:
-                print(row)
-            print(f"Total rows: {len(rows)}")
-        else:
-            print("Invalid choice. Please enter a number between 0 and", len(queries))
-    except ValueError:
-        print("Invalid input. Please enter a valid number.")
 
-# Close the database connection
-connection.close()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from query_runner import MAX_RESULT_ROWS, run_query
+from result_cache import canonicalize_sql
+from rollups import ROLLUP_REWRITE, ROLLUP_TABLE, rewrite_query, rollups_available
+from schema_catalog import get_catalog
+from workload_log import log_query
+
+# Wall-clock budget for a single generated statement, in seconds
+MAX_QUERY_SECONDS = float(os.getenv("MAX_QUERY_SECONDS", 10))
+
+# Budget of SQLite virtual machine steps for a single generated statement
+MAX_VM_STEPS = int(os.getenv("MAX_VM_STEPS", 200_000_000))
+
+# Statements whose plan is estimated to visit more rows than this are refused
+MAX_ESTIMATED_ROWS = int(os.getenv("MAX_ESTIMATED_ROWS", 50_000_000))
+
+# Number of VM steps between two checks of the budget
+PROGRESS_INTERVAL = 10000
+
+# Set COLUMNAR_ENGINE=1 to answer supported single-table queries from memory;
+# the engine (and pandas) is only imported when it is enabled
+COLUMNAR_ENGINE = os.getenv("COLUMNAR_ENGINE", "0").lower() in ("1", "true", "yes")
+
+_plan_step = re.compile(r"^(SCAN|SEARCH) (\S+)")
+
+# Words that can follow a table name in FROM/JOIN without being its alias
+_not_aliases = {
+    "as", "on", "using", "where", "join", "inner", "left", "right", "full",
+    "cross", "natural", "outer", "group", "order", "having", "limit", "offset",
+    "union", "except", "intersect", "window", "indexed", "not",
+}
+
+
+class QueryRejected(sqlite3.OperationalError):
+    pass
+
+
+class QueryCancelled(sqlite3.OperationalError):
+    pass
+
+
+## Function to get the query plan as (id, parent, detail) rows
+def plan_query(conn, sql):
+    return [
+        (row[0], row[1], row[3])
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql.strip().rstrip(";"))
+    ]
+
+
+## Function to map the aliases in a statement (FROM Track t, Album AS a) to their tables
+def table_aliases(sql, table_names):
+    tables = {name.lower() for name in table_names}
+    tokens = re.findall(
+        r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\[[^\]]*\]|`[^`]*`|[\w.]+|\S",
+        canonicalize_sql(sql),
+    )
+    aliases = {}
+    for i, token in enumerate(tokens):
+        table = token.rpartition(".")[2].strip('"[]`').lower()
+        if table not in tables:
+            continue
+        j = i + 1
+        if j < len(tokens) and tokens[j].lower() == "as":
+            j += 1
+        if (
+            j < len(tokens)
+            and re.match(r"^[A-Za-z_\"\[`]", tokens[j])
+            and tokens[j].lower() not in _not_aliases
+        ):
+            aliases[tokens[j].strip('"[]`').lower()] = table
+    return aliases
+
+
+## Function to flag full scans and nested full scans (cartesian products) in a plan
+# The plan names aliased tables by their alias; scans of anything still unknown
+# (a subquery or CTE) are counted as the largest table rather than ignored
+def analyze_plan(plan, row_counts, aliases=None):
+    row_counts = {name.lower(): count for name, count in row_counts.items()}
+    aliases = aliases or {}
+    largest = max(row_counts.values(), default=0)
+    full_scans = []
+    scans_by_parent = {}
+    for _, parent, detail in plan:
+        match = _plan_step.match(detail)
+        if not match:
+            continue
+        operation, table = match.groups()
+        if operation != "SCAN" or detail.startswith("SCAN CONSTANT ROW"):
+            continue
+        name = table.lower()
+        rows = row_counts.get(name, row_counts.get(aliases.get(name)))
+        full_scans.append(
+            {
+                "table": table,
+                "rows": largest if rows is None else rows,
+                "estimated": rows is None,
+                "detail": detail,
+            }
+        )
+        scans_by_parent.setdefault(parent, []).append(full_scans[-1]["rows"])
+
+    # Full scans under the same parent run as nested loops, so their row
+    # counts multiply; a cross join shows up exactly like this
+    estimated_rows = 0
+    nested_scans = 0
+    for rows in scans_by_parent.values():
+        product = 1
+        for count in rows:
+            product *= max(count, 1)
+        estimated_rows = max(estimated_rows, product)
+        if len(rows) > 1:
+            nested_scans += 1
+
+    warnings = [
+        f"full scan of {scan['table']} "
+        f"({'up to ' if scan['estimated'] else ''}{scan['rows']:,} rows)"
+        for scan in full_scans
+    ]
+    if nested_scans:
+        warnings.append(
+            f"nested full scans (cartesian product) of about {estimated_rows:,} rows"
+        )
+    return {
+        "full_scans": full_scans,
+        "nested_scans": nested_scans,
+        "estimated_rows": estimated_rows,
+        "warnings": warnings,
+    }
+
+
+## Function to check if a statement already has a LIMIT outside any subquery
+def has_top_level_limit(sql):
+    canonical = canonicalize_sql(sql)
+    depth = 0
+    words = []
+    for token in re.findall(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\[[^\]]*\]|\w+|.", canonical):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0:
+            words.append(token.lower())
+    return "limit" in words
+
+
+## Function to add a LIMIT to a read statement that has none
+def add_limit(sql, limit):
+    canonical = canonicalize_sql(sql)
+    if not re.match(r"^(select|with)\b", canonical, re.IGNORECASE):
+        return sql
+    if has_top_level_limit(canonical):
+        return sql
+    return f"{canonical} LIMIT {limit}"
+
+
+## Context manager that cancels a statement once it runs out of time or VM steps
+@contextmanager
+def execution_budget(conn, seconds=MAX_QUERY_SECONDS, steps=MAX_VM_STEPS):
+    deadline = time.perf_counter() + seconds
+    state = {"steps": 0, "reason": None}
+
+    def check_budget():
+        state["steps"] += PROGRESS_INTERVAL
+        if time.perf_counter() > deadline:
+            state["reason"] = f"exceeded the {seconds:g} s time limit"
+        elif state["steps"] > steps:
+            state["reason"] = f"exceeded the budget of {steps:,} SQLite steps"
+        # A non-zero return value makes SQLite interrupt the statement
+        return 1 if state["reason"] else 0
+
+    conn.set_progress_handler(check_budget, PROGRESS_INTERVAL)
+    try:
+        yield state
+    except sqlite3.OperationalError as e:
+        if state["reason"]:
+            raise QueryCancelled(
+                f"Query cancelled: it {state['reason']}. Try a more selective query "
+                "or add filters and a LIMIT."
+            ) from e
+        raise
+    finally:
+        # Pooled connections are shared, so never leave the handler installed
+        conn.set_progress_handler(None, 0)
+
+
+## Function to admit, limit and run a generated query within its budget
+def guarded_query(conn, db_path, sql, max_rows=MAX_RESULT_ROWS, rewrite=ROLLUP_REWRITE):
+    row_counts = {
+        name: info["row_count"] for name, info in get_catalog(db_path).tables.items()
+    }
+    logged_sql = sql
+    if COLUMNAR_ENGINE:
+        from columnar import Unsupported, columnar_query
+
+        try:
+            result = columnar_query(conn, db_path, sql, max_rows=max_rows)
+        except Unsupported:
+            pass
+        else:
+            result.plan = {
+                "engine": "columnar",
+                "steps": [],
+                "warnings": [],
+                "estimated_rows": None,
+                "limit_added": False,
+                "rollup": None,
+                "sql": sql,
+            }
+            log_query(db_path, logged_sql, result)
+            return result
+
+    rollup = None
+    if rewrite:
+        rewritten = rewrite_query(sql)
+        if rewritten is not None and rollups_available(conn):
+            sql, rollup = rewritten, ROLLUP_TABLE
+    steps = plan_query(conn, sql)
+    plan = analyze_plan(steps, row_counts, table_aliases(sql, row_counts))
+    plan["steps"] = [detail for _, _, detail in steps]
+    if plan["estimated_rows"] > MAX_ESTIMATED_ROWS:
+        raise QueryRejected(
+            "Query refused: its plan would visit about "
+            f"{plan['estimated_rows']:,} rows ({'; '.join(plan['warnings'])}). "
+            "Add join conditions or filters."
+        )
+
+    # One row past the cap lets run_query still report truncation
+    limited_sql = add_limit(sql, max_rows + 1)
+    plan["limit_added"] = limited_sql != sql
+    plan["rollup"] = rollup
+    plan["engine"] = "sqlite"
+    plan["sql"] = sql
+    with execution_budget(conn):
+        result = run_query(conn, limited_sql, max_rows=max_rows)
+    result.plan = plan
+    # Feeds the index advisor with the workload the model actually generates
+    log_query(db_path, logged_sql, result)
+    return result
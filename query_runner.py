@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+
+# Maximum number of rows pulled into memory for a single query
+MAX_RESULT_ROWS = int(os.getenv("MAX_RESULT_ROWS", 10000))
+
+# Number of rows requested from SQLite per fetchmany call
+FETCH_BATCH_SIZE = 500
+
+_sqlite_type_names = {
+    int: "INTEGER",
+    float: "REAL",
+    str: "TEXT",
+    bytes: "BLOB",
+}
+
+
+@dataclass
+class QueryResult:
+    columns: list
+    column_types: list
+    rows: list
+    elapsed: float
+    truncated: bool = False
+    max_rows: int = MAX_RESULT_ROWS
+    # Admission report from query_guard (full scans, estimated rows, LIMIT added)
+    plan: dict = None
+
+    @property
+    def row_count(self):
+        return len(self.rows)
+
+
+## Function to infer the storage class of each column from the fetched rows
+def infer_column_types(columns, rows):
+    types = []
+    for index in range(len(columns)):
+        column_type = "NULL"
+        for row in rows:
+            value = row[index]
+            if value is not None:
+                column_type = _sqlite_type_names.get(type(value), type(value).__name__)
+                break
+        types.append(column_type)
+    return types
+
+
+## Function to execute a query once and return rows plus column metadata
+def run_query(conn, sql, max_rows=MAX_RESULT_ROWS, batch_size=FETCH_BATCH_SIZE):
+    start = time.perf_counter()
+    cur = conn.cursor()
+    try:
+        cur.execute(sql)
+        columns = [desc[0] for desc in cur.description or []]
+        rows = []
+        truncated = False
+        if columns:
+            # Read at most one row past the cap so we know more were available
+            while len(rows) <= max_rows:
+                batch = cur.fetchmany(min(batch_size, max_rows + 1 - len(rows)))
+                if not batch:
+                    break
+                rows.extend(batch)
+            if len(rows) > max_rows:
+                del rows[max_rows:]
+                truncated = True
+    finally:
+        cur.close()
+    rows = [tuple(row) for row in rows]
+    return QueryResult(
+        columns=columns,
+        column_types=infer_column_types(columns, rows),
+        rows=rows,
+        elapsed=time.perf_counter() - start,
+        truncated=truncated,
+        max_rows=max_rows,
+    )
+
+
+## Function to check that SQLite can compile a statement without running it
+def validate_sql(conn, sql):
+    try:
+        conn.execute("EXPLAIN " + sql.strip().rstrip(";")).fetchall()
+    except sqlite3.Error as e:
+        return str(e)
+    return None
+
+
+## Function to count every row a query returns, including rows past the fetch cap
+def count_rows(conn, sql):
+    return conn.execute(
+        "SELECT COUNT(*) FROM (" + sql.strip().rstrip(";") + ")"
+    ).fetchone()[0]
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+
+# Model calls allowed per minute for each model, shared by every session and
+# worker in the process; 0 turns the limit off
+MODEL_RATE_LIMIT = float(os.getenv("MODEL_RATE_LIMIT", 0))
+
+# Calls that may be made back to back before the per-minute rate applies
+MODEL_RATE_BURST = int(os.getenv("MODEL_RATE_BURST", 5))
+
+# Longest a call waits for its turn before it is refused
+MODEL_RATE_WAIT = float(os.getenv("MODEL_RATE_WAIT", 30))
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimited(RuntimeError):
+    pass
+
+
+# Token bucket: tokens refill at the per-minute rate up to the burst size,
+# and every model call takes one
+class RateLimiter:
+    def __init__(self, per_minute=MODEL_RATE_LIMIT, burst=MODEL_RATE_BURST):
+        self.per_second = per_minute / 60
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._waited = 0.0
+        self._refused = 0
+        self._lock = threading.Lock()
+
+    ## Wait for a token, returning the seconds waited; raises RateLimited past max_wait
+    def acquire(self, max_wait=MODEL_RATE_WAIT):
+        if self.per_second <= 0:
+            return 0.0
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.per_second
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    waited = now - start
+                    self._waited += waited
+                    return waited
+                delay = (1 - self._tokens) / self.per_second
+                if now - start + delay > max_wait:
+                    self._refused += 1
+                    raise RateLimited(
+                        f"Model rate limit reached; retry in {delay:.1f} s"
+                    )
+            time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "per_minute": self.per_second * 60,
+                "burst": self.burst,
+                "tokens": self._tokens,
+                "waited_seconds": self._waited,
+                "refused": self._refused,
+            }
+
+
+## Function to get the limiter shared by every call to a model
+def get_rate_limiter(model_name):
+    with _limiters_lock:
+        if model_name not in _limiters:
+            _limiters[model_name] = RateLimiter()
+        return _limiters[model_name]
+
+
+## Function to summarise every model's limiter
+def rate_limit_stats():
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
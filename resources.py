@@ -0,0 +1,248 @@
+import argparse
+import importlib
+import os
+import statistics
+import sys
+import threading
+import time
+
+# Project modules are imported inside the functions below: most of them read
+# their settings from the environment at import time, after load_environment
+
+# Streamlit re-executes the app scripts on every rerun but imports modules
+# once per process, so resources kept here survive reruns and sessions
+_resources = {}
+_timings = {}
+_errors = {}
+_lock = threading.Lock()
+_build_locks = {}
+
+# Resources warmed for each app script
+APPS = {"main.py": "main", "function_calling.py": "chat"}
+
+
+## Function to get a process-wide resource, building it the first time it is asked for
+def get_resource(name, factory):
+    if name in _resources:
+        return _resources[name]
+    with _lock:
+        build_lock = _build_locks.setdefault(name, threading.Lock())
+    # A second caller (e.g. a rerun racing the warm-up thread) waits for the
+    # first build instead of starting another
+    with build_lock:
+        if name not in _resources:
+            start = time.perf_counter()
+            _resources[name] = factory()
+            _timings[name] = time.perf_counter() - start
+    return _resources[name]
+
+
+## Function to get how long each resource took to build
+def resource_timings():
+    with _lock:
+        return dict(_timings)
+
+
+## Function to get the error of each warm-up that failed
+def resource_errors():
+    with _lock:
+        return dict(_errors)
+
+
+## Function to load the .env file once per process
+def load_environment():
+    def load():
+        from dotenv import load_dotenv
+
+        return load_dotenv()
+
+    return get_resource("environment", load)
+
+
+## Function to import a heavy module once, off the path of the first page render
+def preload(module_name):
+    return get_resource(
+        f"import {module_name}", lambda: importlib.import_module(module_name)
+    )
+
+
+## Function to get the shared google.generativeai model used by main.py
+def genai_model(model_name):
+    load_environment()
+    from model_client import configure_genai, get_model
+
+    get_resource("genai", configure_genai)
+    return get_resource(f"model {model_name}", lambda: get_model(model_name))
+
+
+## Function to get the shared Vertex AI chat model, with its tools, for function_calling.py
+def chat_model():
+    load_environment()
+    from chat_tools import CHAT_MODEL, build_sql_query_tool, init_vertexai
+    from model_client import MODEL_MODE, get_model
+
+    if MODEL_MODE != "replay":
+        get_resource("vertexai", init_vertexai)
+    tool = get_resource("chat tool", build_sql_query_tool)
+    return get_resource(
+        "chat model",
+        lambda: get_model(
+            CHAT_MODEL,
+            backend="vertex",
+            generation_config={"temperature": 0},
+            tools=[tool],
+        ),
+    )
+
+
+## Function to open a database's pooled connection and schema catalog ahead of use
+def database_handle(db_path):
+    def open_database():
+        from db_pool import get_pool
+        from schema_catalog import get_catalog
+
+        pool = get_pool(db_path)
+        if os.path.exists(db_path):
+            get_catalog(db_path)
+        return pool
+
+    return get_resource(f"database {db_path}", open_database)
+
+
+## Function to build every resource an app needs, returning the build times
+def warm_up(app):
+    load_environment()
+    if app == "main":
+        from example_bank import EXAMPLE_BANK, get_bank
+        from nl2sql import database, model_name
+        from response_cache import get_default_cache
+
+        genai_model(model_name)
+        database_handle(database)
+        get_resource("response cache", get_default_cache)
+        if os.path.exists(EXAMPLE_BANK):
+            get_resource("example bank", get_bank)
+        # Only needed once a result is shown or interpreted
+        preload("pandas")
+    elif app == "chat":
+        from chat_tools import DB_FILE
+
+        chat_model()
+        database_handle(DB_FILE)
+    else:
+        raise ValueError(f"Unknown app {app}")
+    return resource_timings()
+
+
+## Function to warm an app up in the background the first time a script runs
+def start_warm_up(app):
+    def run():
+        try:
+            warm_up(app)
+        except Exception as e:
+            # The app builds whatever is missing on first use instead; the
+            # error is kept for resource_errors and goes to the server log
+            with _lock:
+                _errors[f"warm-up {app}"] = f"{type(e).__name__}: {e}"
+            print(f"Warm-up of {app} failed: {e!r}", file=sys.stderr)
+
+    def start():
+        thread = threading.Thread(target=run, name=f"warm-up-{app}", daemon=True)
+        thread.start()
+        return thread
+
+    return get_resource(f"warm-up {app}", start)
+
+
+## Function to time the first run and the reruns of an app script with Streamlit's AppTest
+def measure_app(script, reruns, warm=False):
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    report = {"streamlit_import": time.perf_counter() - start}
+    if warm:
+        start = time.perf_counter()
+        warm_up(APPS[os.path.basename(script)])
+        report["warm_up"] = time.perf_counter() - start
+    app = AppTest.from_file(script, default_timeout=120)
+    start = time.perf_counter()
+    app.run()
+    report["first_run"] = time.perf_counter() - start
+    # Reruns are timed once the background warm-up has finished, so they show
+    # the steady state rather than contention with the warm-up thread
+    app_name = APPS[os.path.basename(script)]
+    warm_up_thread = _resources.get(f"warm-up {app_name}")
+    if warm_up_thread is not None:
+        start = time.perf_counter()
+        warm_up_thread.join()
+        report["warm_up_wait"] = time.perf_counter() - start
+    samples = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        samples.append(time.perf_counter() - start)
+    report["rerun_p50"] = statistics.median(samples) if samples else None
+    report["rerun_max"] = max(samples) if samples else None
+    report["exceptions"] = [str(e.value) for e in app.exception]
+    report["resources"] = resource_timings()
+    report["errors"] = resource_errors()
+    return report
+
+
+def main():
+    # This file runs as __main__, while the apps import it as "resources";
+    # warm the module the apps will see, not this copy
+    import resources as registry
+
+    parser = argparse.ArgumentParser(
+        description="Warm up the apps' shared resources and measure their startup cost"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser(
+        "serve", help="warm up, then start streamlit in this process"
+    )
+    serve.add_argument("script", choices=list(APPS))
+    serve.add_argument("streamlit_args", nargs=argparse.REMAINDER)
+    measure = subparsers.add_parser(
+        "measure", help="time the cold first run and the reruns of an app"
+    )
+    measure.add_argument("script", choices=list(APPS))
+    measure.add_argument("--reruns", type=int, default=10)
+    measure.add_argument(
+        "--warm-up", action="store_true", help="warm up before the first run"
+    )
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        start = time.perf_counter()
+        timings = registry.warm_up(APPS[args.script])
+        print(f"Warmed up {args.script} in {time.perf_counter() - start:.2f}s")
+        for name, seconds in timings.items():
+            print(f"  {seconds * 1000:8.1f} ms  {name}")
+        from streamlit.web import cli
+
+        sys.argv = ["streamlit", "run", args.script, *args.streamlit_args]
+        sys.exit(cli.main())
+
+    report = registry.measure_app(args.script, args.reruns, warm=args.warm_up)
+    print(f"streamlit import: {report['streamlit_import']:.2f}s (not counted)")
+    if "warm_up" in report:
+        print(f"warm-up: {report['warm_up']:.2f}s")
+    print(f"first run: {report['first_run']:.2f}s")
+    if "warm_up_wait" in report:
+        print(f"background warm-up finished {report['warm_up_wait']:.2f}s later")
+    if report["rerun_p50"] is not None:
+        print(
+            f"reruns: p50 {report['rerun_p50'] * 1000:.1f} ms, "
+            f"max {report['rerun_max'] * 1000:.1f} ms over {args.reruns}"
+        )
+    for name, seconds in report["resources"].items():
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+    for name, error in report["errors"].items():
+        print(f"{name} failed: {error}")
+    for exception in report["exceptions"]:
+        print(f"Script error: {exception}")
+
+
+if __name__ == "__main__":
+    main()
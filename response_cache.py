@@ -0,0 +1,233 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Set the cache database name
+CACHE_DB = os.getenv("RESPONSE_CACHE_DB", "response_cache.db")
+
+# Entries older than this (in seconds) are treated as misses and evicted
+DEFAULT_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 7 * 24 * 60 * 60))
+
+# Size limits for the in-memory LRU tier and the persistent SQLite tier
+MAX_MEMORY_ENTRIES = int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", 256))
+MAX_DISK_ENTRIES = int(os.getenv("RESPONSE_CACHE_DISK_ENTRIES", 5000))
+
+
+## Function to normalize a question so trivially reworded questions share a key
+def normalize_question(question):
+    question = question.strip().lower()
+    question = re.sub(r"\s+", " ", question)
+    question = re.sub(r"[\s?.!]+$", "", question)
+    return question
+
+
+## Function to fingerprint the prompt text together with the model name
+def prompt_fingerprint(prompt, model_name):
+    if isinstance(prompt, (list, tuple)):
+        prompt = "\n".join(str(part) for part in prompt)
+    digest = hashlib.sha256()
+    digest.update(model_name.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        path=CACHE_DB,
+        ttl=DEFAULT_TTL,
+        max_memory_entries=MAX_MEMORY_ENTRIES,
+        max_disk_entries=MAX_DISK_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+        }
+        # Streamlit runs every script run on its own thread, so the
+        # connection is shared and all access goes through self._lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS RESPONSE_CACHE (
+                cache_key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                question TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS IX_RESPONSE_CACHE_FINGERPRINT "
+            "ON RESPONSE_CACHE (fingerprint)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS IX_RESPONSE_CACHE_ACCESSED "
+            "ON RESPONSE_CACHE (accessed_at)"
+        )
+        self._conn.commit()
+
+    def make_key(self, question, prompt, model_name):
+        fingerprint = prompt_fingerprint(prompt, model_name)
+        return fingerprint + ":" + normalize_question(question), fingerprint
+
+    def get(self, question, prompt, model_name):
+        key, _ = self.make_key(question, prompt, model_name)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, created_at = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return response
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT response, created_at FROM RESPONSE_CACHE WHERE cache_key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+
+            response, created_at = row
+            # Blank responses were never answers (e.g. a blocked stream); older
+            # caches may hold some, so drop them instead of serving them
+            if now - created_at > self.ttl or not response.strip():
+                self._conn.execute(
+                    "DELETE FROM RESPONSE_CACHE WHERE cache_key = ?", (key,)
+                )
+                self._conn.commit()
+                self._counters["evictions"] += 1
+                self._counters["misses"] += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE RESPONSE_CACHE SET accessed_at = ? WHERE cache_key = ?",
+                (now, key),
+            )
+            self._conn.commit()
+            self._remember(key, response, created_at)
+            self._counters["disk_hits"] += 1
+            return response
+
+    ## Store a response; blank ones are refused so the model is asked again next time
+    def set(self, question, prompt, model_name, response):
+        if not response or not response.strip():
+            return False
+        key, fingerprint = self.make_key(question, prompt, model_name)
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO RESPONSE_CACHE (
+                    cache_key, fingerprint, question, response, created_at, accessed_at
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, fingerprint, normalize_question(question), response, now, now),
+            )
+            self._counters["writes"] += 1
+            self._evict_disk(now)
+            self._conn.commit()
+        return True
+
+    ## Drop every entry produced with the given prompt/model (or everything)
+    def invalidate(self, prompt=None, model_name=None):
+        with self._lock:
+            if prompt is None:
+                removed = self._conn.execute("DELETE FROM RESPONSE_CACHE").rowcount
+                self._memory.clear()
+            else:
+                fingerprint = prompt_fingerprint(prompt, model_name)
+                removed = self._conn.execute(
+                    "DELETE FROM RESPONSE_CACHE WHERE fingerprint = ?", (fingerprint,)
+                ).rowcount
+                for key in [k for k in self._memory if k.startswith(fingerprint + ":")]:
+                    del self._memory[key]
+            self._conn.commit()
+            return removed
+
+    ## Drop entries from any other prompt/model, e.g. after a schema or prompt change
+    def retain_only(self, prompt, model_name):
+        fingerprint = prompt_fingerprint(prompt, model_name)
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM RESPONSE_CACHE WHERE fingerprint != ?", (fingerprint,)
+            ).rowcount
+            for key in [
+                k for k in self._memory if not k.startswith(fingerprint + ":")
+            ]:
+                del self._memory[key]
+            self._conn.commit()
+            return removed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = self._conn.execute(
+                "SELECT COUNT(*) FROM RESPONSE_CACHE"
+            ).fetchone()[0]
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Callers must hold self._lock
+    def _remember(self, key, response, created_at):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    # Callers must hold self._lock
+    def _evict_disk(self, now):
+        expired = self._conn.execute(
+            "DELETE FROM RESPONSE_CACHE WHERE created_at < ?", (now - self.ttl,)
+        ).rowcount
+        overflow = self._conn.execute(
+            """
+            DELETE FROM RESPONSE_CACHE WHERE cache_key IN (
+                SELECT cache_key FROM RESPONSE_CACHE
+                ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_disk_entries,),
+        ).rowcount
+        self._counters["evictions"] += expired + overflow
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+## Function to get the process-wide cache shared across Streamlit reruns
+def get_default_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
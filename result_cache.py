@@ -0,0 +1,173 @@
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+# Upper bound on the memory held by cached result sets
+MAX_CACHE_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+_statement_start = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+
+
+## Function to canonicalize SQL text so formatting differences share a cache key
+def canonicalize_sql(sql):
+    parts = []
+    i = 0
+    length = len(sql)
+    pending_space = False
+    while i < length:
+        char = sql[i]
+        # Quoted strings and identifiers are kept exactly as written
+        if char in "'\"`[":
+            closing = "]" if char == "[" else char
+            end = i + 1
+            while end < length:
+                if sql[end] == closing:
+                    if closing != "]" and end + 1 < length and sql[end + 1] == closing:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            token = sql[i : end + 1]
+            i = end + 1
+        elif sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = length if end == -1 else end
+            pending_space = True
+            continue
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = length if end == -1 else end + 2
+            pending_space = True
+            continue
+        elif char.isspace():
+            pending_space = True
+            i += 1
+            continue
+        else:
+            token = char
+            i += 1
+        if pending_space and parts:
+            parts.append(" ")
+        pending_space = False
+        parts.append(token)
+    return "".join(parts).rstrip("; ")
+
+
+## Function to check if a statement is a plain read whose result can be cached
+def is_cacheable(sql):
+    canonical = canonicalize_sql(sql)
+    return bool(_statement_start.match(canonical)) and ";" not in canonical
+
+
+## Function to get a cheap change marker for a database file
+def database_version(db_path):
+    marker = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            marker.append(None)
+            continue
+        if stat.st_size == 0:
+            # An empty WAL holds no changes; readers touch it when they open
+            marker.append(None)
+        else:
+            marker.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    return tuple(marker)
+
+
+## Function to estimate the memory used by a cached value
+def estimate_size(value, _depth=0):
+    size = sys.getsizeof(value)
+    if _depth > 3:
+        return size
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += estimate_size(key, _depth + 1) + estimate_size(item, _depth + 1)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += estimate_size(item, _depth + 1)
+    return size
+
+
+class ResultCache:
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+
+    def get(self, db_path, sql):
+        key = (os.path.abspath(db_path), canonicalize_sql(sql))
+        version = database_version(db_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            value, entry_version, size = entry
+            if entry_version != version:
+                # The database changed since this entry was stored
+                del self._entries[key]
+                self.current_bytes -= size
+                self._counters["stale"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def set(self, db_path, sql, value, version=None):
+        if not is_cacheable(sql):
+            return False
+        key = (os.path.abspath(db_path), canonicalize_sql(sql))
+        if version is None:
+            version = database_version(db_path)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[2]
+            self._entries[key] = (value, version, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self._counters["evictions"] += 1
+        return True
+
+    def clear(self, db_path=None):
+        with self._lock:
+            if db_path is None:
+                self._entries.clear()
+                self.current_bytes = 0
+                return
+            db_path = os.path.abspath(db_path)
+            for key in [k for k in self._entries if k[0] == db_path]:
+                self.current_bytes -= self._entries.pop(key)[2]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self.current_bytes
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+## Function to get the process-wide result cache shared by both apps
+def get_default_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
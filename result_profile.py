@@ -0,0 +1,185 @@
+import os
+import time
+
+# numpy and pandas are imported only where a digest is built, so modules that
+# just need estimate_tokens do not pay for them on the apps' startup path
+
+# Approximate number of tokens the interpretation data may use
+DIGEST_TOKEN_BUDGET = int(os.getenv("DIGEST_TOKEN_BUDGET", 1500))
+
+# Results this small are sent to the model row by row instead of as a digest
+RAW_ROW_LIMIT = 20
+
+# Rough characters-per-token ratio for English text and numbers
+CHARS_PER_TOKEN = 4
+
+# Columns with at most this many distinct values are treated as categories
+CATEGORY_LIMIT = 50
+
+# Larger results estimate their raw size from this many evenly spaced rows
+RAW_SAMPLE_ROWS = 200
+
+
+## Function to estimate the number of tokens in a piece of text
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+## Function to estimate the tokens of the rows sent as raw text, one row per line,
+# without serializing every row of a large result
+def estimate_raw_tokens(rows):
+    if not rows:
+        return estimate_tokens("")
+    if len(rows) <= RAW_SAMPLE_ROWS:
+        sample = rows
+    else:
+        step = len(rows) / RAW_SAMPLE_ROWS
+        sample = [rows[int(index * step)] for index in range(RAW_SAMPLE_ROWS)]
+    row_chars = sum(len(str(row)) for row in sample) * len(rows) / len(sample)
+    return int(row_chars + len(rows) - 1) // CHARS_PER_TOKEN + 1
+
+
+## Function to make column labels unique (e.g. SELECT a.name, b.name), which
+# pandas needs for df[column] to be a single column
+def unique_labels(columns):
+    names = set(columns)
+    labels = []
+    for column in columns:
+        label, suffix = column, 2
+        # A suffixed label must not clash with a column that is really called that
+        while label in labels or (label != column and label in names):
+            label = f"{column}_{suffix}"
+            suffix += 1
+        labels.append(label)
+    return labels
+
+
+## Function to format a number compactly for the digest
+def format_number(value):
+    import pandas as pd
+
+    if pd.isna(value):
+        return "null"
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:.4g}"
+
+
+## Function to summarise one numeric column
+def describe_numeric(series):
+    import numpy as np
+
+    values = series.dropna()
+    if values.empty:
+        return "all null"
+    quantiles = np.quantile(values.to_numpy(dtype=float), [0.25, 0.5, 0.75])
+    return (
+        f"min {format_number(values.min())}, max {format_number(values.max())}, "
+        f"mean {format_number(values.mean())}, "
+        f"p25/p50/p75 {'/'.join(format_number(q) for q in quantiles)}"
+    )
+
+
+## Function to summarise one categorical column with its most common values
+def describe_categorical(series, top_k):
+    counts = series.value_counts(dropna=True)
+    if counts.empty:
+        return "all null"
+    if counts.iloc[0] == 1:
+        # Every value is unique (e.g. names), so counts carry no information
+        examples = ", ".join(str(value) for value in counts.index[:top_k])
+        return f"{counts.size} distinct, all unique; e.g. {examples}"
+    top = ", ".join(f"{value} ({count})" for value, count in counts.head(top_k).items())
+    return f"{counts.size} distinct; top: {top}"
+
+
+## Function to pick a small sample with rows from each group of a category column
+def stratified_sample(df, group_column, sample_rows):
+    import numpy as np
+
+    if sample_rows <= 0:
+        return df.iloc[0:0]
+    if len(df) <= sample_rows:
+        return df
+    if group_column is None:
+        positions = np.linspace(0, len(df) - 1, sample_rows).astype(int)
+        return df.iloc[np.unique(positions)]
+    groups = df.groupby(group_column, dropna=False, sort=False)
+    per_group = max(1, sample_rows // max(1, groups.ngroups))
+    return groups.head(per_group).head(sample_rows)
+
+
+## Function to build the digest text with a given level of detail
+def build_digest(df, truncated, top_k, sample_rows):
+    import pandas as pd
+
+    lines = [f"Rows: {len(df)}{' (truncated, more rows exist)' if truncated else ''}"]
+    lines.append("Columns:")
+    numeric_columns = []
+    category_columns = []
+    for column in df.columns:
+        series = df[column]
+        nulls = int(series.isna().sum())
+        if pd.api.types.is_bool_dtype(series):
+            summary = describe_categorical(series, top_k)
+            category_columns.append(column)
+        elif pd.api.types.is_numeric_dtype(series):
+            summary = describe_numeric(series)
+            numeric_columns.append(column)
+        else:
+            summary = describe_categorical(series.astype("string"), top_k)
+            if series.nunique(dropna=True) <= CATEGORY_LIMIT:
+                category_columns.append(column)
+        null_note = f", {nulls} null" if nulls else ""
+        lines.append(f"- {column} ({series.dtype}{null_note}): {summary}")
+
+    # Row counts and numeric totals for the largest groups of the first category
+    group_column = category_columns[0] if category_columns else None
+    if group_column is not None:
+        groups = df.groupby(group_column, dropna=False)
+        totals = groups[numeric_columns].sum() if numeric_columns else pd.DataFrame()
+        totals.insert(0, "rows", groups.size())
+        totals = totals.sort_values("rows", ascending=False).head(top_k)
+        lines.append(f"Totals by {group_column}:")
+        for group, row in totals.iterrows():
+            values = ", ".join(
+                f"{column}={format_number(row[column])}" for column in totals.columns
+            )
+            lines.append(f"- {group}: {values}")
+
+    sample = stratified_sample(df, group_column, sample_rows)
+    if len(sample):
+        lines.append("Sample rows:")
+        lines.append(sample.to_csv(index=False).strip())
+    return "\n".join(lines)
+
+
+## Function to turn a query result into the text sent to the interpretation model
+def profile_result(columns, rows, truncated=False, token_budget=DIGEST_TOKEN_BUDGET):
+    start = time.perf_counter()
+    report = {
+        "rows": len(rows),
+        "raw_tokens": estimate_raw_tokens(rows),
+        "token_budget": token_budget,
+    }
+
+    if len(rows) <= RAW_ROW_LIMIT and report["raw_tokens"] <= token_budget:
+        text = "\n".join([str(row) for row in rows])
+        report["mode"] = "raw"
+    else:
+        import pandas as pd
+
+        df = pd.DataFrame(rows, columns=unique_labels(columns))
+        # Shrink the top-k lists and the sample until the digest fits the budget
+        text = ""
+        for top_k, sample_rows in ((10, 20), (5, 10), (5, 5), (3, 3), (3, 0)):
+            text = build_digest(df, truncated, top_k, sample_rows)
+            if estimate_tokens(text) <= token_budget:
+                break
+        if estimate_tokens(text) > token_budget:
+            text = text[: token_budget * CHARS_PER_TOKEN]
+        report["mode"] = "digest"
+
+    report["tokens"] = estimate_tokens(text)
+    report["profile_seconds"] = time.perf_counter() - start
+    return text, report
@@ -0,0 +1,404 @@
+import argparse
+import os
+import re
+import sqlite3
+import time
+
+from result_cache import canonicalize_sql
+
+# Set ROLLUP_REWRITE=0 to always answer from the base table (e.g. to verify rollups)
+ROLLUP_REWRITE = os.getenv("ROLLUP_REWRITE", "1").lower() not in ("0", "false", "no")
+
+BASE_TABLE = "BILLIONAIRES_DATA"
+ROLLUP_TABLE = "BILLIONAIRES_ROLLUP"
+
+# Grain of the rollup: one row per combination of these values. Each entry is
+# the expression computed from a base row, with {row} standing for the row.
+rollup_dimensions = {
+    "country": "{row}country",
+    "industries": "{row}industries",
+    "category": "{row}category",
+    "gender": "{row}gender",
+    "self_made": "{row}self_made",
+    "birth_decade": "CAST({row}birth_year AS INTEGER) / 10 * 10",
+}
+
+# Declared types of the dimensions computed from base columns; the others copy
+# their base column's type, so comparisons apply the same affinity either way
+rollup_dimension_types = {"birth_decade": "INTEGER"}
+
+# Base columns that are also rollup columns, so queries may use them freely
+rollup_columns = {"country", "industries", "category", "gender", "self_made"}
+
+# Columns of the base table, and every column of the rollup table. A name in
+# either resolves differently on the two tables, so it may not be an alias; a
+# double-quoted name in neither is a string literal to SQLite on both
+base_columns = {
+    "rank", "category", "person_name", "country", "city", "source", "industries",
+    "country_of_citizenship", "organization", "self_made", "status", "gender",
+    "title", "birth_year", "rowid", "oid", "_rowid_",
+}
+rollup_table_columns = set(rollup_dimensions) | {
+    "row_count", "birth_year_sum", "birth_year_count",
+}
+
+# Triggers keeping the rollup in step with every insert, update and delete
+rollup_triggers = {
+    "insert": "TR_BILLIONAIRES_ROLLUP_INSERT",
+    "update": "TR_BILLIONAIRES_ROLLUP_UPDATE",
+    "delete": "TR_BILLIONAIRES_ROLLUP_DELETE",
+}
+
+# Functions that are evaluated on rollup columns unchanged
+_passthrough_functions = {
+    "min", "max", "round", "coalesce", "ifnull", "nullif", "lower", "upper",
+    "abs", "length", "substr", "trim", "cast", "iif",
+}
+_aggregate_functions = {"count", "sum", "total", "avg", "min", "max"}
+_keywords = {
+    "select", "from", "where", "group", "by", "order", "having", "limit",
+    "offset", "as", "and", "or", "not", "in", "is", "null", "case", "when",
+    "then", "else", "end", "between", "like", "glob", "distinct", "asc",
+    "desc", "collate", "nocase", "integer", "real", "text", "true", "false",
+    "escape",
+}
+_token = re.compile(
+    r"'(?:[^']|'')*'"
+    r'|"(?:[^"]|"")*"'
+    r"|\[[^\]]*\]|`[^`]*`"
+    r"|\d+(?:\.\d*)?(?:e[+-]?\d+)?"
+    r"|\w+(?:\.\w+)?"
+    r"|<=|>=|==|!=|<>|\|\||\S",
+    re.IGNORECASE,
+)
+
+
+## Function to build the SQL of one rollup trigger
+def trigger_sql(event):
+    dimensions = list(rollup_dimensions)
+
+    def values(row):
+        return [rollup_dimensions[name].format(row=row + ".") for name in dimensions]
+
+    def match(row):
+        return " AND ".join(
+            f"{name} IS {value}" for name, value in zip(dimensions, values(row))
+        )
+
+    def add(row):
+        return (
+            f"INSERT INTO {ROLLUP_TABLE} ({', '.join(dimensions)}, row_count, "
+            f"birth_year_sum, birth_year_count) "
+            f"SELECT {', '.join(values(row))}, 0, 0, 0 "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {ROLLUP_TABLE} WHERE {match(row)});\n"
+            f"UPDATE {ROLLUP_TABLE} SET row_count = row_count + 1, "
+            f"birth_year_sum = birth_year_sum + IFNULL({row}.birth_year, 0), "
+            f"birth_year_count = birth_year_count + ({row}.birth_year IS NOT NULL) "
+            f"WHERE {match(row)};\n"
+        )
+
+    def remove(row):
+        return (
+            f"UPDATE {ROLLUP_TABLE} SET row_count = row_count - 1, "
+            f"birth_year_sum = birth_year_sum - IFNULL({row}.birth_year, 0), "
+            f"birth_year_count = birth_year_count - ({row}.birth_year IS NOT NULL) "
+            f"WHERE {match(row)};\n"
+            f"DELETE FROM {ROLLUP_TABLE} WHERE row_count <= 0 AND {match(row)};\n"
+        )
+
+    if event == "insert":
+        timing, body = "AFTER INSERT", add("NEW")
+    elif event == "delete":
+        timing, body = "AFTER DELETE", remove("OLD")
+    else:
+        columns = sorted(rollup_columns | {"birth_year"})
+        timing = f"AFTER UPDATE OF {', '.join(columns)}"
+        body = remove("OLD") + add("NEW")
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {rollup_triggers[event]} {timing} "
+        f"ON {BASE_TABLE} BEGIN\n{body}END"
+    )
+
+
+## Function to drop the triggers before a bulk load (the rollup is rebuilt after it)
+def drop_rollup_triggers(cursor):
+    for trigger in rollup_triggers.values():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+
+## Function to get the declared type of every rollup dimension
+def rollup_column_types(cursor):
+    base_types = {
+        row[1]: row[2] for row in cursor.execute(f"PRAGMA table_info({BASE_TABLE})")
+    }
+    return {
+        name: rollup_dimension_types.get(name) or base_types.get(name, "")
+        for name in rollup_dimensions
+    }
+
+
+## Function to check the rollup's columns are declared with the types it is built with
+def rollup_types_current(cursor):
+    declared = {
+        row[1]: row[2] for row in cursor.execute(f"PRAGMA table_info({ROLLUP_TABLE})")
+    }
+    return all(
+        declared.get(name) == column_type
+        for name, column_type in rollup_column_types(cursor).items()
+    )
+
+
+## Function to recompute the rollup from the base table and install its triggers
+def rebuild_rollups(cursor):
+    dimensions = list(rollup_dimensions)
+    expressions = [rollup_dimensions[name].format(row="") for name in dimensions]
+    column_types = rollup_column_types(cursor)
+    columns = ", ".join(f"{name} {column_types[name]}".strip() for name in dimensions)
+    cursor.execute(f"DROP TABLE IF EXISTS {ROLLUP_TABLE}")
+    cursor.execute(
+        f"CREATE TABLE {ROLLUP_TABLE} ({columns}, "
+        "row_count INTEGER NOT NULL, birth_year_sum INTEGER NOT NULL, "
+        "birth_year_count INTEGER NOT NULL)"
+    )
+    cursor.execute(
+        f"INSERT INTO {ROLLUP_TABLE} SELECT {', '.join(expressions)}, COUNT(*), "
+        f"IFNULL(SUM(birth_year), 0), COUNT(birth_year) "
+        f"FROM {BASE_TABLE} GROUP BY {', '.join(expressions)}"
+    )
+    # The triggers look groups up by every dimension
+    cursor.execute(
+        f"CREATE INDEX IX_BILLIONAIRES_ROLLUP_DIMENSIONS ON {ROLLUP_TABLE} "
+        f"({', '.join(dimensions)})"
+    )
+    for event in rollup_triggers:
+        cursor.execute(trigger_sql(event))
+
+
+## Function to create the rollup unless it is already there and maintained
+def ensure_rollups(cursor):
+    existing = {
+        name
+        for (name,) in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"
+        )
+    }
+    if (
+        ROLLUP_TABLE not in existing
+        or not set(rollup_triggers.values()) <= existing
+        # Rollups built before their columns were typed compare differently
+        or not rollup_types_current(cursor)
+    ):
+        rebuild_rollups(cursor)
+
+
+## Function to check that the rollup exists and is kept current by its triggers
+def rollups_available(conn):
+    names = [ROLLUP_TABLE, *rollup_triggers.values()]
+    found = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE name IN ({', '.join('?' * len(names))})",
+        names,
+    ).fetchone()[0]
+    return found == len(names) and rollup_types_current(conn)
+
+
+## Function to find the closing parenthesis of a call starting at tokens[start]
+def closing_parenthesis(tokens, start):
+    depth = 0
+    for i in range(start, len(tokens)):
+        if tokens[i] == "(":
+            depth += 1
+        elif tokens[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+
+## Function to rewrite an aggregate query on the base table to read the rollup
+def rewrite_query(sql):
+    tokens = _token.findall(canonicalize_sql(sql))
+    lowered = [token.lower() for token in tokens]
+
+    # Only plain single-table aggregates qualify: no joins, subqueries or sets
+    if lowered.count("select") != 1 or lowered.count("from") != 1:
+        return None
+    if any(word in lowered for word in ("join", "union", "except", "intersect", "over")):
+        return None
+    from_index = lowered.index("from")
+    if from_index + 1 >= len(tokens) or tokens[from_index + 1].strip('"[]`').upper() != BASE_TABLE:
+        return None
+    table_names = {lowered[from_index + 1].strip('"[]`')}
+    position = from_index + 2
+    if position < len(tokens) and lowered[position] == "as":
+        position += 1
+    if position < len(tokens) and re.match(r"^\w+$", tokens[position]) and lowered[position] not in _keywords:
+        table_names.add(lowered[position])
+        position += 1
+    if position < len(tokens) and tokens[position] == ",":
+        return None
+    aliases = {
+        lowered[i + 1].strip('"[]`') for i in range(len(tokens) - 1) if lowered[i] == "as"
+    }
+    # An alias named like a column would be read as that column on one table
+    # and as the alias on the other
+    if aliases & (base_columns | rollup_table_columns):
+        return None
+
+    output = []
+    aggregates = 0
+    i = 0
+    while i < len(tokens):
+        token, word = tokens[i], lowered[i]
+        following = lowered[i + 1] if i + 1 < len(tokens) else ""
+        if i == from_index + 1:
+            output.append(ROLLUP_TABLE)
+        elif following == "(" and word in _aggregate_functions:
+            end = closing_parenthesis(tokens, i + 1)
+            if end is None:
+                return None
+            inner_tokens = lowered[i + 2 : end]
+            inner = " ".join(tokens[i + 2 : end])
+            aggregates += 1
+            # SUM over no matching groups is NULL where COUNT gives 0
+            if inner_tokens in (["*"], ["1"]) and word == "count":
+                output.append("IFNULL(SUM(row_count), 0)")
+            elif inner_tokens == ["birth_year"] and word in ("sum", "total", "avg", "count"):
+                output.append(
+                    {
+                        "sum": "SUM(birth_year_sum)",
+                        "total": "TOTAL(birth_year_sum)",
+                        "count": "IFNULL(SUM(birth_year_count), 0)",
+                        # x / 0 is NULL in SQLite, like AVG over no values
+                        "avg": "(SUM(birth_year_sum) * 1.0 / SUM(birth_year_count))",
+                    }[word]
+                )
+            else:
+                inner_sql = rewrite_expression(
+                    tokens[i + 2 : end], table_names, aliases
+                )
+                if inner_sql is None:
+                    return None
+                if word in ("min", "max") or inner_tokens[:1] == ["distinct"]:
+                    output.append(f"{word.upper()}({inner_sql})")
+                elif word == "count":
+                    output.append(
+                        f"IFNULL(SUM(CASE WHEN ({inner}) IS NOT NULL "
+                        "THEN row_count ELSE 0 END), 0)"
+                    )
+                elif word == "avg":
+                    output.append(
+                        f"(SUM(({inner}) * row_count) * 1.0 / "
+                        f"SUM(CASE WHEN ({inner}) IS NOT NULL THEN row_count END))"
+                    )
+                else:
+                    output.append(f"{word.upper()}(({inner}) * row_count)")
+            i = end + 1
+            continue
+        else:
+            # SELECT * or b.* would return the rollup's own columns
+            if token == "*":
+                return None
+            if rewrite_expression([token], table_names, aliases, following) is None:
+                return None
+            output.append(token)
+        i += 1
+
+    if not aggregates:
+        return None
+    return " ".join(output)
+
+
+## Function to check that an expression only reads columns the rollup keeps
+def rewrite_expression(tokens, table_names, aliases, following=""):
+    for i, token in enumerate(tokens):
+        word = token.lower()
+        if i + 1 < len(tokens):
+            following = tokens[i + 1].lower()
+        if not re.match(r"^[\w\"\[`]", token) or token[0].isdigit():
+            continue
+        if word in _keywords:
+            continue
+        if following == "(":
+            if word not in _passthrough_functions:
+                return None
+            continue
+        qualifier, _, name = word.rpartition(".")
+        name = name.strip('"[]`')
+        if qualifier and qualifier.strip('"[]`') not in table_names:
+            return None
+        if name in rollup_columns or name in aliases or name in table_names:
+            continue
+        if (
+            token.startswith('"')
+            and not qualifier
+            and name not in base_columns | rollup_table_columns
+        ):
+            # SQLite reads a double-quoted name that is no column as a string
+            continue
+        return None
+    return " ".join(tokens)
+
+
+## Function to run a query with and without the rollup and compare the results
+def verify_query(conn, sql):
+    rewritten = rewrite_query(sql)
+    if rewritten is None:
+        return None
+    start = time.perf_counter()
+    base_rows = conn.execute(sql).fetchall()
+    base_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    rollup_rows = conn.execute(rewritten).fetchall()
+    rollup_seconds = time.perf_counter() - start
+
+    def normalize(rows):
+        return sorted(
+            (tuple(round(v, 6) if isinstance(v, float) else v for v in row) for row in rows),
+            key=repr,
+        )
+
+    return {
+        "rewritten": rewritten,
+        "matches": normalize(base_rows) == normalize(rollup_rows),
+        "base_seconds": base_seconds,
+        "rollup_seconds": rollup_seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the billionaires rollup or verify rewritten queries against it"
+    )
+    parser.add_argument("--db", default="data.db")
+    parser.add_argument("--rebuild", action="store_true", help="recompute the rollup")
+    args = parser.parse_args()
+
+    from query import queries
+
+    connection = sqlite3.connect(args.db)
+    cursor = connection.cursor()
+    if args.rebuild:
+        rebuild_rollups(cursor)
+        connection.commit()
+    else:
+        ensure_rollups(cursor)
+        connection.commit()
+
+    failures = 0
+    for case in queries:
+        outcome = verify_query(connection, case["query"])
+        if outcome is None:
+            print(f"[base]   {case['description']}")
+            continue
+        failures += not outcome["matches"]
+        print(
+            f"[{'rollup' if outcome['matches'] else 'WRONG'}] {case['description']} "
+            f"({outcome['base_seconds'] * 1000:.2f} ms -> "
+            f"{outcome['rollup_seconds'] * 1000:.2f} ms)"
+        )
+    connection.close()
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import threading
+
+from db_pool import get_pool
+from result_cache import database_version
+
+# Number of distinct example values kept per column
+SAMPLE_VALUES = 3
+
+
+## Function to quote an identifier for use in SQL text
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SchemaCatalog:
+    def __init__(self, schema_version, data_generation, tables):
+        self.schema_version = schema_version
+        self.data_generation = data_generation
+        self.tables = tables
+        self._names = {name.lower(): name for name in tables}
+
+    def list_tables(self):
+        return list(self.tables)
+
+    def resolve(self, table_name):
+        return self._names.get(str(table_name).strip().strip("[]\"'`").lower())
+
+    def get_table(self, table_name):
+        name = self.resolve(table_name)
+        if name is None:
+            return {
+                "error": f"Table {table_name} does not exist",
+                "available_tables": self.list_tables(),
+            }
+        return self.tables[name]
+
+
+## Function to read the columns, keys, row count and sample values of one table
+def describe_table(conn, table_name):
+    quoted = quote_identifier(table_name)
+    columns = []
+    primary_key = []
+    for cid, name, column_type, notnull, default, pk in conn.execute(
+        f"PRAGMA table_info({quoted})"
+    ):
+        samples = [
+            row[0]
+            for row in conn.execute(
+                f"SELECT DISTINCT {quote_identifier(name)} FROM {quoted} "
+                f"WHERE {quote_identifier(name)} IS NOT NULL LIMIT {SAMPLE_VALUES}"
+            )
+        ]
+        columns.append(
+            {
+                "name": name,
+                "type": column_type,
+                "not_null": bool(notnull),
+                "default": default,
+                "primary_key": bool(pk),
+                "sample_values": samples,
+            }
+        )
+        if pk:
+            primary_key.append((pk, name))
+
+    foreign_keys = [
+        {"column": row[3], "references_table": row[2], "references_column": row[4]}
+        for row in conn.execute(f"PRAGMA foreign_key_list({quoted})")
+    ]
+
+    # The Chinook script backs each foreign key with an IFK_<Table><Column> index
+    fk_indexes = {}
+    for row in conn.execute(f"PRAGMA index_list({quoted})"):
+        index_name = row[1]
+        if index_name.upper().startswith("IFK_"):
+            index_columns = [
+                info[2]
+                for info in conn.execute(
+                    f"PRAGMA index_info({quote_identifier(index_name)})"
+                )
+            ]
+            fk_indexes[index_name] = index_columns
+
+    row_count = conn.execute(f"SELECT COUNT(*) FROM {quoted}").fetchone()[0]
+    return {
+        "table_name": table_name,
+        "row_count": row_count,
+        "columns": columns,
+        "primary_key": [name for _, name in sorted(primary_key)],
+        "foreign_keys": foreign_keys,
+        "foreign_key_indexes": fk_indexes,
+        "referenced_by": [],
+    }
+
+
+## Function to fill in relationships that are only implied by IFK_* indexes
+def link_tables(tables):
+    primary_keys = {
+        info["primary_key"][0]: name
+        for name, info in tables.items()
+        if len(info["primary_key"]) == 1
+    }
+    for name, info in tables.items():
+        declared = {fk["column"] for fk in info["foreign_keys"]}
+        for index_columns in info["foreign_key_indexes"].values():
+            for column in index_columns:
+                target = primary_keys.get(column)
+                if column not in declared and target and target != name:
+                    info["foreign_keys"].append(
+                        {
+                            "column": column,
+                            "references_table": target,
+                            "references_column": column,
+                        }
+                    )
+    for name, info in tables.items():
+        for fk in info["foreign_keys"]:
+            target = tables.get(fk["references_table"])
+            if target is not None:
+                target["referenced_by"].append(
+                    {
+                        "table": name,
+                        "column": fk["column"],
+                        "references_column": fk["references_column"],
+                    }
+                )
+
+
+## Function to build the catalog for every user table in the database
+def build_catalog(conn):
+    schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    data_generation = conn.execute("PRAGMA user_version").fetchone()[0]
+    table_names = [
+        row[0]
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )
+    ]
+    tables = {name: describe_table(conn, name) for name in table_names}
+    link_tables(tables)
+    return SchemaCatalog(schema_version, data_generation, tables)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+## Function to get the catalog for a database, rebuilding it only when the file changed
+def get_catalog(db_path):
+    # A file stat is enough to tell whether anything (schema or rows) changed,
+    # so the common path never touches SQLite
+    version = database_version(db_path)
+    with _catalogs_lock:
+        cached = _catalogs.get(db_path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        with get_pool(db_path).connection() as conn:
+            catalog = build_catalog(conn)
+        _catalogs[db_path] = (version, catalog)
+        return catalog
@@ -0,0 +1,235 @@
+import argparse
+import os
+import re
+from collections import deque
+
+from result_profile import estimate_tokens
+from schema_catalog import get_catalog
+
+# "tool_loop" lets the model discover the schema with list_tables/get_table,
+# "planned" inlines the relevant tables into the first message
+CHAT_MODE = os.getenv("CHAT_MODE", "tool_loop")
+
+# Upper bound on the tables inlined into the first message
+MAX_PLANNED_TABLES = int(os.getenv("MAX_PLANNED_TABLES", 5))
+
+# A match on a table name counts for more than a match on one of its columns
+TABLE_MATCH_WEIGHT = 3
+COLUMN_MATCH_WEIGHT = 1
+
+# Column name parts that appear in nearly every table and say nothing
+GENERIC_TERMS = frozenset(["id", "name"])
+
+# Everyday words for the Chinook tables and columns, after stemming
+SYNONYMS = {
+    "song": ["track"],
+    "tune": ["track"],
+    "music": ["track"],
+    "spend": ["invoice", "total"],
+    "spent": ["invoice", "total"],
+    "spending": ["invoice", "total"],
+    "revenue": ["invoice", "total"],
+    "sale": ["invoice"],
+    "sell": ["invoiceline"],
+    "sold": ["invoiceline"],
+    "purchase": ["invoice"],
+    "bought": ["invoiceline"],
+    "order": ["invoice"],
+    "client": ["customer"],
+    "buyer": ["customer"],
+    "staff": ["employee"],
+    "rep": ["employee"],
+    "agent": ["employee"],
+    "manager": ["employee"],
+    "band": ["artist"],
+    "singer": ["artist"],
+    "musician": ["artist"],
+    "record": ["album"],
+    "style": ["genre"],
+    "format": ["media", "type"],
+    "length": ["milliseconds"],
+    "duration": ["milliseconds"],
+    "long": ["milliseconds"],
+    "longest": ["milliseconds"],
+    "shortest": ["milliseconds"],
+    "size": ["bytes"],
+    "price": ["unit", "price"],
+    "writer": ["composer"],
+}
+
+
+## Function to reduce a word to a rough singular form
+def stem(word):
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+## Function to split an identifier such as InvoiceLine or BillingCity into terms
+def identifier_terms(identifier):
+    parts = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", identifier)
+    terms = {stem(part.lower()) for part in parts}
+    terms.add(stem(identifier.lower()))
+    return terms
+
+
+## Function to turn a question into stemmed terms, expanded with synonyms
+def question_terms(question):
+    terms = set()
+    for word in re.findall(r"[a-z0-9]+", question.lower()):
+        word = stem(word)
+        terms.add(word)
+        terms.update(SYNONYMS.get(word, []))
+    return terms
+
+
+## Function to score every table by how many question terms its name and columns match
+def score_tables(catalog, question):
+    terms = question_terms(question)
+    # A term naming a whole table (invoice) is credited to that table only,
+    # not to the tables it is part of (InvoiceLine)
+    whole_names = {stem(name.lower()) for name in catalog.tables}
+    scores = {}
+    for name, info in catalog.tables.items():
+        whole = stem(name.lower())
+        name_terms = {
+            term
+            for term in identifier_terms(name) & terms
+            if term == whole or term not in whole_names
+        }
+        score = TABLE_MATCH_WEIGHT * len(name_terms)
+        # Key columns repeat other table names, so only plain columns count
+        keys = set(info["primary_key"])
+        keys.update(fk["column"] for fk in info["foreign_keys"])
+        for column in info["columns"]:
+            if column["name"] in keys:
+                continue
+            matched = (identifier_terms(column["name"]) - GENERIC_TERMS) & terms
+            score += COLUMN_MATCH_WEIGHT * len(matched)
+        if score:
+            scores[name] = score
+    return scores
+
+
+## Function to build the undirected join graph from the foreign keys
+def join_graph(catalog):
+    graph = {name: set() for name in catalog.tables}
+    for name, info in catalog.tables.items():
+        for fk in info["foreign_keys"]:
+            target = fk["references_table"]
+            if target in graph and target != name:
+                graph[name].add(target)
+                graph[target].add(name)
+    return graph
+
+
+## Function to find the shortest join path from a set of tables to another table
+def join_path(graph, selected, target):
+    previous = {table: None for table in selected}
+    queue = deque(selected)
+    while queue:
+        table = queue.popleft()
+        if table == target:
+            path = []
+            while table not in selected:
+                path.append(table)
+                table = previous[table]
+            return path
+        for neighbour in sorted(graph[table]):
+            if neighbour not in previous:
+                previous[neighbour] = table
+                queue.append(neighbour)
+    return None
+
+
+## Function to rank the tables relevant to a question, adding the tables needed to join them
+def rank_tables(catalog, question, limit=MAX_PLANNED_TABLES):
+    scores = score_tables(catalog, question)
+    ranked = sorted(scores, key=lambda name: (-scores[name], name))
+    if not ranked:
+        return []
+    graph = join_graph(catalog)
+    selected = [ranked[0]]
+    for table in ranked[1:]:
+        if table in selected:
+            continue
+        # Bridge tables (e.g. InvoiceLine between Invoice and Track) come
+        # along with the table they connect, or neither is included
+        path = join_path(graph, set(selected), table)
+        if path is None:
+            path = [table]
+        if len(selected) + len(path) <= limit:
+            selected.extend(reversed(path))
+    return selected
+
+
+## Function to describe a table as one compact CREATE TABLE line
+def compact_ddl(info):
+    references = {
+        fk["column"]: f'{fk["references_table"]}({fk["references_column"]})'
+        for fk in info["foreign_keys"]
+    }
+    single_key = len(info["primary_key"]) == 1
+    columns = []
+    for column in info["columns"]:
+        text = f"{column['name']} {column['type']}".strip()
+        if column["primary_key"] and single_key:
+            text += " PRIMARY KEY"
+        if column["name"] in references:
+            text += f" REFERENCES {references[column['name']]}"
+        columns.append(text)
+    if not single_key and info["primary_key"]:
+        columns.append(f"PRIMARY KEY ({', '.join(info['primary_key'])})")
+    return (
+        f"CREATE TABLE {info['table_name']} ({', '.join(columns)}); "
+        f"-- {info['row_count']} rows"
+    )
+
+
+## Function to build the first message of a planned chat turn
+def build_planned_message(catalog, question, limit=MAX_PLANNED_TABLES):
+    tables = rank_tables(catalog, question, limit)
+    if not tables:
+        # Nothing matched, so let the model explore the schema itself
+        return question, tables
+    ddl = "\n".join(compact_ddl(catalog.tables[name]) for name in tables)
+    message = f"""
+            These are the tables of the SQLite database relevant to the question:
+
+            {ddl}
+
+            Use them to call sql_query straight away. Only call list_tables or
+            get_table if these tables cannot answer the question.
+
+            Question: {question}
+            """
+    return message, tables
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Show the tables and DDL a planned chat turn would send"
+    )
+    parser.add_argument("question")
+    parser.add_argument("--db", default="music_store.db")
+    parser.add_argument("--limit", type=int, default=MAX_PLANNED_TABLES)
+    args = parser.parse_args()
+
+    catalog = get_catalog(args.db)
+    scores = score_tables(catalog, args.question)
+    message, tables = build_planned_message(catalog, args.question, args.limit)
+    for name in tables:
+        print(f"{scores.get(name, 0):3d}  {name}")
+    full_schema = "\n".join(compact_ddl(info) for info in catalog.tables.values())
+    print(message)
+    print(
+        f"{len(tables)} of {len(catalog.tables)} tables, about "
+        f"{estimate_tokens(message)} tokens (the whole schema would be "
+        f"{estimate_tokens(full_schema)})"
+    )
+
+
+if __name__ == "__main__":
+    main()
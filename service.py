@@ -0,0 +1,291 @@
+import resources
+
+resources.load_environment()  ## load all the environment variables, once per process
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import engine
+import tracing
+from rate_limit import rate_limit_stats
+
+# Questions answered at the same time; matches the default DB_POOL_SIZE so
+# workers do not queue for database connections
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", 8))
+
+# Questions allowed to wait for a worker before new ones are turned away
+SERVICE_QUEUE_SIZE = int(os.getenv("SERVICE_QUEUE_SIZE", 32))
+
+# Seconds an HTTP request waits for its answer
+SERVICE_REQUEST_TIMEOUT = float(os.getenv("SERVICE_REQUEST_TIMEOUT", 120))
+
+# Largest request body accepted, in bytes
+MAX_REQUEST_BYTES = 64 * 1024
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+# A fixed set of worker threads behind a bounded queue: once every worker is
+# busy and the queue is full, submit refuses (or blocks) instead of piling up work
+class WorkerPool:
+    def __init__(self, workers=SERVICE_WORKERS, queue_size=SERVICE_QUEUE_SIZE):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="service"
+        )
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    ## Queue a call; with block=False a full queue raises QueueFull straight away
+    def submit(self, fn, *args, block=False, **kwargs):
+        if not self._slots.acquire(blocking=block):
+            with self._lock:
+                self._rejected += 1
+            raise QueueFull(
+                f"All {self.workers} workers are busy and the queue is full"
+            )
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def _release(self, future):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += future is not None
+        self._slots.release()
+
+
+class AnswerHandler(BaseHTTPRequestHandler):
+    server_version = "nl2sql"
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self.send_json(
+                200,
+                {
+                    "status": "ok",
+                    "pool": self.server.pool.stats(),
+                    "rate_limits": rate_limit_stats(),
+                },
+            )
+        elif path == "/metrics":
+            self.send_body(
+                200, tracing.prometheus_text(), "text/plain; version=0.0.4"
+            )
+        else:
+            self.send_json(404, {"error": f"No route for {path}"})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path != "/answer":
+            self.send_json(404, {"error": f"No route for {path}"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BYTES:
+            self.send_json(413, {"error": "Request body too large"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            question = request["question"].strip()
+            if not question:
+                raise ValueError("empty question")
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.send_json(400, {"error": f'Expected {{"question": "..."}}: {e}'})
+            return
+
+        try:
+            future = self.server.pool.submit(
+                engine.answer_question,
+                question,
+                interpret=bool(request.get("interpret", True)),
+                app="service",
+            )
+        except QueueFull as e:
+            # Backpressure: tell the client to come back rather than queueing
+            # more work than the workers can finish
+            self.send_json(503, {"error": str(e)}, headers={"Retry-After": "1"})
+            return
+        try:
+            answer = future.result(timeout=self.server.request_timeout)
+        except FutureTimeout:
+            self.send_json(504, {"error": "Timed out waiting for the answer"})
+            return
+        if answer.get("error_type") == "RateLimited":
+            self.send_json(429, answer, headers={"Retry-After": "5"})
+        else:
+            self.send_json(200, answer)
+
+    def send_json(self, status, body, headers=None):
+        self.send_body(
+            status, json.dumps(body, default=str), "application/json", headers
+        )
+
+    def send_body(self, status, text, content_type, headers=None):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class AnswerServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pool, request_timeout=SERVICE_REQUEST_TIMEOUT):
+        super().__init__(address, AnswerHandler)
+        self.pool = pool
+        self.request_timeout = request_timeout
+
+
+## Function to turn one JSONL line into (question, fields echoed back with the answer)
+def parse_batch_line(line):
+    record = json.loads(line)
+    if isinstance(record, str):
+        return record, {}
+    fields = {key: value for key, value in record.items() if key != "question"}
+    return record["question"], fields
+
+
+## Function to answer a JSONL stream of questions, writing each answer as it finishes
+# Reading stops while the queue is full, so memory stays bounded however long
+# the input is; answers come back in completion order, tagged with their line
+def run_batch(lines, output, pool, interpret=True):
+    write_lock = threading.Lock()
+    summary = {"questions": 0, "errors": 0}
+
+    def write(record):
+        with write_lock:
+            summary["errors"] += "error" in record
+            output.write(json.dumps(record, default=str) + "\n")
+            output.flush()
+
+    def answer(line_number, question, fields):
+        try:
+            result = engine.answer_question(question, interpret=interpret, app="batch")
+        except Exception as e:
+            result = {"question": question, "error": str(e)}
+        write({"line": line_number, **fields, **result})
+
+    start = time.perf_counter()
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        summary["questions"] += 1
+        try:
+            question, fields = parse_batch_line(line)
+        except (ValueError, KeyError, AttributeError) as e:
+            write({"line": line_number, "error": f"Invalid input line: {e}"})
+            continue
+        pool.submit(answer, line_number, question, fields, block=True)
+    pool.shutdown()
+    summary["wall_seconds"] = time.perf_counter() - start
+    return summary
+
+
+## Function to build the model client and database handles before taking work
+def warm_up():
+    start = time.perf_counter()
+    try:
+        resources.warm_up("main")
+    except Exception as e:
+        print(f"Warm-up failed: {e}", file=sys.stderr)
+    print(f"Warmed up in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Answer billionaires questions over HTTP or in JSONL batches"
+    )
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=SERVICE_QUEUE_SIZE)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve = subparsers.add_parser("serve", help="answer POST /answer requests")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    batch = subparsers.add_parser(
+        "batch", help="answer a JSONL file of questions, streaming JSONL answers"
+    )
+    batch.add_argument(
+        "input", help='JSONL of {"question": ...} objects, or - for stdin'
+    )
+    batch.add_argument("--output", default="-", help="answers file, or - for stdout")
+    batch.add_argument(
+        "--no-interpret", action="store_true", help="skip the interpretation step"
+    )
+    args = parser.parse_args()
+
+    warm_up()
+    pool = WorkerPool(args.workers, args.queue_size)
+
+    if args.command == "serve":
+        server = AnswerServer((args.host, args.port), pool)
+        print(
+            f"Serving on http://{args.host}:{args.port} with {args.workers} workers",
+            file=sys.stderr,
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            pool.shutdown()
+        return
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        summary = run_batch(source, output, pool, interpret=not args.no_interpret)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    wall = summary["wall_seconds"]
+    print(
+        f"{summary['questions']} questions in {wall:.2f}s "
+        f"({summary['questions'] / wall if wall else 0:.1f} questions/sec), "
+        f"{summary['errors']} errors",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
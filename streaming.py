@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+from collections import deque
+
+# Set STREAM_RESPONSES=0 to wait for complete responses instead of streaming tokens
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") != "0"
+
+# Number of recent timings kept for the latency summary
+METRICS_HISTORY = 200
+
+_metrics = deque(maxlen=METRICS_HISTORY)
+_metrics_lock = threading.Lock()
+
+
+class EmptyResponse(RuntimeError):
+    pass
+
+
+## Function to get the text of a streamed chunk, which is empty for function-call chunks
+def chunk_text(chunk):
+    try:
+        return chunk.text or ""
+    except (ValueError, AttributeError, IndexError):
+        return ""
+
+
+## Function to record the timing of one model call
+def record_timing(stage, ttft, total, streamed, chars=0):
+    timing = {
+        "stage": stage,
+        "ttft": ttft,
+        "total": total,
+        "streamed": streamed,
+        "chars": chars,
+    }
+    with _metrics_lock:
+        _metrics.append(timing)
+    return timing
+
+
+## Function to consume a token stream, rendering the text as it grows
+def stream_text(start_stream, render=None, on_text=None, stage="response"):
+    start = time.perf_counter()
+    first_token = None
+    text = ""
+    for chunk in start_stream():
+        piece = chunk_text(chunk)
+        if not piece:
+            continue
+        if first_token is None:
+            first_token = time.perf_counter()
+        text += piece
+        if render is not None:
+            render(text)
+        if on_text is not None:
+            on_text(text)
+    end = time.perf_counter()
+    timing = record_timing(
+        stage,
+        ttft=(first_token or end) - start,
+        total=end - start,
+        streamed=True,
+        chars=len(text),
+    )
+    return text, timing
+
+
+## Function to summarise recent time-to-first-token and total time per stage
+def timing_summary():
+    with _metrics_lock:
+        timings = list(_metrics)
+    summary = {}
+    for timing in timings:
+        stage = summary.setdefault(
+            timing["stage"], {"calls": 0, "ttft": 0.0, "total": 0.0}
+        )
+        stage["calls"] += 1
+        stage["ttft"] += timing["ttft"]
+        stage["total"] += timing["total"]
+    for stage in summary.values():
+        stage["ttft"] /= stage["calls"]
+        stage["total"] /= stage["calls"]
+    return summary
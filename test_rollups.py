@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+from billionaires_sqlite import insert_billionaires
+from example_bank import ExampleBank
+from query import queries
+from rollups import ensure_rollups, rewrite_query, verify_query
+
+# Aggregates the rollup rewrite must answer exactly like the base table,
+# including empty matches and text literals compared with numeric columns
+rewritable_queries = [
+    "SELECT COUNT(*) FROM BILLIONAIRES_DATA",
+    "SELECT COUNT(*) FROM BILLIONAIRES_DATA WHERE country = 'Nowhere'",
+    "SELECT COUNT(*) FROM BILLIONAIRES_DATA WHERE self_made = '1'",
+    "SELECT COUNT(*) FROM BILLIONAIRES_DATA WHERE self_made = 1",
+    "SELECT gender, COUNT(*) FROM BILLIONAIRES_DATA WHERE self_made = '1' GROUP BY gender",
+    "SELECT gender, COUNT(*) FROM BILLIONAIRES_DATA WHERE self_made = 'x' GROUP BY gender",
+    "SELECT COUNT(birth_year) FROM BILLIONAIRES_DATA WHERE country = 'Nowhere'",
+    "SELECT COUNT(country) FROM BILLIONAIRES_DATA WHERE gender = 'Nobody'",
+    "SELECT COUNT(country), COUNT(DISTINCT country) FROM BILLIONAIRES_DATA",
+    "SELECT SUM(birth_year), TOTAL(birth_year), AVG(birth_year) FROM BILLIONAIRES_DATA",
+    "SELECT SUM(birth_year), AVG(birth_year) FROM BILLIONAIRES_DATA WHERE country = 'Nowhere'",
+    "SELECT country, AVG(birth_year) FROM BILLIONAIRES_DATA GROUP BY country",
+    "SELECT MIN(country), MAX(industries) FROM BILLIONAIRES_DATA WHERE self_made = 0",
+    "SELECT industries, COUNT(*) AS n FROM BILLIONAIRES_DATA GROUP BY industries HAVING n > 3",
+    "SELECT b.country, COUNT(*) FROM BILLIONAIRES_DATA AS b GROUP BY b.country",
+    "SELECT category, gender, COUNT(*) FROM BILLIONAIRES_DATA "
+    "WHERE country IN ('United States', 'India') GROUP BY category, gender",
+    # Double-quoted names that are no column are string literals to SQLite
+    'SELECT COUNT(*) FROM BILLIONAIRES_DATA WHERE country = "United States"',
+    'SELECT gender, COUNT(*) FROM BILLIONAIRES_DATA WHERE "country" = "India" '
+    "GROUP BY gender",
+]
+
+# Queries whose rewrite would read the rollup's own columns or let an alias
+# stand for a different column, so they must stay on the base table
+unrewritable_queries = [
+    "SELECT *, COUNT(*) FROM BILLIONAIRES_DATA GROUP BY country",
+    "SELECT b.*, COUNT(*) FROM BILLIONAIRES_DATA AS b GROUP BY b.country",
+    "SELECT country AS birth_year, COUNT(*) FROM BILLIONAIRES_DATA GROUP BY birth_year",
+    "SELECT country AS row_count, COUNT(*) FROM BILLIONAIRES_DATA GROUP BY row_count",
+    'SELECT COUNT(*) FROM BILLIONAIRES_DATA WHERE country = "status"',
+    'SELECT COUNT(*) FROM BILLIONAIRES_DATA WHERE country = "birth_decade"',
+]
+
+# The example bank holds the SQL the model is taught to write
+example_bank = ExampleBank.load(
+    os.path.join(os.path.dirname(__file__), "examples.jsonl")
+)
+
+
+## Function to list the rewritable queries, adding the query.py and bank ones without a LIMIT
+def equivalence_cases():
+    candidates = [case["query"] for case in queries] + [
+        example["sql"] for example in example_bank.examples
+    ]
+    # A LIMIT over tied counts may legitimately keep different rows
+    bank = [
+        sql for sql in candidates if rewrite_query(sql) and "limit" not in sql.lower()
+    ]
+    return rewritable_queries + bank
+
+
+def test_bank_examples_with_quoted_literals_are_rewritten():
+    # The prompt tells the model to double-quote strings: WHERE country = "India"
+    rewritten = [
+        example["sql"]
+        for example in example_bank.examples
+        if '"' in example["sql"] and rewrite_query(example["sql"])
+    ]
+    assert rewritten
+
+
+@pytest.mark.parametrize("sql", unrewritable_queries)
+def test_unsafe_queries_are_not_rewritten(sql):
+    assert rewrite_query(sql) is None
+
+
+@pytest.mark.parametrize("sql", equivalence_cases())
+def test_rewrite_matches_base_table(billionaires, sql):
+    outcome = verify_query(billionaires, sql)
+    assert outcome is not None, "query was expected to be rewritten"
+    assert outcome["matches"], outcome["rewritten"]
+
+
+def test_rollup_follows_inserts_updates_and_deletes(billionaires):
+    billionaires.execute(
+        "UPDATE BILLIONAIRES_DATA SET country = 'India', self_made = 'true' "
+        "WHERE rank <= 5"
+    )
+    billionaires.execute("DELETE FROM BILLIONAIRES_DATA WHERE rank BETWEEN 30 AND 33")
+    billionaires.execute(
+        insert_billionaires,
+        (41, "Food", "New", "Peru", "Lima", "S", "Food", "Peru", "O", 1, "D", "F")
+        + ("CEO", 1999),
+    )
+    for sql in rewritable_queries:
+        assert verify_query(billionaires, sql)["matches"], sql
+
+
+def test_untyped_rollup_is_rebuilt(billionaires):
+    # Rollups created before their columns were typed lose the base affinity
+    billionaires.execute("DROP TABLE BILLIONAIRES_ROLLUP")
+    billionaires.execute("CREATE TABLE BILLIONAIRES_ROLLUP (country, self_made)")
+    ensure_rollups(billionaires.cursor())
+    sql = "SELECT COUNT(*) FROM BILLIONAIRES_DATA WHERE self_made = '1'"
+    assert verify_query(billionaires, sql)["matches"]
@@ -0,0 +1,87 @@
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import result_cache
+from cursor_cache import get_default_cursors
+from db_pool import get_pool
+from query_guard import guarded_query
+from schema_catalog import get_catalog
+from workload_log import log_query
+
+# Maximum number of function calls from one model turn that run at the same time
+MAX_TOOL_WORKERS = int(os.getenv("MAX_TOOL_WORKERS", 4))
+
+_executor = ThreadPoolExecutor(
+    max_workers=MAX_TOOL_WORKERS, thread_name_prefix="tool-call"
+)
+
+
+## Function to run a guarded SQL query through the shared result cache and connection pool
+# stage, when given, receives the trace attributes (cache_hit, rows, engine)
+def cached_query(db_path, sql, stage=None):
+    stage = {} if stage is None else stage
+    cache = result_cache.get_default_cache()
+    result = cache.get(db_path, sql)
+    stage["cache_hit"] = result is not None
+    if result is None:
+        # Capture the version before executing so a concurrent reload is never
+        # cached under the new marker
+        version = result_cache.database_version(db_path)
+        with get_pool(db_path).connection() as conn:
+            result = guarded_query(conn, db_path, sql)
+        cache.set(db_path, sql, result, version=version)
+        stage["engine"] = result.plan["engine"] if result.plan else None
+    else:
+        log_query(db_path, sql, result, cache_hit=True)
+    stage["rows"] = result.row_count
+    return result
+
+
+## Function to run a single function call requested by the model
+# scope keeps the cursors of one chat apart from every other chat's
+def execute_function_call(db_path, name, params, scope=None):
+    if name == "list_tables":
+        return get_catalog(db_path).list_tables()
+
+    if name == "get_table":
+        return get_catalog(db_path).get_table(params["table_name"])
+
+    if name == "sql_query":
+        try:
+            result = cached_query(db_path, params["query"])
+        except sqlite3.Error as e:
+            # Hand the error back so the model can correct its query
+            return {"error": f"Database error: {e}"}
+        # Only the first page goes back to the model; the rest stays behind
+        # a cursor for fetch_more
+        return get_default_cursors().first_page(result, params["query"], scope)
+
+    if name == "fetch_more":
+        return get_default_cursors().fetch_more(params["cursor"], scope)
+
+    return {"error": f"Unknown function {name}"}
+
+
+## Function to get one call's response, turning a failure into an error for the model
+# One bad call (e.g. a missing parameter) must not abort the rest of the turn
+def call_response(name, future):
+    try:
+        return future.result()
+    except KeyError as e:
+        return {"error": f"Missing parameter {e} for {name}"}
+    except Exception as e:
+        return {"error": f"{name} failed: {e}"}
+
+
+## Function to run every function call of one model turn concurrently
+def execute_function_calls(db_path, function_calls, scope=None):
+    futures = [
+        _executor.submit(execute_function_call, db_path, name, params, scope)
+        for name, params in function_calls
+    ]
+    # Results come back in the order the model asked for them
+    return [
+        (name, params, call_response(name, future))
+        for (name, params), future in zip(function_calls, futures)
+    ]
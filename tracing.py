@@ -0,0 +1,228 @@
+import os
+import secrets
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from jsonl_log import append_jsonl
+
+# JSONL file receiving one finished trace per question; empty disables it
+TRACE_LOG = os.getenv("TRACE_LOG", "trace_log.jsonl")
+
+# Prometheus text-format file rewritten after every trace; empty disables it
+METRICS_FILE = os.getenv("METRICS_FILE", "metrics.prom")
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Number of recent durations per stage kept for the sidebar percentiles
+STAGE_HISTORY = 200
+
+# Span attributes that are summed into counters
+COUNTED_ATTRIBUTES = ("rows", "prompt_tokens", "response_tokens")
+
+_stages = {}
+_stages_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, app, question):
+        self.trace_id = secrets.token_hex(8)
+        self.app = app
+        self.question = question
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.finished = False
+        self._lock = threading.Lock()
+
+    ## Time one stage; the yielded dict collects its rows, tokens and cache outcome
+    @contextmanager
+    def span(self, name, **attributes):
+        start = time.perf_counter()
+        try:
+            yield attributes
+        except Exception as e:
+            attributes.setdefault("error", str(e))
+            raise
+        finally:
+            end = time.perf_counter()
+            record = {
+                "name": name,
+                "start": start - self.start,
+                "seconds": end - start,
+                **attributes,
+            }
+            with self._lock:
+                self.spans.append(record)
+            record_stage(self.app, record)
+
+    ## Close the trace, append it to the trace log and refresh the metrics file
+    def finish(self, **attributes):
+        if self.finished:
+            return
+        self.finished = True
+        seconds = time.perf_counter() - self.start
+        record_stage(self.app, {"name": "total", "seconds": seconds, **attributes})
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start"])
+        entry = {
+            "trace_id": self.trace_id,
+            "app": self.app,
+            "time": self.started_at,
+            "question": self.question,
+            "seconds": seconds,
+            "spans": spans,
+            **attributes,
+        }
+        write_trace(entry)
+        write_metrics()
+        return entry
+
+
+## Function to time a stage when a trace is given, and do nothing extra otherwise
+@contextmanager
+def span(trace, name, **attributes):
+    if trace is None:
+        yield attributes
+        return
+    with trace.span(name, **attributes) as span_attributes:
+        yield span_attributes
+
+
+## Function to add one finished span to the per-stage aggregates
+def record_stage(app, span):
+    key = (app, span["name"])
+    with _stages_lock:
+        stage = _stages.get(key)
+        if stage is None:
+            stage = {
+                "count": 0,
+                "errors": 0,
+                "seconds": 0.0,
+                "buckets": [0] * len(LATENCY_BUCKETS),
+                "cache_hits": 0,
+                "cache_misses": 0,
+                "recent": deque(maxlen=STAGE_HISTORY),
+                **{name: 0 for name in COUNTED_ATTRIBUTES},
+            }
+            _stages[key] = stage
+        stage["count"] += 1
+        stage["seconds"] += span["seconds"]
+        stage["recent"].append(span["seconds"])
+        # Buckets are cumulative, as the exposition format expects
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if span["seconds"] <= bound:
+                stage["buckets"][index] += 1
+        if span.get("error"):
+            stage["errors"] += 1
+        if "cache_hit" in span:
+            stage["cache_hits" if span["cache_hit"] else "cache_misses"] += 1
+        for name in COUNTED_ATTRIBUTES:
+            stage[name] += span.get(name) or 0
+
+
+## Function to summarise each stage for the sidebar panel
+def stage_summary(app=None):
+    with _stages_lock:
+        stages = {
+            key: dict(stage, recent=sorted(stage["recent"]))
+            for key, stage in _stages.items()
+            if app is None or key[0] == app
+        }
+    summary = {}
+    for (stage_app, name), stage in sorted(stages.items()):
+        recent = stage["recent"]
+        lookups = stage["cache_hits"] + stage["cache_misses"]
+        summary[name if app else f"{stage_app}/{name}"] = {
+            "count": stage["count"],
+            "errors": stage["errors"],
+            "p50": statistics.median(recent),
+            "p95": recent[min(len(recent) - 1, int(len(recent) * 0.95))],
+            "rows": stage["rows"],
+            "prompt_tokens": stage["prompt_tokens"],
+            "response_tokens": stage["response_tokens"],
+            "cache_hit_rate": stage["cache_hits"] / lookups if lookups else None,
+        }
+    return summary
+
+
+## Function to describe one stage of the summary in a line for the sidebar
+def format_stage(name, stats):
+    text = (
+        f"{name}: {stats['count']} calls, p50 {stats['p50'] * 1000:.0f} ms, "
+        f"p95 {stats['p95'] * 1000:.0f} ms"
+    )
+    if stats["rows"]:
+        text += f", {stats['rows']:,} rows"
+    if stats["prompt_tokens"] or stats["response_tokens"]:
+        text += (
+            f", ~{stats['prompt_tokens']:,} prompt / "
+            f"{stats['response_tokens']:,} response tokens"
+        )
+    if stats["cache_hit_rate"] is not None:
+        text += f", {stats['cache_hit_rate']:.0%} cache hits"
+    if stats["errors"]:
+        text += f", {stats['errors']} errors"
+    return text
+
+
+## Function to render the aggregates in the Prometheus text exposition format
+def prometheus_text():
+    with _stages_lock:
+        stages = {
+            key: dict(stage, buckets=list(stage["buckets"]))
+            for key, stage in _stages.items()
+        }
+    lines = [
+        "# HELP nl2sql_stage_seconds Duration of each pipeline stage",
+        "# TYPE nl2sql_stage_seconds histogram",
+    ]
+    for (app, name), stage in sorted(stages.items()):
+        labels = f'app="{app}",stage="{name}"'
+        buckets = list(zip(LATENCY_BUCKETS, stage["buckets"]))
+        buckets.append(("+Inf", stage["count"]))
+        for bound, count in buckets:
+            lines.append(
+                f'nl2sql_stage_seconds_bucket{{{labels},le="{bound}"}} {count}'
+            )
+        lines.append(f"nl2sql_stage_seconds_sum{{{labels}}} {stage['seconds']}")
+        lines.append(f"nl2sql_stage_seconds_count{{{labels}}} {stage['count']}")
+    counters = [
+        ("errors", "Stages that ended with an error"),
+        ("rows", "Rows returned by the stage"),
+        ("prompt_tokens", "Estimated prompt tokens sent to the model"),
+        ("response_tokens", "Estimated response tokens received from the model"),
+        ("cache_hits", "Stage results served from a cache"),
+        ("cache_misses", "Stage results computed after a cache miss"),
+    ]
+    for counter, help_text in counters:
+        lines.append(f"# HELP nl2sql_{counter}_total {help_text}")
+        lines.append(f"# TYPE nl2sql_{counter}_total counter")
+        for (app, name), stage in sorted(stages.items()):
+            lines.append(
+                f'nl2sql_{counter}_total{{app="{app}",stage="{name}"}} {stage[counter]}'
+            )
+    return "\n".join(lines) + "\n"
+
+
+## Function to rewrite the metrics file, atomically so a scraper never reads half of it
+def write_metrics(path=None):
+    path = METRICS_FILE if path is None else path
+    if not path:
+        return
+    text = prometheus_text()
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "w") as file:
+        file.write(text)
+    os.replace(temporary, path)
+
+
+## Function to append a finished trace to the trace log
+def write_trace(entry, path=None):
+    path = TRACE_LOG if path is None else path
+    if not path:
+        return
+    append_jsonl(path, entry)
@@ -0,0 +1,50 @@
+import json
+import os
+import time
+
+from jsonl_log import append_jsonl
+
+# JSONL file receiving every executed generated query; empty disables logging
+QUERY_LOG = os.getenv("QUERY_LOG", "query_log.jsonl")
+
+
+## Function to append one executed query with its plan and timing to the log
+# Answers from the result cache are logged too, flagged, so the advisor sees how
+# often each query is asked
+def log_query(db_path, sql, result, path=None, cache_hit=False):
+    path = QUERY_LOG if path is None else path
+    if not path:
+        return
+    plan = result.plan or {}
+    entry = {
+        "time": time.time(),
+        "db": os.path.abspath(db_path),
+        # The SQL that ran (e.g. the rollup rewrite), which is what indexes serve
+        "sql": plan.get("sql", sql),
+        "requested_sql": sql,
+        "engine": plan.get("engine", "sqlite"),
+        "cache_hit": cache_hit,
+        "elapsed": result.elapsed,
+        "rows": result.row_count,
+        "truncated": result.truncated,
+        "plan": plan.get("steps", []),
+        "estimated_rows": plan.get("estimated_rows"),
+    }
+    append_jsonl(path, entry)
+
+
+## Function to read the logged queries, optionally only those run against one database
+def read_log(path=None, db_path=None):
+    path = QUERY_LOG if path is None else path
+    if not path or not os.path.exists(path):
+        return []
+    target = os.path.abspath(db_path) if db_path else None
+    entries = []
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if target is None or entry["db"] == target:
+                entries.append(entry)
+    return entries